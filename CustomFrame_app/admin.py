@@ -1,3 +1,277 @@
+import json
+
+from django import forms
 from django.contrib import admin
+from django.contrib.auth.admin import UserAdmin
+from django.core.paginator import Paginator
+from django.db import connections, transaction
+from django.utils.functional import cached_property
+
+from CustomFrame_app.models import Login, LoginThrottle, Frame, FrameTombstone, ColorVariant, SizeVariant, \
+    FinishingVariant, FrameHangVariant, Cart, CartItem, Order, OrderItem, DailySalesRollup, PopularityCounter
+
+# Below this many (estimated) rows an exact COUNT(*) is cheap enough to run
+ADMIN_EXACT_COUNT_THRESHOLD = 10000
+
+
+def estimate_count(queryset):
+    # Planner estimate: pg_class.reltuples for the whole table, EXPLAIN's row estimate once filtered.
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        if not queryset.query.where:
+            cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+                           [queryset.model._meta.db_table])
+            row = cursor.fetchone()
+            # reltuples is -1 until the table has been vacuumed or analyzed
+            return row[0] if row and row[0] >= 0 else None
+        sql, params = queryset.query.sql_with_params()
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows'])
+
+
+class EstimatedCountPaginator(Paginator):
+    @cached_property
+    def count(self):
+        estimate = estimate_count(self.object_list)
+        if estimate is None or estimate < ADMIN_EXACT_COUNT_THRESHOLD:
+            return super().count
+        return estimate
+
+
+class ScalableAdminMixin:
+    paginator = EstimatedCountPaginator
+    # Skips the second, unfiltered COUNT(*) the changelist runs for "x of y selected"
+    show_full_result_count = False
+    list_per_page = 50
+
+
+class VariantInline(admin.TabularInline):
+    extra = 0
+    show_change_link = True
+
+    def get_queryset(self, request):
+        # Each row's __str__ reads frame.name
+        return super().get_queryset(request).select_related('frame')
+
+
+class ColorVariantInline(VariantInline):
+    model = ColorVariant
+
+
+class SizeVariantInline(VariantInline):
+    model = SizeVariant
+
+
+class FinishingVariantInline(VariantInline):
+    model = FinishingVariant
+
+
+class FrameHangVariantInline(VariantInline):
+    model = FrameHangVariant
+
+
+@admin.register(Login)
+class LoginAdmin(ScalableAdminMixin, UserAdmin):
+    list_display = ('username', 'email', 'name', 'is_user', 'is_employee', 'is_staff', 'is_blocked')
+    list_filter = ('is_user', 'is_employee', 'is_staff', 'is_blocked', 'is_active')
+    search_fields = ('username', 'email', 'name', 'company_name')
+    readonly_fields = ('token_version',)
+    fieldsets = UserAdmin.fieldsets + (
+        ('Profile', {'fields': ('name', 'company_name', 'company_address', 'role', 'phone', 'address')}),
+        ('Access', {'fields': ('is_user', 'is_employee', 'is_blocked', 'token_version')}),
+    )
+
+
+@admin.register(LoginThrottle)
+class LoginThrottleAdmin(ScalableAdminMixin, admin.ModelAdmin):
+    list_display = ('key', 'tokens', 'rejected_count', 'updated_at')
+    search_fields = ('key',)
+    ordering = ('-rejected_count',)
+
+
+@admin.register(Frame)
+class FrameAdmin(ScalableAdminMixin, admin.ModelAdmin):
+    list_display = ('name', 'price', 'inner_width', 'inner_height', 'created_by', 'popularity_rank', 'updated_at')
+    list_select_related = ('created_by',)
+    search_fields = ('name',)
+    autocomplete_fields = ('created_by',)
+    readonly_fields = ('created_at', 'updated_at', 'popularity_rank')
+    inlines = (ColorVariantInline, SizeVariantInline, FinishingVariantInline, FrameHangVariantInline)
+
+
+@admin.register(FrameTombstone)
+class FrameTombstoneAdmin(ScalableAdminMixin, admin.ModelAdmin):
+    list_display = ('frame_id', 'deleted_at')
+    ordering = ('-deleted_at',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+class VariantAdmin(ScalableAdminMixin, admin.ModelAdmin):
+    list_select_related = ('frame',)
+    autocomplete_fields = ('frame',)
+
+
+@admin.register(ColorVariant)
+class ColorVariantAdmin(VariantAdmin):
+    list_display = ('color_name', 'frame', 'price')
+    search_fields = ('color_name', 'frame__name')
+
+
+@admin.register(SizeVariant)
+class SizeVariantAdmin(VariantAdmin):
+    list_display = ('size_name', 'frame', 'inner_width', 'inner_height', 'price')
+    search_fields = ('size_name', 'frame__name')
+
+
+@admin.register(FinishingVariant)
+class FinishingVariantAdmin(VariantAdmin):
+    list_display = ('finish_name', 'frame', 'price')
+    search_fields = ('finish_name', 'frame__name')
+
+
+@admin.register(FrameHangVariant)
+class FrameHangVariantAdmin(VariantAdmin):
+    list_display = ('hanging_name', 'frame', 'price')
+    search_fields = ('hanging_name', 'frame__name')
+
+
+class LineItemInline(admin.TabularInline):
+    # Read-only summary rows; the variants' __str__ reads their frame, so those are joined too
+    extra = 0
+    can_delete = False
+    show_change_link = True
+    fields = ('frame', 'color_variant', 'size_variant', 'finish_variant', 'hanging_variant', 'quantity',
+              'total_price')
+    readonly_fields = fields
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related(
+            'frame', 'color_variant__frame', 'size_variant__frame', 'finish_variant__frame',
+            'hanging_variant__frame',
+        )
+
+
+class CartItemInline(LineItemInline):
+    model = CartItem
+
+    def get_queryset(self, request):
+        # CartItem.__str__ labels each row with cart.user.username
+        return super().get_queryset(request).select_related('cart__user')
+
+
+@admin.register(Cart)
+class CartAdmin(ScalableAdminMixin, admin.ModelAdmin):
+    list_display = ('id', 'user', 'created_at', 'updated_at')
+    list_select_related = ('user',)
+    search_fields = ('user__username',)
+    autocomplete_fields = ('user',)
+    inlines = (CartItemInline,)
+
+
+@admin.register(CartItem)
+class CartItemAdmin(ScalableAdminMixin, admin.ModelAdmin):
+    list_display = ('id', 'cart', 'frame', 'quantity', 'total_price')
+    list_select_related = ('cart__user', 'frame')
+    search_fields = ('cart__user__username', 'frame__name')
+    raw_id_fields = ('cart', 'frame', 'color_variant', 'size_variant', 'finish_variant', 'hanging_variant')
+    readonly_fields = ('total_price',)
+
+
+class OrderItemInline(LineItemInline):
+    model = OrderItem
+    fields = LineItemInline.fields + ('image', 'snapshot')
+    readonly_fields = fields
+
+
+class OrderAdminForm(forms.ModelForm):
+    class Meta:
+        model = Order
+        fields = ('status',)
+
+    def clean_status(self):
+        new_status = self.cleaned_data['status']
+        if new_status != self.instance.status and not self.instance.can_transition_to(new_status):
+            raise forms.ValidationError(f"Cannot move order from {self.instance.status} to {new_status}")
+        return new_status
+
+
+@admin.register(Order)
+class OrderAdmin(ScalableAdminMixin, admin.ModelAdmin):
+    # Orders come from checkout; staff only move them through STATUS_TRANSITIONS here.
+    form = OrderAdminForm
+    list_display = ('id', 'user', 'status', 'total_amount', 'created_at')
+    list_filter = ('status',)
+    list_select_related = ('user',)
+    search_fields = ('=id', 'user__username')
+    readonly_fields = ('user', 'total_amount', 'created_at', 'idempotency_key')
+    inlines = (OrderItemInline,)
+
+    def has_add_permission(self, request):
+        return False
+
+    def save_model(self, request, obj, form, change):
+        with transaction.atomic():
+            previous_status = Order.objects.select_for_update().values_list('status', flat=True).get(pk=obj.pk)
+            super().save_model(request, obj, form, change)
+            # Cancelled orders are excluded from the sales rollups, as in AdminOrderDetailView
+            if obj.status == 'cancelled' and previous_status != 'cancelled':
+                DailySalesRollup.apply_items(obj.items.all(), sign=-1)
+
+
+@admin.register(OrderItem)
+class OrderItemAdmin(ScalableAdminMixin, admin.ModelAdmin):
+    # Part of the order record; the snapshot, not the (possibly deleted) catalog rows, is authoritative.
+    list_display = ('id', 'order', 'frame', 'quantity', 'total_price')
+    list_select_related = ('order__user', 'frame')
+    search_fields = ('=order__id', 'order__user__username', 'frame__name')
+    raw_id_fields = ('order', 'frame', 'color_variant', 'size_variant', 'finish_variant', 'hanging_variant')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(DailySalesRollup)
+class DailySalesRollupAdmin(ScalableAdminMixin, admin.ModelAdmin):
+    # Maintained by checkout and rebuild_sales_rollups; read-only here.
+    list_display = ('day', 'frame', 'variant_key', 'line_count', 'quantity', 'revenue')
+    list_filter = ('day',)
+    list_select_related = ('frame',)
+    search_fields = ('frame__name',)
+    ordering = ('-day', 'frame_id')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(PopularityCounter)
+class PopularityCounterAdmin(ScalableAdminMixin, admin.ModelAdmin):
+    # Written in batches by popularity.py; read-only here.
+    list_display = ('kind', 'object_id', 'cart_adds', 'units_ordered', 'score', 'updated_at')
+    list_filter = ('kind',)
+    search_fields = ('=object_id',)
+    ordering = ('kind', '-score')
+
+    def has_add_permission(self, request):
+        return False
 
-# Register your models here.
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -4,3 +4,14 @@ from django.apps import AppConfig
 class CustomframeAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'CustomFrame_app'
+
+    def ready(self):
+        from django.core.signals import request_started
+        from django.db.backends.signals import connection_created
+        from CustomFrame_app import signals  # noqa: F401
+        from CustomFrame_app.metrics import install_query_counter, install_serializer_timing
+        from CustomFrame_app.typeahead import index as typeahead_index
+        install_serializer_timing()
+        connection_created.connect(install_query_counter)
+        # Builds the autocomplete index in the background as each worker starts serving
+        request_started.connect(typeahead_index.warm, dispatch_uid='typeahead_warm')
@@ -0,0 +1,155 @@
+"""Async counterparts of the read-heavy catalog/cart endpoints and the upload endpoints.
+
+Under ASGI these never hold a worker thread while waiting on the database or a
+slow client: ORM reads use the async API, and blocking work (multipart parsing,
+file writes, serializer validation) is handed to a thread only for as long as
+it runs.
+"""
+import os
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import Max
+from django.core.files.storage import FileSystemStorage
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+from rest_framework.exceptions import AuthenticationFailed
+
+from CustomFrame_app.authentication import ClaimsJWTAuthentication
+from CustomFrame_app.models import Cart, CartItem, Frame, FrameTombstone, PopularityCounter
+from CustomFrame_app.popularity import record_cart_adds
+from CustomFrame_app.serializer import FrameSerializer, CartItemSerializer, CartSummarySerializer, \
+    CartItemCreateSerializer
+from CustomFrame_app.views import frame_queryset, cart_items_queryset, conditional_response, set_validators, \
+    cart_validators, cart_summary_data, CART_SUMMARY_AGGREGATES, frame_validators, frame_list_validators, \
+    FRAME_LIST_AGGREGATES, FRAME_LIST_ORDERINGS, ordered_frames
+
+
+async def authenticate_request(request, session=True):
+    # JWT first (as the DRF views do), then the Django session created by user_login.
+    # CSRF-exempt views pass session=False: a cookie alone must not authorize a cross-site POST.
+    try:
+        result = await sync_to_async(ClaimsJWTAuthentication().authenticate)(request)
+    except AuthenticationFailed:
+        return None
+    if result is not None:
+        return result[0]
+    if not session:
+        return None
+    user = await request.auser()
+    return user if user.is_authenticated else None
+
+
+def unauthorized():
+    return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+
+
+async def read_files(request):
+    # Multipart parsing spools to disk for large bodies, so it runs off the event loop
+    return await sync_to_async(lambda: request.FILES, thread_sensitive=False)()
+
+
+@require_GET
+async def frame_list(request):
+    ordering = request.GET.get('ordering')
+    if ordering is not None and ordering not in FRAME_LIST_ORDERINGS:
+        return JsonResponse({"error": f"ordering must be one of: {', '.join(FRAME_LIST_ORDERINGS)}"}, status=400)
+    ranked_at = None
+    if ordering == 'popular':
+        ranked = await PopularityCounter.objects.filter(kind='frame').aaggregate(ranked_at=Max('updated_at'))
+        ranked_at = ranked['ranked_at']
+    state = await Frame.objects.aaggregate(**FRAME_LIST_AGGREGATES)
+    deleted = await FrameTombstone.objects.aaggregate(deleted_at=Max('deleted_at'))
+    etag, last_modified = frame_list_validators(state, deleted['deleted_at'], ranked_at)
+    not_modified = conditional_response(request, etag, last_modified)
+    if not_modified is not None:
+        return not_modified
+    frames = [frame async for frame in ordered_frames(frame_queryset(), ordering)]
+    serializer = FrameSerializer(frames, many=True, context={'request': request})
+    return set_validators(JsonResponse(serializer.data, safe=False), etag, last_modified)
+
+
+@require_GET
+async def frame_detail(request, frame_id):
+    if await authenticate_request(request) is None:
+        return unauthorized()
+    try:
+        updated_at = await Frame.objects.values_list('updated_at', flat=True).aget(id=frame_id)
+    except Frame.DoesNotExist:
+        return JsonResponse({"error": "Frame not found"}, status=404)
+    etag, last_modified = frame_validators(frame_id, updated_at)
+    not_modified = conditional_response(request, etag, last_modified)
+    if not_modified is not None:
+        return not_modified
+    try:
+        frame = await frame_queryset().aget(id=frame_id)
+    except Frame.DoesNotExist:
+        return JsonResponse({"error": "Frame not found"}, status=404)
+    response = JsonResponse(FrameSerializer(frame, context={'request': request}).data)
+    return set_validators(response, etag, last_modified)
+
+
+@require_GET
+async def cart_detail(request):
+    user = await authenticate_request(request)
+    if user is None:
+        return unauthorized()
+    cart, created = await Cart.objects.aget_or_create(user=user)
+    items = [item async for item in cart_items_queryset().filter(cart=cart)]
+    serializer = CartItemSerializer(items, many=True, context={'request': request})
+    return JsonResponse(serializer.data, safe=False)
+
+
+@require_GET
+async def cart_summary(request):
+    user = await authenticate_request(request)
+    if user is None:
+        return unauthorized()
+    cart, created = await Cart.objects.aget_or_create(user=user)
+    etag, last_modified = cart_validators(cart)
+    not_modified = conditional_response(request, etag, last_modified)
+    if not_modified is not None:
+        return not_modified
+    summary = await CartItem.objects.filter(cart=cart).aaggregate(**CART_SUMMARY_AGGREGATES)
+    serializer = CartSummarySerializer(cart_summary_data(summary))
+    return set_validators(JsonResponse(serializer.data), etag, last_modified)
+
+
+@csrf_exempt
+@require_POST
+async def upload_image(request):
+    if await authenticate_request(request, session=False) is None:
+        return JsonResponse({'error': 'Authentication required'}, status=401)
+    files = await read_files(request)
+    original_image = files.get('original_image')
+    if not original_image:
+        return JsonResponse({'error': 'No image provided'}, status=400)
+    fs = FileSystemStorage(location=os.path.join(settings.MEDIA_ROOT, 'cart/original'))
+    filename = await sync_to_async(fs.save, thread_sensitive=False)(original_image.name, original_image)
+    original_url = request.build_absolute_uri(f"{settings.MEDIA_URL}cart/original/{filename}")
+    return JsonResponse({'original_url': original_url})
+
+
+def _create_cart_item(request, user, data):
+    cart, created = Cart.objects.get_or_create(user=user)
+    serializer = CartItemCreateSerializer(data=data)
+    if not serializer.is_valid():
+        return serializer.errors, 400
+    cart_item = serializer.save(cart=cart)
+    record_cart_adds([cart_item])
+    cart_item = cart_items_queryset().get(pk=cart_item.pk)
+    return CartItemSerializer(cart_item, context={'request': request}).data, 201
+
+
+@csrf_exempt
+@require_POST
+async def add_to_cart(request):
+    user = await authenticate_request(request, session=False)
+    if user is None:
+        return unauthorized()
+    files = await read_files(request)
+    data = request.POST.copy()
+    data.update(files)
+    payload, status = await sync_to_async(_create_cart_item)(request, user, data)
+    return JsonResponse(payload, status=status)
@@ -0,0 +1,46 @@
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from CustomFrame_app.models import Login
+
+
+def add_token_claims(token, user):
+    for name in Login.TOKEN_CLAIM_FIELDS:
+        token[name] = getattr(user, name)
+    token['token_version'] = user.token_version
+    return token
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """JWT authentication that builds ``request.user`` from the signed claims.
+
+    No ``Login`` row is loaded per request; the only lookup is the cached token
+    version, which is bumped whenever a user is blocked, changes role or changes
+    password. Fields that are not carried in the token (name, email, ...) are
+    deferred and loaded on first access.
+    """
+
+    def get_user(self, validated_token):
+        if 'token_version' not in validated_token:
+            # Tokens issued before claims were added go through the regular lookup
+            return super().get_user(validated_token)
+        try:
+            # Recent simplejwt versions store the id claim as a string
+            user_id = Login._meta.pk.to_python(validated_token[api_settings.USER_ID_CLAIM])
+        except KeyError as e:
+            raise InvalidToken(_("Token contained no recognizable user identification")) from e
+
+        if not validated_token.get('is_active', True):
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        if validated_token.get('is_blocked'):
+            raise AuthenticationFailed(_("User is blocked"), code="user_blocked")
+        if Login.cached_token_version(user_id) != validated_token['token_version']:
+            raise AuthenticationFailed(_("Token has been revoked"), code="token_revoked")
+
+        claims = {'id': user_id, 'token_version': validated_token['token_version']}
+        claims.update((name, validated_token.get(name)) for name in Login.TOKEN_CLAIM_FIELDS)
+        # from_db() pairs a partial row with the model's concrete fields in declaration order
+        field_names = [field.attname for field in Login._meta.concrete_fields if field.attname in claims]
+        return Login.from_db('default', field_names, [claims[name] for name in field_names])
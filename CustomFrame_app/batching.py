@@ -0,0 +1,34 @@
+"""Per-batch cache shared by the sub-requests of one BatchView call.
+
+Views wrap repeated lookups in ``request_cached``; outside a batch the loader
+simply runs, so single requests behave exactly as before.
+"""
+import contextvars
+from contextlib import contextmanager
+
+_cache = contextvars.ContextVar('batch_cache', default=None)
+
+
+@contextmanager
+def batch_scope():
+    token = _cache.set({})
+    try:
+        yield
+    finally:
+        _cache.reset(token)
+
+
+def request_cached(key, loader):
+    cache = _cache.get()
+    if cache is None:
+        return loader()
+    if key not in cache:
+        cache[key] = loader()
+    return cache[key]
+
+
+def prime_request_cache(entries):
+    cache = _cache.get()
+    if cache is not None:
+        for key, value in entries:
+            cache.setdefault(key, value)
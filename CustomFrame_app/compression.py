@@ -0,0 +1,78 @@
+"""Negotiated gzip/brotli compression for JSON responses.
+
+Responses smaller than ``RESPONSE_COMPRESSION_MIN_BYTES`` are left alone: below
+that the framing overhead and CPU cost outweigh the bytes saved. Brotli is only
+offered when the ``brotli`` package is installed.
+"""
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.regex_helper import _lazy_re_compile
+from django.utils.text import compress_string
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Dynamic responses: mid-range quality keeps compression well under a millisecond for catalog-sized payloads
+BROTLI_QUALITY = 5
+
+_coding_re = _lazy_re_compile(r'^\s*([\w*-]+)\s*(?:;\s*q\s*=\s*([0-9.]+))?\s*$')
+
+
+def supported_encodings():
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def negotiate_encoding(accept_encoding):
+    # Highest q-value wins; ties go to the order of supported_encodings()
+    weights = {}
+    for part in accept_encoding.split(','):
+        match = _coding_re.match(part)
+        if match is None:
+            continue
+        try:
+            weights[match.group(1).lower()] = float(match.group(2)) if match.group(2) else 1.0
+        except ValueError:
+            continue
+    best, best_weight = None, 0.0
+    for coding in supported_encodings():
+        weight = weights.get(coding, weights.get('*', 0.0))
+        if weight > best_weight:
+            best, best_weight = coding, weight
+    return best
+
+
+def compress(content, coding):
+    if coding == 'br':
+        return brotli.compress(content, quality=BROTLI_QUALITY)
+    # Random-length padding, as GZipMiddleware does, to blunt BREACH-style length probing
+    return compress_string(content, max_random_bytes=100)
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    def process_response(self, request, response):
+        if response.streaming or response.has_header('Content-Encoding'):
+            return response
+        if not response.get('Content-Type', '').startswith('application/json'):
+            return response
+        if len(response.content) < settings.RESPONSE_COMPRESSION_MIN_BYTES:
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        coding = negotiate_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if coding is None:
+            return response
+        compressed = compress(response.content, coding)
+        if len(compressed) >= len(response.content):
+            return response
+
+        response.content = compressed
+        response['Content-Length'] = str(len(compressed))
+        response['Content-Encoding'] = coding
+        # The body is no longer byte-identical to the uncompressed one, so the validator becomes weak
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        return response
@@ -0,0 +1,192 @@
+"""Per-process concurrency limits and load shedding for heavy (upload) endpoints.
+
+``REQUEST_CONCURRENCY_LIMITS`` groups URL names into pools. At most ``limit``
+requests of a pool run at once in a worker; the next ``queue`` wait in line for
+up to ``timeout`` seconds, and anything beyond that is answered straight away
+with 503 and ``Retry-After``. Cheap catalog reads never enter a pool, so an
+upload spike can only ever occupy ``limit`` threads per pool.
+
+Slots are handed to waiters in arrival order. Sync and async requests share a
+pool: threads wait on an Event, coroutines on a future resolved from whichever
+thread releases the slot.
+"""
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from functools import lru_cache
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import JsonResponse
+from django.urls import Resolver404, resolve
+
+from CustomFrame_app.metrics import registry
+
+# Pools built from settings by the middleware, by name; read by metric_lines()
+limiters = {}
+
+
+class AsyncWaiter:
+    # Same interface as threading.Event, for a coroutine waiting on the event loop
+    def __init__(self):
+        self.loop = asyncio.get_running_loop()
+        self.future = self.loop.create_future()
+        self.granted = False
+
+    def set(self):
+        self.granted = True
+        self.loop.call_soon_threadsafe(self.wake)
+
+    def wake(self):
+        if not self.future.done():
+            self.future.set_result(None)
+
+    def is_set(self):
+        return self.granted
+
+
+class ConcurrencyLimiter:
+    def __init__(self, name, limit, queue=0, timeout=0.0, retry_after=None):
+        self.name = name
+        self.limit = limit
+        self.queue = queue
+        self.timeout = timeout
+        self.retry_after = retry_after or settings.REQUEST_CONCURRENCY_RETRY_AFTER
+        self.lock = threading.Lock()
+        self.active = 0
+        self.waiters = deque()
+
+    def try_acquire(self, waiter_factory):
+        """Take a free slot (returns True), join the queue (returns a waiter) or give up (False)."""
+        with self.lock:
+            if self.active < self.limit and not self.waiters:
+                self.active += 1
+                return True
+            if len(self.waiters) >= self.queue:
+                return False
+            waiter = waiter_factory()
+            self.waiters.append(waiter)
+            return waiter
+
+    def settle(self, waiter):
+        # After a wait: either the slot was handed over, or the waiter leaves the queue
+        with self.lock:
+            if waiter.is_set():
+                return True
+            self.waiters.remove(waiter)
+            return False
+
+    def acquire(self):
+        waiter = self.try_acquire(threading.Event)
+        if isinstance(waiter, bool):
+            return waiter
+        waiter.wait(self.timeout)
+        return self.settle(waiter)
+
+    async def aacquire(self):
+        waiter = self.try_acquire(AsyncWaiter)
+        if isinstance(waiter, bool):
+            return waiter
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), self.timeout)
+        except asyncio.TimeoutError:
+            pass
+        except asyncio.CancelledError:
+            # The client went away while queued; don't leak a slot handed over in the meantime
+            if self.settle(waiter):
+                self.release()
+            raise
+        return self.settle(waiter)
+
+    def release(self):
+        with self.lock:
+            if self.waiters:
+                # The slot passes straight to the oldest waiter, so active stays the same
+                self.waiters.popleft().set()
+            else:
+                self.active -= 1
+
+
+def build_limiters(config):
+    pools, routes = {}, {}
+    for name, options in config.items():
+        options = dict(options)
+        pool_routes = options.pop('routes')
+        pools[name] = ConcurrencyLimiter(name, **options)
+        for route in pool_routes:
+            routes[route] = pools[name]
+    return pools, routes
+
+
+@lru_cache(maxsize=1024)
+def route_name(path):
+    try:
+        return resolve(path).url_name
+    except Resolver404:
+        return None
+
+
+def metric_lines():
+    pid = os.getpid()
+    lines = []
+    for name, help_text, attribute in (
+        ('http_concurrency_active', 'Requests holding a slot in a concurrency pool', 'active'),
+        ('http_concurrency_queued', 'Requests waiting for a slot in a concurrency pool', 'waiters'),
+        ('http_concurrency_limit', 'Configured slots per concurrency pool', 'limit'),
+    ):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} gauge")
+        for pool, limiter in sorted(limiters.items()):
+            value = getattr(limiter, attribute)
+            lines.append(f'{name}{{pool="{pool}",worker="{pid}"}} {len(value) if attribute == "waiters" else value}')
+    return lines
+
+
+class ConcurrencyLimitMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        pools, self.routes = build_limiters(settings.REQUEST_CONCURRENCY_LIMITS)
+        limiters.clear()
+        limiters.update(pools)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        limiter = self.routes.get(route_name(request.path_info))
+        if limiter is None:
+            return self.get_response(request)
+        started = time.perf_counter()
+        admitted = limiter.acquire()
+        registry.record_queue_wait(limiter.name, admitted, time.perf_counter() - started)
+        if not admitted:
+            return self.shed(limiter)
+        try:
+            return self.get_response(request)
+        finally:
+            limiter.release()
+
+    async def __acall__(self, request):
+        limiter = self.routes.get(route_name(request.path_info))
+        if limiter is None:
+            return await self.get_response(request)
+        started = time.perf_counter()
+        admitted = await limiter.aacquire()
+        registry.record_queue_wait(limiter.name, admitted, time.perf_counter() - started)
+        if not admitted:
+            return self.shed(limiter)
+        try:
+            return await self.get_response(request)
+        finally:
+            limiter.release()
+
+    def shed(self, limiter):
+        response = JsonResponse({"error": "Server is busy, please retry shortly"}, status=503)
+        response['Retry-After'] = str(limiter.retry_after)
+        return response
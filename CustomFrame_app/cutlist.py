@@ -0,0 +1,123 @@
+"""Moulding cut-list planning for batched production of framed order lines.
+
+Every frame is built from four mitred pieces cut out of fixed-length stock bars,
+which makes batching a one-dimensional cutting-stock (bin packing) problem.
+Lengths are in the same unit as ``Frame.inner_width``.
+"""
+from bisect import bisect_left, insort
+from math import ceil, isfinite
+
+# Exhaustive search is only attempted for small groups, and gives up after this many nodes
+EXACT_MAX_PIECES = 24
+EXACT_NODE_LIMIT = 100000
+EPSILON = 1e-6
+
+
+def frame_pieces(inner_width, inner_height, moulding_width):
+    # A mitred piece is measured along its outer edge: the opening plus the moulding on both ends
+    outer_width = inner_width + 2 * moulding_width
+    outer_height = inner_height + 2 * moulding_width
+    return [outer_width, outer_width, outer_height, outer_height]
+
+
+def best_fit_decreasing(pieces, stock_length, kerf=0.0):
+    """Pack (length, label) pieces into bars, longest first, each into the fullest bar it fits.
+
+    Runs in O(n log n) comparisons, which handles thousands of pieces well within a second.
+    """
+    capacity = stock_length + kerf
+    bars = []
+    free_space = []  # sorted (remaining length, bar index)
+    for piece in sorted(pieces, key=lambda p: p[0], reverse=True):
+        size = piece[0] + kerf
+        position = bisect_left(free_space, (size - EPSILON, -1))
+        if position < len(free_space):
+            space, index = free_space.pop(position)
+            bars[index].append(piece)
+            insort(free_space, (space - size, index))
+        else:
+            bars.append([piece])
+            insort(free_space, (capacity - size, len(bars) - 1))
+    return bars
+
+
+def exact_packing(pieces, stock_length, kerf=0.0):
+    """Branch and bound over bar assignments; returns (bars, proven_optimal)."""
+    capacity = stock_length + kerf
+    ordered = sorted(pieces, key=lambda p: p[0], reverse=True)
+    best = best_fit_decreasing(ordered, stock_length, kerf)
+    lower_bound = ceil(sum(p[0] + kerf for p in ordered) / capacity - EPSILON)
+    if len(best) <= lower_bound:
+        return best, True
+
+    bar_space = []
+    bar_pieces = []
+    nodes = 0
+
+    def search(index):
+        nonlocal best, nodes
+        nodes += 1
+        if nodes > EXACT_NODE_LIMIT or len(bar_space) >= len(best):
+            return
+        if index == len(ordered):
+            best = [list(bar) for bar in bar_pieces]
+            return
+        piece = ordered[index]
+        size = piece[0] + kerf
+        tried = set()
+        for bar in range(len(bar_space)):
+            space = round(bar_space[bar], 6)
+            # Bars with the same free space are interchangeable, so only branch on one of them
+            if space + EPSILON < size or space in tried:
+                continue
+            tried.add(space)
+            bar_space[bar] -= size
+            bar_pieces[bar].append(piece)
+            search(index + 1)
+            bar_pieces[bar].pop()
+            bar_space[bar] += size
+            if len(best) <= lower_bound:
+                return
+        if len(bar_space) + 1 < len(best):
+            bar_space.append(capacity - size)
+            bar_pieces.append([piece])
+            search(index + 1)
+            bar_pieces.pop()
+            bar_space.pop()
+
+    search(0)
+    return best, nodes <= EXACT_NODE_LIMIT
+
+
+def plan_group(pieces, stock_length, kerf=0.0, exact=False):
+    """Cut plan for one frame/finish group of (length, label) pieces."""
+    # NaN compares false against everything, so it would slip past the range checks below
+    if not (isfinite(stock_length) and isfinite(kerf)) or stock_length <= 0 or kerf < 0:
+        raise ValueError("stock_length must be a positive number and kerf a non-negative one")
+    if not all(isfinite(piece[0]) for piece in pieces):
+        raise ValueError("piece lengths must be finite")
+    oversized = [piece for piece in pieces if piece[0] > stock_length + EPSILON]
+    pieces = [piece for piece in pieces if piece[0] <= stock_length + EPSILON]
+    if exact and len(pieces) <= EXACT_MAX_PIECES:
+        bars, optimal = exact_packing(pieces, stock_length, kerf)
+    else:
+        bars = best_fit_decreasing(pieces, stock_length, kerf)
+        optimal = len(bars) <= ceil(sum(p[0] + kerf for p in pieces) / (stock_length + kerf) - EPSILON)
+
+    stock_used = len(bars) * stock_length
+    cut_length = sum(piece[0] for piece in pieces)
+    return {
+        'bars_used': len(bars),
+        'pieces': len(pieces),
+        'stock_length_used': round(stock_used, 3),
+        'waste_percent': round((stock_used - cut_length) / stock_used * 100, 2) if stock_used else 0.0,
+        'optimal': optimal,
+        'bars': [
+            {
+                'cuts': [{'length': round(length, 3), 'order_item': label} for length, label in bar],
+                'offcut': round(stock_length - sum(length + kerf for length, _ in bar) + kerf, 3),
+            }
+            for bar in bars
+        ],
+        'oversized': [{'length': round(length, 3), 'order_item': label} for length, label in oversized],
+    }
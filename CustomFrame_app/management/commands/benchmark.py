@@ -0,0 +1,136 @@
+import io
+import json
+import statistics
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework.test import APIClient
+
+from CustomFrame_app.models import Login, Frame, CartItem
+from CustomFrame_app.serializer import ClaimsTokenObtainPairSerializer
+
+
+class Command(BaseCommand):
+    help = ("Drive the main endpoints in-process, report p50/p95/p99 latency and query counts, "
+            "and fail when they regress against a stored baseline.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument('--user', help="Username to authenticate as (defaults to a generated customer)")
+        parser.add_argument('--baseline', default=str(Path(settings.BASE_DIR) / 'benchmark_baseline.json'))
+        parser.add_argument('--save-baseline', action='store_true', help="Store this run as the new baseline")
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help="Allowed p95 latency increase over the baseline, as a fraction")
+        parser.add_argument('--min-delta-ms', type=float, default=2.0,
+                            help="Ignore p95 increases smaller than this, which are timer noise on fast endpoints")
+        parser.add_argument('--accept-encoding', default='gzip, br',
+                            help="Accept-Encoding sent with every request; use 'identity' to measure uncompressed")
+
+    def handle(self, *args, **options):
+        if options['iterations'] < 2:
+            raise CommandError("At least 2 iterations are needed for percentiles")
+        user = self.get_user(options['user'])
+        frame = Frame.objects.order_by('id').first()
+        if frame is None:
+            raise CommandError("The catalog is empty; run generate_catalog first")
+
+        # A real access token, as /login/ issues it, so every request pays for JWT authentication
+        token = ClaimsTokenObtainPairSerializer.get_token(user).access_token
+        client = APIClient(HTTP_ACCEPT_ENCODING=options['accept_encoding'])
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+        created_items = []
+
+        def add_to_cart():
+            response = client.post('/add-to-cart/', {
+                'frame': frame.id, 'quantity': 1,
+                'original_image': self.upload('original.png'), 'adjusted_image': self.upload('adjusted.png'),
+            }, format='multipart', HTTP_ACCEPT_ENCODING='identity')
+            if response.status_code == 201:
+                created_items.append(response.json()['id'])
+            return response
+
+        scenarios = {
+            'GET /frames/': lambda: client.get('/frames/'),
+            'GET /frames/<id>/': lambda: client.get(f'/frames/{frame.id}/'),
+            'GET /cart/': lambda: client.get('/cart/'),
+            'GET /cart/summary/': lambda: client.get('/cart/summary/'),
+            'POST /add-to-cart/': add_to_cart,
+        }
+        try:
+            results = {name: self.measure(run, options['iterations'], options['warmup'])
+                       for name, run in scenarios.items()}
+        finally:
+            for item in CartItem.objects.filter(id__in=created_items):
+                item.original_image.delete(save=False)
+                item.adjusted_image.delete(save=False)
+                item.delete()
+
+        self.report(results)
+        baseline_path = Path(options['baseline'])
+        if options['save_baseline']:
+            baseline_path.write_text(json.dumps(results, indent=2, sort_keys=True))
+            self.stdout.write(self.style.SUCCESS(f"Baseline saved to {baseline_path}"))
+            return
+        if not baseline_path.exists():
+            self.stdout.write(self.style.WARNING(f"No baseline at {baseline_path}; run with --save-baseline"))
+            return
+
+        baseline = json.loads(baseline_path.read_text())
+        regressions = []
+        for name, result in results.items():
+            previous = baseline.get(name)
+            if previous is None:
+                continue
+            allowed = max(previous['p95_ms'] * (1 + options['tolerance']), previous['p95_ms'] + options['min_delta_ms'])
+            if result['p95_ms'] > allowed:
+                regressions.append(f"{name}: p95 {result['p95_ms']:.2f}ms vs baseline {previous['p95_ms']:.2f}ms")
+            if result['queries'] > previous['queries']:
+                regressions.append(f"{name}: {result['queries']} queries vs baseline {previous['queries']}")
+        if regressions:
+            raise CommandError("Performance regressions:\n  " + "\n  ".join(regressions))
+        self.stdout.write(self.style.SUCCESS("No regressions against the baseline"))
+
+    def get_user(self, username):
+        users = Login.objects.filter(username=username) if username else \
+            Login.objects.filter(is_user=True, username__endswith='_user_0')
+        user = users.first()
+        if user is None:
+            raise CommandError("No user to benchmark with; pass --user or run generate_catalog")
+        return user
+
+    def measure(self, run, iterations, warmup):
+        for _ in range(warmup):
+            run()
+        timings = []
+        queries = 0
+        size = 0
+        for _ in range(iterations):
+            with CaptureQueriesContext(connections['default']) as captured:
+                started = time.perf_counter()
+                response = run()
+                timings.append((time.perf_counter() - started) * 1000)
+            if response.status_code >= 400:
+                raise CommandError(f"Request failed with status {response.status_code}: {response.content[:200]!r}")
+            queries = max(queries, len(captured.captured_queries))
+            size = max(size, len(response.content))
+        cuts = statistics.quantiles(timings, n=100, method='inclusive')
+        return {'p50_ms': round(cuts[49], 3), 'p95_ms': round(cuts[94], 3), 'p99_ms': round(cuts[98], 3),
+                'queries': queries, 'bytes': size}
+
+    def report(self, results):
+        self.stdout.write(f"{'endpoint':<22}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'queries':>9}{'bytes':>10}")
+        for name, result in results.items():
+            self.stdout.write(f"{name:<22}{result['p50_ms']:>10.2f}{result['p95_ms']:>10.2f}"
+                              f"{result['p99_ms']:>10.2f}{result['queries']:>9}{result['bytes']:>10}")
+
+    def upload(self, name):
+        buffer = io.BytesIO()
+        Image.new('RGB', (32, 32), (200, 180, 160)).save(buffer, 'PNG')
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from CustomFrame_app.models import Frame
+from CustomFrame_app.sprites import SPRITE_SOURCES, build_sprite_sheet, rebuild_stale_sprites
+
+
+class Command(BaseCommand):
+    help = ("Build the variant swatch sprite sheet of every frame (or the given ones). Frames whose "
+            "variant images are unchanged are skipped unless --force is passed. With --stale, only "
+            "frames whose variants changed since their last build; run it from cron.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('frame_ids', nargs='*', type=int)
+        parser.add_argument('--force', action='store_true', help="Re-render sheets that are already current")
+        parser.add_argument('--stale', action='store_true', help="Only build frames marked stale by variant edits")
+
+    def handle(self, *args, **options):
+        if options['stale']:
+            built = rebuild_stale_sprites()
+            self.stdout.write(self.style.SUCCESS(f"Built {built} stale sprite sheets"))
+            return
+        frames = Frame.objects.prefetch_related(*(related for _, related, _ in SPRITE_SOURCES)).order_by('id')
+        if options['frame_ids']:
+            frames = frames.filter(id__in=options['frame_ids'])
+        built = skipped = 0
+        for frame in frames.iterator(chunk_size=100):
+            if build_sprite_sheet(frame, force=options['force']):
+                built += 1
+            else:
+                skipped += 1
+        self.stdout.write(self.style.SUCCESS(f"Built {built} sprite sheets, {skipped} already current"))
@@ -0,0 +1,118 @@
+import io
+import random
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from PIL import Image
+
+from CustomFrame_app.models import Login, Frame, ColorVariant, SizeVariant, FinishingVariant, FrameHangVariant, Cart, \
+    CartItem
+
+
+class Command(BaseCommand):
+    help = "Generate a synthetic catalog, customers and carts for load testing and benchmarks."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--frames', type=int, default=50)
+        parser.add_argument('--variants', type=int, default=5, help="Variants per type per frame")
+        parser.add_argument('--users', type=int, default=20)
+        parser.add_argument('--cart-items', type=int, default=3, help="Cart items per user")
+        parser.add_argument('--prefix', default='synthetic')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--clear', action='store_true', help="Delete previously generated data first")
+
+    def handle(self, *args, **options):
+        prefix = options['prefix']
+        rng = random.Random(options['seed'])
+        if options['clear']:
+            Frame.objects.filter(name__startswith=f"{prefix} ").delete()
+            Login.objects.filter(username__startswith=f"{prefix}_").delete()
+
+        # One image fixture shared by every row keeps generation fast at any scale
+        image = self.image_fixture(f"fixtures/{prefix}.png", 'PNG')
+        photo = self.image_fixture(f"fixtures/{prefix}_photo.jpg", 'JPEG')
+
+        with transaction.atomic():
+            admin, created = Login.objects.get_or_create(
+                username=f"{prefix}_admin", defaults={'is_staff': True, 'password': make_password(prefix)}
+            )
+            # Numbering continues after earlier runs, so rerunning without --clear adds to the data set
+            first_frame = self.next_index(
+                Frame.objects.filter(name__startswith=f"{prefix} frame ").values_list('name', flat=True),
+                f"{prefix} frame ")
+            frames = Frame.objects.bulk_create([
+                Frame(
+                    name=f"{prefix} frame {i}", price=self.price(rng), image=image, corner_image=image,
+                    inner_width=rng.choice([20, 30, 40, 50]), inner_height=rng.choice([25, 40, 60, 70]),
+                    moulding_width=rng.choice([2, 3, 4.5]), created_by=admin,
+                )
+                for i in range(first_frame, first_frame + options['frames'])
+            ])
+            variants = {model: [] for model in (ColorVariant, SizeVariant, FinishingVariant, FrameHangVariant)}
+            for frame in frames:
+                for j in range(options['variants']):
+                    variants[ColorVariant].append(ColorVariant(
+                        frame=frame, color_name=f"Color {j}", image=image, corner_image=image, price=self.price(rng, 5)))
+                    variants[SizeVariant].append(SizeVariant(
+                        frame=frame, size_name=f"Size {j}", inner_width=20 + 10 * j, inner_height=30 + 10 * j,
+                        image=image, corner_image=image, price=self.price(rng, 20)))
+                    variants[FinishingVariant].append(FinishingVariant(
+                        frame=frame, finish_name=f"Finish {j}", image=image, corner_image=image, price=self.price(rng, 5)))
+                    variants[FrameHangVariant].append(FrameHangVariant(
+                        frame=frame, hanging_name=f"Hanging {j}", image=image, price=self.price(rng, 3)))
+            for model, rows in variants.items():
+                model.objects.bulk_create(rows, batch_size=1000)
+
+            password = make_password(prefix)
+            first_user = self.next_index(
+                Login.objects.filter(username__startswith=f"{prefix}_user_").values_list('username', flat=True),
+                f"{prefix}_user_")
+            users = Login.objects.bulk_create([
+                Login(username=f"{prefix}_user_{i}", password=password, is_user=True, name=f"Customer {i}",
+                      email=f"{prefix}{i}@example.com", phone=f"555{i:07d}")
+                for i in range(first_user, first_user + options['users'])
+            ])
+            carts = Cart.objects.bulk_create([Cart(user=user) for user in users])
+
+            by_frame = {model: {} for model in variants}
+            for model, rows in variants.items():
+                for row in rows:
+                    by_frame[model].setdefault(row.frame_id, []).append(row)
+            items = []
+            for cart in carts:
+                for _ in range(options['cart_items'] if frames else 0):
+                    frame = rng.choice(frames)
+                    item = CartItem(
+                        cart=cart, frame=frame, original_image=photo, adjusted_image=photo,
+                        color_variant=rng.choice(by_frame[ColorVariant].get(frame.id) or [None]),
+                        size_variant=rng.choice(by_frame[SizeVariant].get(frame.id) or [None]),
+                        finish_variant=rng.choice(by_frame[FinishingVariant].get(frame.id) or [None]),
+                        hanging_variant=rng.choice(by_frame[FrameHangVariant].get(frame.id) or [None]),
+                        quantity=rng.randint(1, 3),
+                    )
+                    item.total_price = item.calculate_total_price()
+                    items.append(item)
+            CartItem.objects.bulk_create(items, batch_size=1000)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Generated {len(frames)} frames, {sum(len(rows) for rows in variants.values())} variants, "
+            f"{len(users)} users and {len(items)} cart items"
+        ))
+
+    def next_index(self, names, prefix):
+        taken = [int(name[len(prefix):]) for name in names if name[len(prefix):].isdigit()]
+        return max(taken, default=-1) + 1
+
+    def price(self, rng, scale=100):
+        return Decimal(rng.randint(100, scale * 100)) / 100
+
+    def image_fixture(self, name, image_format):
+        if not default_storage.exists(name):
+            buffer = io.BytesIO()
+            Image.new('RGB', (64, 64), (120, 90, 60)).save(buffer, image_format)
+            name = default_storage.save(name, ContentFile(buffer.getvalue()))
+        return name
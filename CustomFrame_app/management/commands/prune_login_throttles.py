@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from CustomFrame_app.throttling import prune_buckets
+
+
+class Command(BaseCommand):
+    help = "Delete login throttle buckets that have refilled completely (run from cron, e.g. hourly)."
+
+    def handle(self, *args, **options):
+        pruned = prune_buckets()
+        self.stdout.write(self.style.SUCCESS(f"Pruned {pruned} login throttle buckets"))
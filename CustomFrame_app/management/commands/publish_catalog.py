@@ -0,0 +1,182 @@
+import hashlib
+import io
+import json
+import os
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from PIL import Image
+
+from CustomFrame_app.models import Frame
+from CustomFrame_app.renderers import FastJSONRenderer
+from CustomFrame_app.serializer import FrameSerializer
+from CustomFrame_app.views import frame_queryset
+
+CATALOG_IMAGE_MAX_SIZE = 1600
+CATALOG_IMAGE_QUALITY = 85
+
+# Image fields rewritten to bundle paths, per nested variant list of FrameSerializer
+FRAME_IMAGE_FIELDS = ('image', 'corner_image', 'sprite_sheet')
+VARIANT_IMAGE_FIELDS = {
+    'color_variants': ('image', 'corner_image'),
+    'size_variants': ('image', 'corner_image'),
+    'finishing_variants': ('image', 'corner_image'),
+    'frameHanging_variant': ('image',),
+}
+
+
+class Command(BaseCommand):
+    help = ("Publish the public catalog as a static bundle: content-hashed catalog, per-frame JSON and "
+            "optimized images, plus current.json pointing at the latest publish. Only frames changed "
+            "since the previous publish are re-rendered. Serve current.json with a short cache lifetime "
+            "and everything else as immutable.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default=str(settings.CATALOG_PUBLISH_ROOT))
+        parser.add_argument('--full', action='store_true', help="Ignore the previous publish and render every frame")
+        parser.add_argument('--keep', type=int, default=5,
+                            help="Publishes whose files are kept for clients still holding an older current.json")
+
+    def handle(self, *args, **options):
+        self.root = Path(options['output'])
+        for directory in ('catalog', 'frames', 'images', 'manifests'):
+            (self.root / directory).mkdir(parents=True, exist_ok=True)
+
+        previous = {} if options['full'] else self.read_json('current.json', default={})
+        previous_frames = previous.get('frames', {})
+        self.images = dict(previous.get('images', {}))
+        self.used_images = set()
+
+        # Frame.updated_at also moves when variants or the sprite sheet change
+        stamps = {str(pk): updated_at.isoformat() for pk, updated_at in Frame.objects.values_list('id', 'updated_at')}
+        changed = [pk for pk, stamp in stamps.items()
+                   if previous_frames.get(pk, {}).get('updated_at') != stamp]
+
+        frames = {}
+        payloads = {}
+        for frame in frame_queryset().filter(id__in=changed).iterator(chunk_size=100):
+            payload = self.frame_payload(frame)
+            key = str(frame.pk)
+            frames[key] = {'updated_at': stamps[key], 'path': self.write_hashed('frames', f"{key}-", payload),
+                           'images': sorted(self.frame_images)}
+            payloads[key] = payload
+        for key in stamps.keys() - frames.keys():
+            entry = previous_frames[key]
+            frames[key] = entry
+            self.used_images.update(entry['images'])
+            payloads[key] = self.read_json(entry['path'])
+
+        catalog = [payloads[key] for key in sorted(payloads, key=int)]
+        catalog_path = self.write_hashed('catalog', '', catalog)
+        if previous.get('catalog') == catalog_path and previous_frames == frames:
+            self.stdout.write(self.style.SUCCESS(f"Catalog unchanged since {previous['version']}"))
+            return
+
+        now = timezone.now()
+        manifest = {
+            'version': f"{now:%Y%m%dT%H%M%S%fZ}-{catalog_path.split('/')[-1][:8]}",
+            'published_at': now.isoformat(),
+            'catalog': catalog_path,
+            'frames': frames,
+            'images': {source: path for source, path in self.images.items() if path in self.used_images},
+        }
+        self.write_atomic(self.root / 'manifests' / f"{manifest['version']}.json", self.render(manifest))
+        # The pointer flips in one rename, so readers see either the old publish or the new one
+        self.write_atomic(self.root / 'current.json', self.render(manifest))
+        removed = self.prune(options['keep'], manifest)
+        self.stdout.write(self.style.SUCCESS(
+            f"Published {manifest['version']}: {len(changed)} of {len(frames)} frames rendered, "
+            f"{len(previous_frames.keys() - frames.keys())} removed, {removed} stale files pruned"
+        ))
+
+    def frame_payload(self, frame):
+        self.frame_images = set()
+        payload = FrameSerializer(frame).data
+        # The public bundle doesn't carry the staff account that created the frame
+        payload.pop('created_by', None)
+        for field in FRAME_IMAGE_FIELDS:
+            payload[field] = self.publish_image(getattr(frame, field), optimize=field != 'sprite_sheet')
+        for key, fields in VARIANT_IMAGE_FIELDS.items():
+            variants = {variant.pk: variant for variant in getattr(frame, key).all()}
+            for item in payload[key]:
+                for field in fields:
+                    item[field] = self.publish_image(getattr(variants[item['id']], field))
+        return payload
+
+    def publish_image(self, image, optimize=True):
+        if not image:
+            return None
+        path = self.images.get(image.name)
+        if path is None or not (self.root / path).exists():
+            with image.open('rb') as source:
+                content = source.read()
+            extension = Path(image.name).suffix.lower()
+            if optimize:
+                content, extension = self.optimize(content, extension)
+            path = f"images/{hashlib.sha256(content).hexdigest()[:20]}{extension}"
+            if not (self.root / path).exists():
+                self.write_atomic(self.root / path, content)
+            self.images[image.name] = path
+        self.frame_images.add(path)
+        self.used_images.add(path)
+        return path
+
+    def optimize(self, content, extension):
+        try:
+            with Image.open(io.BytesIO(content)) as picture:
+                picture.thumbnail((CATALOG_IMAGE_MAX_SIZE, CATALOG_IMAGE_MAX_SIZE))
+                if picture.mode not in ('RGB', 'RGBA'):
+                    picture = picture.convert('RGBA' if 'A' in picture.getbands() else 'RGB')
+                buffer = io.BytesIO()
+                picture.save(buffer, 'WEBP', quality=CATALOG_IMAGE_QUALITY, method=6)
+        except (OSError, ValueError):
+            return content, extension
+        optimized = buffer.getvalue()
+        return (optimized, '.webp') if len(optimized) < len(content) else (content, extension)
+
+    def render(self, data):
+        return FastJSONRenderer().render(data)
+
+    def write_hashed(self, directory, prefix, data):
+        content = self.render(data)
+        path = f"{directory}/{prefix}{hashlib.sha256(content).hexdigest()[:20]}.json"
+        if not (self.root / path).exists():
+            self.write_atomic(self.root / path, content)
+        return path
+
+    def write_atomic(self, target, content):
+        descriptor, temporary = tempfile.mkstemp(dir=target.parent, prefix='.tmp-')
+        with os.fdopen(descriptor, 'wb') as handle:
+            handle.write(content)
+        os.chmod(temporary, 0o644)
+        os.replace(temporary, target)
+
+    def read_json(self, path, default=None):
+        try:
+            return json.loads((self.root / path).read_bytes())
+        except FileNotFoundError:
+            if default is None:
+                raise
+            return default
+
+    def prune(self, keep, current):
+        # Versions start with a UTC timestamp, so name order is publish order
+        manifests = sorted((self.root / 'manifests').glob('*.json'))
+        kept, expired = manifests[-max(keep, 1):], manifests[:-max(keep, 1)]
+        referenced = set()
+        for manifest in [current] + [json.loads(path.read_bytes()) for path in kept]:
+            referenced.add(manifest['catalog'])
+            referenced.update(entry['path'] for entry in manifest['frames'].values())
+            referenced.update(manifest['images'].values())
+        removed = 0
+        for path in expired:
+            path.unlink()
+        for directory in ('catalog', 'frames', 'images'):
+            for path in (self.root / directory).iterdir():
+                if f"{directory}/{path.name}" not in referenced:
+                    path.unlink()
+                    removed += 1
+        return removed
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from CustomFrame_app.models import DailySalesRollup, Order
+
+
+class Command(BaseCommand):
+    help = "Rebuild the daily sales rollups from order history (normally maintained incrementally)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        orders = Order.objects.exclude(status='cancelled').prefetch_related('items').order_by('id')
+        count = 0
+        with transaction.atomic():
+            DailySalesRollup.objects.all().delete()
+            for order in orders.iterator(chunk_size=chunk_size):
+                DailySalesRollup.apply_items(order.items.all())
+                count += 1
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt sales rollups from {count} orders"))
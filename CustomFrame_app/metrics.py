@@ -0,0 +1,245 @@
+"""In-process request metrics, rendered in the Prometheus text exposition format.
+
+Each worker process keeps its own registry and labels its samples with its pid,
+so a scrape describes the worker that answered it.
+"""
+import contextvars
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from rest_framework import serializers
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (1024, 10240, 102400, 1048576, 10485760, 104857600)
+QUEUE_WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+_current = contextvars.ContextVar('request_metrics', default=None)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latency = {}
+        self.response_size = {}
+        self.upload_size = {}
+        self.queries = {}
+        self.query_seconds = {}
+        self.serializer_seconds = {}
+        self.queue_wait = {}
+
+    def record(self, labels, stats):
+        with self.lock:
+            self.latency.setdefault(labels, Histogram(LATENCY_BUCKETS)).observe(stats['seconds'])
+            self.queries.setdefault(labels, Histogram((0, 1, 2, 5, 10, 25, 50, 100))).observe(stats['queries'])
+            self.query_seconds[labels] = self.query_seconds.get(labels, 0.0) + stats['query_seconds']
+            self.serializer_seconds[labels] = self.serializer_seconds.get(labels, 0.0) + stats['serializer_seconds']
+            if stats['response_bytes'] is not None:
+                self.response_size.setdefault(labels, Histogram(SIZE_BUCKETS)).observe(stats['response_bytes'])
+            if stats['upload_bytes']:
+                self.upload_size.setdefault(labels, Histogram(SIZE_BUCKETS)).observe(stats['upload_bytes'])
+
+    def record_queue_wait(self, pool, admitted, seconds):
+        labels = (pool, 'admitted' if admitted else 'shed')
+        with self.lock:
+            self.queue_wait.setdefault(labels, Histogram(QUEUE_WAIT_BUCKETS)).observe(seconds)
+
+    def render(self, extra_lines=()):
+        pid = os.getpid()
+        lines = []
+        with self.lock:
+            for name, help_text, histograms in (
+                ('http_request_duration_seconds', 'Request latency per view', self.latency),
+                ('http_request_db_queries', 'SQL queries per request', self.queries),
+                ('http_response_size_bytes', 'Response body size', self.response_size),
+                ('http_upload_size_bytes', 'Multipart request body size', self.upload_size),
+            ):
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} histogram")
+                for labels, histogram in sorted(histograms.items()):
+                    lines.extend(_histogram_lines(name, _labels(labels, pid), histogram))
+            for name, help_text, counters in (
+                ('http_request_db_seconds_total', 'Time spent executing SQL', self.query_seconds),
+                ('http_request_serializer_seconds_total', 'Time spent in DRF serializers', self.serializer_seconds),
+            ):
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} counter")
+                for labels, value in sorted(counters.items()):
+                    lines.append(f"{name}{{{_labels(labels, pid)}}} {value}")
+            name = 'http_concurrency_queue_wait_seconds'
+            lines.append(f"# HELP {name} Time spent waiting for a concurrency slot, by pool and outcome")
+            lines.append(f"# TYPE {name} histogram")
+            for (pool, outcome), histogram in sorted(self.queue_wait.items()):
+                base = f'pool="{pool}",outcome="{outcome}",worker="{pid}"'
+                lines.extend(_histogram_lines(name, base, histogram))
+        lines.extend(extra_lines)
+        return '\n'.join(lines) + '\n'
+
+
+def _histogram_lines(name, base, histogram):
+    lines = []
+    cumulative = 0
+    for bound, count in zip(histogram.buckets + (float('inf'),), histogram.counts):
+        cumulative += count
+        le = '+Inf' if bound == float('inf') else repr(bound)
+        lines.append(f'{name}_bucket{{{base},le="{le}"}} {cumulative}')
+    lines.append(f"{name}_sum{{{base}}} {histogram.sum}")
+    lines.append(f"{name}_count{{{base}}} {histogram.count}")
+    return lines
+
+
+def _labels(labels, pid):
+    view, method, status_class = labels
+    return f'view="{view}",method="{method}",status="{status_class}",worker="{pid}"'
+
+
+registry = Registry()
+
+
+def _time_serializer(method):
+    def wrapper(self, *args, **kwargs):
+        stats = _current.get()
+        if stats is None or stats['in_serializer']:
+            return method(self, *args, **kwargs)
+        stats['in_serializer'] = True
+        started = time.perf_counter()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            stats['serializer_seconds'] += time.perf_counter() - started
+            stats['in_serializer'] = False
+    return wrapper
+
+
+def install_serializer_timing():
+    # Top-level serializer work goes through is_valid() and .data; nested serializers are counted once
+    serializers.BaseSerializer.is_valid = _time_serializer(serializers.BaseSerializer.is_valid)
+    data = serializers.BaseSerializer.data
+    serializers.BaseSerializer.data = property(_time_serializer(data.fget))
+
+
+def count_query(execute, sql, params, many, context):
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - started
+        stats['queries'] += 1
+        stats['query_seconds'] += elapsed
+        if stats['trace'] is not None:
+            stats['trace'].append((sql, params, many, elapsed, _query_origin()))
+
+
+def _query_origin():
+    # Innermost frame in this project's code outside this module, e.g. the view or serializer line
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(_project_dir) and filename != __file__ and 'site-packages' not in filename:
+            return f"{os.path.relpath(filename, _project_dir)}:{frame.f_lineno} in {frame.f_code.co_name}"
+        frame = frame.f_back
+    return None
+
+
+_project_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) + os.sep
+
+
+def start_query_trace():
+    """Record every query of the current request from now on; returns the list they are appended to."""
+    stats = _current.get()
+    if stats is None:
+        return None
+    stats['trace'] = []
+    return stats['trace']
+
+
+def new_stats():
+    return {'queries': 0, 'query_seconds': 0.0, 'serializer_seconds': 0.0, 'in_serializer': False,
+            'trace': None, 'started': time.perf_counter()}
+
+
+@contextmanager
+def query_trace(trace):
+    """Append every query run inside the block to ``trace``, outside of any request's stats."""
+    stats = new_stats()
+    stats['trace'] = trace
+    token = _current.set(stats)
+    try:
+        yield trace
+    finally:
+        _current.reset(token)
+
+
+def install_query_counter(sender, connection, **kwargs):
+    # Installed once per connection and kept at the front of the list, so scoped
+    # execute_wrapper() blocks (which pop the last wrapper) are unaffected. The
+    # context variable follows ORM calls into sync_to_async threads.
+    if count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, count_query)
+
+
+class RequestMetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats, token = self.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, stats)
+
+    async def __acall__(self, request):
+        stats, token = self.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, stats)
+
+    def start(self):
+        stats = new_stats()
+        return stats, _current.set(stats)
+
+    def finish(self, request, response, stats):
+        stats['seconds'] = time.perf_counter() - stats['started']
+        match = request.resolver_match
+        view = match.view_name if match and match.view_name else 'unmatched'
+        stats['response_bytes'] = None if response.streaming else len(response.content)
+        stats['upload_bytes'] = 0
+        if request.content_type == 'multipart/form-data':
+            try:
+                stats['upload_bytes'] = int(request.META.get('CONTENT_LENGTH') or 0)
+            except (TypeError, ValueError):
+                # Malformed header from the client; Django already treats the body as empty
+                pass
+        registry.record((view, request.method, f"{response.status_code // 100}xx"), stats)
+        return response
@@ -0,0 +1,62 @@
+# Generated by Django 5.2.3 on 2026-10-19 11:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('CustomFrame_app', '0002_order_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySalesRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('variant_key', models.CharField(max_length=100)),
+                ('line_count', models.IntegerField(default=0)),
+                ('quantity', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['-created_at', '-id'], name='order_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['status', '-created_at', '-id'], name='order_status_created_idx'),
+        ),
+        migrations.AddField(
+            model_name='dailysalesrollup',
+            name='color_variant',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='CustomFrame_app.colorvariant'),
+        ),
+        migrations.AddField(
+            model_name='dailysalesrollup',
+            name='finish_variant',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='CustomFrame_app.finishingvariant'),
+        ),
+        migrations.AddField(
+            model_name='dailysalesrollup',
+            name='frame',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales', to='CustomFrame_app.frame'),
+        ),
+        migrations.AddField(
+            model_name='dailysalesrollup',
+            name='hanging_variant',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='CustomFrame_app.framehangvariant'),
+        ),
+        migrations.AddField(
+            model_name='dailysalesrollup',
+            name='size_variant',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='CustomFrame_app.sizevariant'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailysalesrollup',
+            constraint=models.UniqueConstraint(fields=('day', 'frame', 'variant_key'), name='unique_daily_sales_rollup'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-19 11:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('CustomFrame_app', '0003_order_indexes_dailysalesrollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='frame',
+            name='moulding_width',
+            field=models.FloatField(default=0),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-19 11:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('CustomFrame_app', '0004_frame_moulding_width'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='login',
+            name='token_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.3 on 2026-10-19 11:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('CustomFrame_app', '0005_login_token_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LoginThrottle',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=255, unique=True)),
+                ('tokens', models.FloatField()),
+                ('updated_at', models.DateTimeField()),
+                ('rejected_count', models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+    ]
@@ -0,0 +1,37 @@
+from django.db import migrations
+
+SEARCH_FIELDS = ('username', 'name', 'email', 'phone')
+
+
+def create_trigram_indexes(apps, schema_editor):
+    # Trigram GIN indexes serve both icontains and istartswith lookups. They are PostgreSQL-only,
+    # so other backends (e.g. SQLite test databases) skip them.
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    table = schema_editor.quote_name(apps.get_model('CustomFrame_app', 'Login')._meta.db_table)
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for field in SEARCH_FIELDS:
+        schema_editor.execute(
+            f'CREATE INDEX CONCURRENTLY IF NOT EXISTS login_{field}_trgm '
+            f'ON {table} USING gin ((UPPER("{field}"::text)) gin_trgm_ops)'
+        )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for field in SEARCH_FIELDS:
+        schema_editor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS login_{field}_trgm')
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('CustomFrame_app', '0006_loginthrottle'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
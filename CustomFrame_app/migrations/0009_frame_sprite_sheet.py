@@ -0,0 +1,23 @@
+# Generated by Django 5.2.3 on 2026-10-19 11:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('CustomFrame_app', '0008_frame_updated_at_frametombstone'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='frame',
+            name='sprite_map',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='frame',
+            name='sprite_sheet',
+            field=models.ImageField(blank=True, null=True, upload_to='frame_sprites/'),
+        ),
+    ]
@@ -0,0 +1,93 @@
+# Generated by Django 5.2.3 on 2026-10-19 11:35
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+VARIANTS = {
+    'color_variant': ('color_name', ('image', 'corner_image')),
+    'size_variant': ('size_name', ('inner_width', 'inner_height', 'image', 'corner_image')),
+    'finish_variant': ('finish_name', ('image', 'corner_image')),
+    'hanging_variant': ('hanging_name', ('image',)),
+}
+
+
+def backfill_snapshots(apps, schema_editor):
+    # Existing lines are frozen from the catalog as it is now; their customization was never
+    # copied from the cart, so it is left empty.
+    OrderItem = apps.get_model('CustomFrame_app', 'OrderItem')
+    items = OrderItem.objects.filter(snapshot={}, frame__isnull=False).select_related('frame', *VARIANTS)
+    batch = []
+    for item in items.iterator(chunk_size=500):
+        frame = item.frame
+        snapshot = {
+            'frame': {
+                'id': frame.pk, 'name': frame.name, 'price': str(frame.price),
+                'inner_width': frame.inner_width, 'inner_height': frame.inner_height,
+                'moulding_width': frame.moulding_width,
+                'image': frame.image.name or None, 'corner_image': frame.corner_image.name or None,
+            },
+            'unit_price': str(item.total_price / item.quantity) if item.quantity else str(item.total_price),
+            'customization': {},
+        }
+        for key, (name_field, fields) in VARIANTS.items():
+            variant = getattr(item, key)
+            if variant is None:
+                snapshot[key] = None
+                continue
+            entry = {'id': variant.pk, 'name': getattr(variant, name_field), 'price': str(variant.price)}
+            for field in fields:
+                value = getattr(variant, field)
+                entry[field] = (value.name or None) if hasattr(value, 'name') else value
+            snapshot[key] = entry
+        item.snapshot = snapshot
+        batch.append(item)
+        if len(batch) >= 500:
+            OrderItem.objects.bulk_update(batch, ['snapshot'])
+            batch = []
+    if batch:
+        OrderItem.objects.bulk_update(batch, ['snapshot'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('CustomFrame_app', '0009_frame_sprite_sheet'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderitem',
+            name='snapshot',
+            field=models.JSONField(default=dict),
+        ),
+        migrations.AlterField(
+            model_name='orderitem',
+            name='color_variant',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='CustomFrame_app.colorvariant'),
+        ),
+        migrations.AlterField(
+            model_name='orderitem',
+            name='finish_variant',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='CustomFrame_app.finishingvariant'),
+        ),
+        migrations.AlterField(
+            model_name='orderitem',
+            name='frame',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='CustomFrame_app.frame'),
+        ),
+        migrations.AlterField(
+            model_name='orderitem',
+            name='hanging_variant',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='CustomFrame_app.framehangvariant'),
+        ),
+        migrations.AlterField(
+            model_name='orderitem',
+            name='size_variant',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='CustomFrame_app.sizevariant'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='order_user_created_idx'),
+        ),
+        migrations.RunPython(backfill_snapshots, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.3 on 2026-10-19 11:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('CustomFrame_app', '0010_orderitem_snapshot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='frame',
+            name='popularity_rank',
+            field=models.PositiveIntegerField(blank=True, db_index=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='PopularityCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('frame', 'Frame'), ('color', 'Color variant'), ('size', 'Size variant'), ('finish', 'Finishing variant'), ('hanging', 'Hanging variant')], max_length=10)),
+                ('object_id', models.BigIntegerField()),
+                ('cart_adds', models.BigIntegerField(default=0)),
+                ('units_ordered', models.BigIntegerField(default=0)),
+                ('score', models.FloatField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('kind', 'object_id'), name='unique_popularity_counter')],
+            },
+        ),
+    ]
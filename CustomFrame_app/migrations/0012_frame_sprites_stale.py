@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-19 12:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('CustomFrame_app', '0011_popularity'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='frame',
+            name='sprites_stale',
+            field=models.BooleanField(db_index=True, default=False),
+        ),
+    ]
@@ -1,6 +1,9 @@
+from django.conf import settings
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.core.cache import cache
+from django.db import connection, models, transaction
 from django.core.exceptions import ValidationError
+from django.utils import timezone
 
 class Login(AbstractUser):
     is_user = models.BooleanField(default=False)
@@ -13,6 +16,70 @@ class Login(AbstractUser):
     name = models.CharField(max_length=100, blank=True, null=True)
     address = models.CharField(max_length=100, blank=True, null=True)
     is_blocked = models.BooleanField(default=False)
+    token_version = models.PositiveIntegerField(default=0)
+
+    # Copied into access tokens; changing any of them (or the password) revokes outstanding tokens
+    TOKEN_CLAIM_FIELDS = ('username', 'is_active', 'is_staff', 'is_superuser', 'is_user', 'is_employee', 'is_blocked')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_claims = {
+            name: value for name, value in zip(field_names, values) if name in cls.TOKEN_CLAIM_FIELDS
+        }
+        return instance
+
+    def set_password(self, raw_password):
+        super().set_password(raw_password)
+        self._token_version_stale = True
+
+    def save(self, *args, **kwargs):
+        loaded = getattr(self, '_loaded_claims', {})
+        if any(getattr(self, name) != value for name, value in loaded.items()):
+            self._token_version_stale = True
+        bump = getattr(self, '_token_version_stale', False) and not self._state.adding
+        if bump:
+            self.token_version += 1
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = set(kwargs['update_fields']) | {'token_version'}
+        super().save(*args, **kwargs)
+        self._token_version_stale = False
+        self._loaded_claims = {name: getattr(self, name) for name in loaded}
+        if bump:
+            # Published only once committed, so a rollback can't revoke tokens that are still valid
+            key, version = self.token_version_cache_key(self.pk), self.token_version
+            transaction.on_commit(lambda: cache.set(key, version, settings.TOKEN_VERSION_CACHE_TIMEOUT))
+
+    def delete(self, *args, **kwargs):
+        user_id = self.pk
+        result = super().delete(*args, **kwargs)
+        transaction.on_commit(lambda: cache.delete(self.token_version_cache_key(user_id)))
+        return result
+
+    @staticmethod
+    def token_version_cache_key(user_id):
+        return f"login:token_version:{user_id}"
+
+    @classmethod
+    def cached_token_version(cls, user_id):
+        # -1 marks a deleted user so repeated lookups stay out of the database
+        key = cls.token_version_cache_key(user_id)
+        version = cache.get(key)
+        if version is None:
+            version = cls.objects.filter(pk=user_id).values_list('token_version', flat=True).first()
+            version = -1 if version is None else version
+            cache.set(key, version, settings.TOKEN_VERSION_CACHE_TIMEOUT)
+        return version
+
+class LoginThrottle(models.Model):
+    # Token bucket for login attempts, keyed by "ip:<address>" or "user:<username>"
+    key = models.CharField(max_length=255, unique=True)
+    tokens = models.FloatField()
+    updated_at = models.DateTimeField()
+    rejected_count = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return self.key
 
 class Frame(models.Model):
     name = models.CharField(max_length=100)
@@ -21,12 +88,34 @@ class Frame(models.Model):
     corner_image = models.ImageField(upload_to='frames/corner/')
     inner_width = models.FloatField()
     inner_height = models.FloatField()
+    moulding_width = models.FloatField(default=0)
     created_by = models.ForeignKey(Login, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Also bumped when any of the frame's variants change (see signals.py)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+    # Packed variant swatches, rebuilt from the variants by sprites.py
+    sprite_sheet = models.ImageField(upload_to='frame_sprites/', blank=True, null=True)
+    sprite_map = models.JSONField(default=dict, blank=True)
+    # Set when a variant changes; cleared once the sheet is re-rendered off-request
+    sprites_stale = models.BooleanField(default=False, db_index=True)
+    # 1 = best seller; recomputed from PopularityCounter whenever counts are flushed (see popularity.py)
+    popularity_rank = models.PositiveIntegerField(null=True, blank=True, db_index=True)
 
     def __str__(self):
         return self.name
 
+    @classmethod
+    def touch(cls, frame_id, **fields):
+        cls.objects.filter(pk=frame_id).update(updated_at=timezone.now(), **fields)
+
+class FrameTombstone(models.Model):
+    # Records deleted frames so catalog-level validators and incremental consumers see removals
+    frame_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"Frame {self.frame_id} deleted at {self.deleted_at}"
+
 class ColorVariant(models.Model):
     frame = models.ForeignKey(Frame, related_name='color_variants', on_delete=models.CASCADE)
     color_name = models.CharField(max_length=50)
@@ -104,6 +193,11 @@ class Cart(models.Model):
     def __str__(self):
         return f"Cart for {self.user.username}"
 
+    @classmethod
+    def touch(cls, cart_id):
+        # auto_now only fires on Cart.save(), so item changes bump it explicitly
+        cls.objects.filter(pk=cart_id).update(updated_at=timezone.now())
+
 class CartItem(models.Model):
     cart = models.ForeignKey(Cart, related_name='items', on_delete=models.CASCADE)
     frame = models.ForeignKey(Frame, on_delete=models.CASCADE)
@@ -122,8 +216,7 @@ class CartItem(models.Model):
     frame_rotation = models.FloatField(default=0)
     total_price = models.DecimalField(max_digits=10, decimal_places=2, default=0)
 
-    def save(self, *args, **kwargs):
-        # Calculate total price based on frame and variants
+    def unit_price(self):
         price = self.frame.price if self.frame else 0
         if self.color_variant:
             price += self.color_variant.price
@@ -133,8 +226,58 @@ class CartItem(models.Model):
             price += self.finish_variant.price
         if self.hanging_variant:
             price += self.hanging_variant.price
-        self.total_price = price * self.quantity
+        return price
+
+    def calculate_total_price(self):
+        # Calculate total price based on frame and variants
+        return self.unit_price() * self.quantity
+
+    def snapshot(self):
+        """Everything an order line needs to render without the live catalog rows.
+
+        Prices are strings so they round-trip through JSON exactly; images are storage paths.
+        """
+        frame = self.frame
+        variants = {
+            'color_variant': (self.color_variant, 'color_name', ('image', 'corner_image')),
+            'size_variant': (self.size_variant, 'size_name', ('inner_width', 'inner_height', 'image', 'corner_image')),
+            'finish_variant': (self.finish_variant, 'finish_name', ('image', 'corner_image')),
+            'hanging_variant': (self.hanging_variant, 'hanging_name', ('image',)),
+        }
+        data = {
+            'frame': {
+                'id': frame.pk, 'name': frame.name, 'price': str(frame.price),
+                'inner_width': frame.inner_width, 'inner_height': frame.inner_height,
+                'moulding_width': frame.moulding_width,
+                'image': frame.image.name or None, 'corner_image': frame.corner_image.name or None,
+            },
+            'unit_price': str(self.unit_price()),
+            'customization': {
+                'transform_x': self.transform_x, 'transform_y': self.transform_y, 'scale': self.scale,
+                'rotation': self.rotation, 'frame_rotation': self.frame_rotation,
+            },
+        }
+        for key, (variant, name_field, fields) in variants.items():
+            if variant is None:
+                data[key] = None
+                continue
+            entry = {'id': variant.pk, 'name': getattr(variant, name_field), 'price': str(variant.price)}
+            for field in fields:
+                value = getattr(variant, field)
+                entry[field] = (value.name or None) if hasattr(value, 'name') else value
+            data[key] = entry
+        return data
+
+    def save(self, *args, **kwargs):
+        self.total_price = self.calculate_total_price()
         super().save(*args, **kwargs)
+        Cart.touch(self.cart_id)
+
+    def delete(self, *args, **kwargs):
+        cart_id = self.cart_id
+        result = super().delete(*args, **kwargs)
+        Cart.touch(cart_id)
+        return result
 
     def __str__(self):
         return f"CartItem for {self.cart.user.username} - Frame: {self.frame.name}"
@@ -150,21 +293,163 @@ class Order(models.Model):
         ('delivered', 'Delivered'),
         ('cancelled', 'Cancelled'),
     ], default='pending')
+    idempotency_key = models.CharField(max_length=64, null=True, blank=True)
+
+    # Fulfilment moves orders forward only; cancelling is possible until the order ships
+    STATUS_TRANSITIONS = {
+        'pending': ('confirmed', 'cancelled'),
+        'confirmed': ('shipped', 'cancelled'),
+        'shipped': ('delivered',),
+        'delivered': (),
+        'cancelled': (),
+    }
+
+    def can_transition_to(self, new_status):
+        return new_status in self.STATUS_TRANSITIONS.get(self.status, ())
 
     def __str__(self):
         return f"Order {self.id} by {self.user.username}"
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'idempotency_key'], name='unique_order_idempotency_key'),
+        ]
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='order_created_idx'),
+            models.Index(fields=['status', '-created_at', '-id'], name='order_status_created_idx'),
+            models.Index(fields=['user', '-created_at', '-id'], name='order_user_created_idx'),
+        ]
+
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='items')
     image = models.ImageField(upload_to='order_images/')
-    frame = models.ForeignKey(Frame, on_delete=models.CASCADE)
-    color_variant = models.ForeignKey(ColorVariant, on_delete=models.CASCADE, null=True, blank=True)
-    size_variant = models.ForeignKey(SizeVariant, on_delete=models.CASCADE, null=True, blank=True)
-    finish_variant = models.ForeignKey(FinishingVariant, on_delete=models.CASCADE, null=True, blank=True)
-    hanging_variant = models.ForeignKey(FrameHangVariant, on_delete=models.CASCADE, null=True, blank=True)
+    # Catalog links are informational; deleting a frame or variant must not touch past orders
+    frame = models.ForeignKey(Frame, on_delete=models.SET_NULL, null=True, blank=True)
+    color_variant = models.ForeignKey(ColorVariant, on_delete=models.SET_NULL, null=True, blank=True)
+    size_variant = models.ForeignKey(SizeVariant, on_delete=models.SET_NULL, null=True, blank=True)
+    finish_variant = models.ForeignKey(FinishingVariant, on_delete=models.SET_NULL, null=True, blank=True)
+    hanging_variant = models.ForeignKey(FrameHangVariant, on_delete=models.SET_NULL, null=True, blank=True)
     quantity = models.PositiveIntegerField()
     total_price = models.DecimalField(max_digits=10, decimal_places=2)
+    # CartItem.snapshot() as of checkout; never updated afterwards
+    snapshot = models.JSONField(default=dict)
+
+    VARIANT_FIELDS = ('color_variant', 'size_variant', 'finish_variant', 'hanging_variant')
+
+    def __str__(self):
+        return f"OrderItem for {(self.snapshot.get('frame') or {}).get('name', self.frame_id)} ({self.quantity})"
+
+    def rollup_variant_key(self):
+        # Snapshot ids survive variant deletion, so a later cancellation still finds the original rollup row
+        return '-'.join(
+            str((self.snapshot.get(field) or {}).get('id') or getattr(self, f"{field}_id") or 0)
+            for field in self.VARIANT_FIELDS
+        )
+
+
+class DailySalesRollup(models.Model):
+    # Revenue per frame/variant combination per day, kept up to date as orders are placed or cancelled
+    day = models.DateField()
+    frame = models.ForeignKey(Frame, on_delete=models.CASCADE, related_name='daily_sales')
+    color_variant = models.ForeignKey(ColorVariant, null=True, blank=True, on_delete=models.SET_NULL)
+    size_variant = models.ForeignKey(SizeVariant, null=True, blank=True, on_delete=models.SET_NULL)
+    finish_variant = models.ForeignKey(FinishingVariant, null=True, blank=True, on_delete=models.SET_NULL)
+    hanging_variant = models.ForeignKey(FrameHangVariant, null=True, blank=True, on_delete=models.SET_NULL)
+    variant_key = models.CharField(max_length=100)
+    line_count = models.IntegerField(default=0)
+    quantity = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
 
     def __str__(self):
-        return f"OrderItem for {self.frame.name} ({self.quantity})"
+        return f"{self.day} - frame {self.frame_id} ({self.variant_key})"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'frame', 'variant_key'], name='unique_daily_sales_rollup'),
+        ]
+
+    @classmethod
+    def apply_items(cls, items, sign=1):
+        """Add (sign=1) or remove (sign=-1) order lines from the rollups in one upsert.
+
+        Each item must have its order loaded, since the rollup day is the order's creation date.
+        """
+        grouped = {}
+        for item in items:
+            if item.frame_id is None:
+                # The frame's rollup rows were deleted along with it
+                continue
+            day = timezone.localdate(item.order.created_at)
+            variant_ids = (item.color_variant_id, item.size_variant_id, item.finish_variant_id, item.hanging_variant_id)
+            key = (day, item.frame_id) + variant_ids + (item.rollup_variant_key(),)
+            lines, quantity, revenue = grouped.get(key, (0, 0, 0))
+            grouped[key] = (lines + 1, quantity + item.quantity, revenue + item.total_price)
+        if not grouped:
+            return
+
+        qn = connection.ops.quote_name
+        table = qn(cls._meta.db_table)
+        columns = ['day', 'frame_id', 'color_variant_id', 'size_variant_id', 'finish_variant_id',
+                   'hanging_variant_id', 'variant_key', 'line_count', 'quantity', 'revenue']
+        params = []
+        for key, (lines, quantity, revenue) in grouped.items():
+            params.extend([*key, sign * lines, sign * quantity, sign * revenue])
+        row = '(' + ', '.join(['%s'] * len(columns)) + ')'
+        counters = ', '.join(f"{qn(c)} = {table}.{qn(c)} + EXCLUDED.{qn(c)}" for c in ('line_count', 'quantity', 'revenue'))
+        sql = (
+            f"INSERT INTO {table} ({', '.join(qn(c) for c in columns)}) "
+            f"VALUES {', '.join([row] * len(grouped))} "
+            f"ON CONFLICT ({qn('day')}, {qn('frame_id')}, {qn('variant_key')}) DO UPDATE SET {counters}"
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+
+
+class PopularityCounter(models.Model):
+    # Add-to-cart and order counts per frame or variant, written in batches by popularity.py
+    KIND_CHOICES = [
+        ('frame', 'Frame'),
+        ('color', 'Color variant'),
+        ('size', 'Size variant'),
+        ('finish', 'Finishing variant'),
+        ('hanging', 'Hanging variant'),
+    ]
+
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    object_id = models.BigIntegerField()
+    cart_adds = models.BigIntegerField(default=0)
+    units_ordered = models.BigIntegerField(default=0)
+    # Forward-decayed: events are weighted by when they happened, so old scores never need rewriting
+    score = models.FloatField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.kind} {self.object_id}: {self.score:.3g}"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'object_id'], name='unique_popularity_counter'),
+        ]
 
+    @classmethod
+    def apply(cls, counts):
+        """Add buffered ``{(kind, object_id): (cart_adds, units_ordered, score)}`` deltas in one upsert."""
+        if not counts:
+            return
+        qn = connection.ops.quote_name
+        table = qn(cls._meta.db_table)
+        columns = ['kind', 'object_id', 'cart_adds', 'units_ordered', 'score', 'updated_at']
+        now = timezone.now()
+        params = []
+        for key, deltas in counts.items():
+            params.extend([*key, *deltas, now])
+        row = '(' + ', '.join(['%s'] * len(columns)) + ')'
+        counters = ', '.join(f"{qn(c)} = {table}.{qn(c)} + EXCLUDED.{qn(c)}" for c in ('cart_adds', 'units_ordered', 'score'))
+        sql = (
+            f"INSERT INTO {table} ({', '.join(qn(c) for c in columns)}) "
+            f"VALUES {', '.join([row] * len(counts))} "
+            f"ON CONFLICT ({qn('kind')}, {qn('object_id')}) "
+            f"DO UPDATE SET {counters}, {qn('updated_at')} = EXCLUDED.{qn('updated_at')}"
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
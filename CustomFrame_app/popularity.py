@@ -0,0 +1,159 @@
+"""Buffered popularity counters behind ``?ordering=popular`` on the frame list.
+
+Add-to-cart and checkout only bump an in-process buffer (after their
+transaction commits). A background thread writes the buffer out every
+``POPULARITY_FLUSH_SECONDS`` (or as soon as it holds
+``POPULARITY_FLUSH_MAX_KEYS`` rows) as a single
+``INSERT ... ON CONFLICT DO UPDATE SET n = n + x`` over all touched frames and
+variants, so a best seller's counter row is written once per flush rather than
+once per request, and no customer request waits on it. Each flush then
+refreshes ``Frame.popularity_rank`` with one ``ROW_NUMBER()`` update.
+
+Scores decay with a half-life of ``POPULARITY_HALF_LIFE`` using forward decay:
+an event adds ``weight * 2 ** (t / half_life)``, with ``t`` measured from
+``POPULARITY_EPOCH``. Every score shrinks by the same factor as time passes, so
+the ranking is what exponentially decayed counts would give, without ever
+rewriting existing rows. Doubles run out after about 1000 half-lives (~19
+years at 7 days); move the epoch forward and divide the stored scores before
+then.
+"""
+import atexit
+import logging
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db import DatabaseError, close_old_connections, connection, transaction
+from django.utils import timezone
+
+from CustomFrame_app.models import Frame, PopularityCounter
+
+logger = logging.getLogger(__name__)
+
+POPULARITY_FLUSH_SECONDS = 30
+POPULARITY_FLUSH_MAX_KEYS = 500
+POPULARITY_HALF_LIFE = timedelta(days=7)
+POPULARITY_EPOCH = datetime(2025, 1, 1, tzinfo=dt_timezone.utc)
+# Score per add-to-cart, and per unit ordered
+POPULARITY_CART_WEIGHT = 1.0
+POPULARITY_ORDER_WEIGHT = 5.0
+
+# Line item foreign key -> PopularityCounter.kind
+VARIANT_KINDS = (
+    ('color_variant', 'color'),
+    ('size_variant', 'size'),
+    ('finish_variant', 'finish'),
+    ('hanging_variant', 'hanging'),
+)
+
+
+def decay_weight(now=None):
+    now = now or timezone.now()
+    return 2 ** ((now - POPULARITY_EPOCH).total_seconds() / POPULARITY_HALF_LIFE.total_seconds())
+
+
+def line_keys(item):
+    keys = [('frame', item.frame_id)]
+    keys.extend((kind, getattr(item, f"{field}_id")) for field, kind in VARIANT_KINDS
+                if getattr(item, f"{field}_id"))
+    return keys
+
+
+class PopularityBuffer:
+    def __init__(self):
+        self.lock = threading.Lock()
+        # (kind, object_id) -> [cart_adds, units_ordered, score]
+        self.pending = {}
+        self.flushed_at = time.monotonic()
+        self.wakeup = threading.Event()
+        self.thread = None
+
+    def add(self, rows):
+        """Buffer ``(keys, cart_adds, units_ordered, score)`` rows for the flusher thread."""
+        with self.lock:
+            for keys, cart_adds, units_ordered, score in rows:
+                for key in keys:
+                    counts = self.pending.setdefault(key, [0, 0, 0.0])
+                    counts[0] += cart_adds
+                    counts[1] += units_ordered
+                    counts[2] += score
+            full = len(self.pending) >= POPULARITY_FLUSH_MAX_KEYS
+            if self.thread is None or not self.thread.is_alive():
+                self.start()
+        if full:
+            self.wakeup.set()
+
+    def start(self):
+        # Started on first use, so each forked worker gets its own thread
+        self.thread = threading.Thread(target=self.run, name='popularity-flush', daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while True:
+            self.wakeup.wait(max(self.flushed_at + POPULARITY_FLUSH_SECONDS - time.monotonic(), 0))
+            self.wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Popularity flush failed")
+            finally:
+                close_old_connections()
+
+    def flush(self):
+        with self.lock:
+            pending, self.pending = self.pending, {}
+            self.flushed_at = time.monotonic()
+        if not pending:
+            return
+        try:
+            with transaction.atomic():
+                # Sorted, so concurrent flushes from other workers lock rows in the same order
+                PopularityCounter.apply(dict(sorted(pending.items())))
+                rank_frames()
+        except DatabaseError:
+            logger.exception("Popularity flush failed; keeping %s counters for the next one", len(pending))
+            with self.lock:
+                for key, (cart_adds, units_ordered, score) in pending.items():
+                    counts = self.pending.setdefault(key, [0, 0, 0.0])
+                    counts[0] += cart_adds
+                    counts[1] += units_ordered
+                    counts[2] += score
+
+
+def rank_frames():
+    # Ranked in the database; only frames whose rank moved are written, and updated_at is left
+    # alone, so a re-ranking doesn't invalidate frame caches. Frames without any recorded
+    # interest keep a NULL rank and sort last.
+    qn = connection.ops.quote_name
+    frames = qn(Frame._meta.db_table)
+    counters = qn(PopularityCounter._meta.db_table)
+    rank, pk, object_id = qn('popularity_rank'), qn('id'), qn('object_id')
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"UPDATE {frames} SET {rank} = ranked.position FROM ("
+            f"SELECT {object_id}, ROW_NUMBER() OVER (ORDER BY {qn('score')} DESC, {object_id}) AS position "
+            f"FROM {counters} WHERE {qn('kind')} = 'frame' AND {object_id} IN (SELECT {pk} FROM {frames})"
+            f") AS ranked WHERE {frames}.{pk} = ranked.{object_id} "
+            f"AND ({frames}.{rank} IS NULL OR {frames}.{rank} <> ranked.position)"
+        )
+        cursor.execute(
+            f"UPDATE {frames} SET {rank} = NULL WHERE {rank} IS NOT NULL AND {pk} NOT IN ("
+            f"SELECT {object_id} FROM {counters} WHERE {qn('kind')} = 'frame')"
+        )
+
+
+buffer = PopularityBuffer()
+atexit.register(buffer.flush)
+
+
+def record_cart_adds(items):
+    weight = POPULARITY_CART_WEIGHT * decay_weight()
+    rows = [(line_keys(item), 1, 0, weight) for item in items]
+    # Only what actually committed counts; the buffer is touched after the request's transaction
+    transaction.on_commit(lambda: buffer.add(rows))
+
+
+def record_order_items(items):
+    weight = POPULARITY_ORDER_WEIGHT * decay_weight()
+    rows = [(line_keys(item), 0, item.quantity, weight * item.quantity) for item in items if item.frame_id]
+    transaction.on_commit(lambda: buffer.add(rows))
@@ -0,0 +1,242 @@
+"""Bulk price quotes for frames at arbitrary sizes.
+
+The cart is the source of truth: a row without a custom size is quoted at
+exactly ``CartItem.unit_price()``, the frame's list price plus the prices of
+its variants (a size variant's price is the surcharge for that size). A custom
+opening of ``width`` x ``height`` replaces the list price with::
+
+    moulding rate * outer perimeter + QUOTE_GLAZING_PRICE_PER_AREA * width * height
+
+and the other variants' prices are added on top. The outer perimeter is the
+total length of the four mitred pieces (see ``cutlist.frame_pieces``). Each
+frame's moulding rate is derived from its list price, so a frame quoted at its
+own inner size costs its list price: ``price = rate * perimeter + glazing``. A
+custom size replaces a size variant, so the two can't be combined.
+
+Prices are added up in whole cents, as the cart adds up decimals.
+
+Per-frame and per-variant prices are kept in a per-process matrix of sorted id
+and price arrays. The matrix is rebuilt only when the catalog's version changes:
+frame count, newest ``updated_at`` (which variant edits also move) and newest
+tombstone. A batch is priced with a handful of NumPy operations, whatever its
+size. Without NumPy the same formula runs row by row.
+"""
+import math
+import threading
+
+from django.conf import settings
+from django.db.models import Count, Max
+
+from CustomFrame_app.models import Frame, FrameTombstone, ColorVariant, SizeVariant, FinishingVariant, \
+    FrameHangVariant
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Largest width/height accepted for a quote, in the unit of Frame.inner_width
+QUOTE_MAX_DIMENSION = 10000
+MAX_ID = 2 ** 63 - 1
+
+# Request field -> variant model; a size variant also supplies the opening when no width/height is given
+VARIANT_MODELS = (
+    ('color_variant', ColorVariant),
+    ('size_variant', SizeVariant),
+    ('finish_variant', FinishingVariant),
+    ('hanging_variant', FrameHangVariant),
+)
+SIZE_VARIANT_INDEX = [field for field, _ in VARIANT_MODELS].index('size_variant')
+
+
+def catalog_version():
+    state = Frame.objects.aggregate(count=Count('id'), updated_at=Max('updated_at'))
+    deleted_at = FrameTombstone.objects.aggregate(deleted_at=Max('deleted_at'))['deleted_at']
+    return state['count'], state['updated_at'], deleted_at
+
+
+class PriceMatrix:
+    def __init__(self):
+        frames = list(Frame.objects.order_by('id').values_list(
+            'id', 'price', 'inner_width', 'inner_height', 'moulding_width'))
+        glazing = settings.QUOTE_GLAZING_PRICE_PER_AREA
+        self.frames = {}
+        for pk, price, width, height, moulding in frames:
+            # (list price in cents, moulding rate, flat part, inner width, inner height, moulding width)
+            perimeter = 2 * (width + height) + 8 * moulding
+            moulding_price = float(price) - glazing * width * height
+            if perimeter > 0 and moulding_price > 0:
+                self.frames[pk] = (int(price * 100), moulding_price / perimeter, 0.0, width, height, moulding)
+            else:
+                # No usable size, or glazing alone exceeds the list price: keep the difference flat
+                self.frames[pk] = (int(price * 100), 0.0, moulding_price, width, height, moulding)
+        self.variants = {}
+        for field, model in VARIANT_MODELS:
+            columns = ('id', 'frame_id', 'price') + (('inner_width', 'inner_height') if model is SizeVariant else ())
+            self.variants[field] = {row[0]: (row[1], int(row[2] * 100), *row[3:])
+                                    for row in model.objects.order_by('id').values_list(*columns)}
+        if np is not None:
+            self.build_arrays()
+
+    def build_arrays(self):
+        # Every array starts with a sentinel id of -1, so lookups always have a row to land on
+        ids = sorted(self.frames)
+        self.frame_ids = np.array([-1] + ids, dtype=np.int64)
+        self.frame_columns = np.array([(0.0,) * 6] + [self.frames[pk] for pk in ids], dtype=np.float64).T
+        self.variant_arrays = {}
+        for field, rows in self.variants.items():
+            ids = sorted(rows)
+            # Rows of values: price in cents, then inner width and height for size variants
+            empty = (0.0,) * (3 if field == 'size_variant' else 1)
+            self.variant_arrays[field] = (
+                np.array([-1] + ids, dtype=np.int64),
+                np.array([-1] + [rows[pk][0] for pk in ids], dtype=np.int64),
+                np.array([empty] + [rows[pk][1:] for pk in ids], dtype=np.float64).T,
+            )
+
+    def quote(self, columns):
+        """Unit prices in cents for parsed rows; returns (cents, widths, heights, invalid row indexes)."""
+        if np is None:
+            return self.quote_rows(columns)
+        frame_ids = np.asarray(columns['frame'], dtype=np.int64)
+        width = np.asarray(columns['width'], dtype=np.float64)
+        height = np.asarray(columns['height'], dtype=np.float64)
+
+        position, valid = lookup(self.frame_ids, frame_ids)
+        price, rate, fixed, frame_width, frame_height, moulding = self.frame_columns[:, position]
+        surcharge = np.zeros(len(frame_ids))
+        for field, (ids, owners, values) in self.variant_arrays.items():
+            wanted = np.asarray(columns[field], dtype=np.int64)
+            chosen = wanted > 0
+            at, found = lookup(ids, wanted)
+            valid &= ~chosen | (found & (owners[at] == frame_ids))
+            surcharge += np.where(chosen, values[0, at], 0.0)
+            if field == 'size_variant':
+                frame_width = np.where(chosen, values[1, at], frame_width)
+                frame_height = np.where(chosen, values[2, at], frame_height)
+        custom = ~np.isnan(width)
+        width = np.where(custom, width, frame_width)
+        height = np.where(custom, height, frame_height)
+
+        sized = (fixed + rate * (2 * (width + height) + 8 * moulding)
+                 + settings.QUOTE_GLAZING_PRICE_PER_AREA * width * height)
+        cents = np.where(custom, np.floor(sized * 100 + 0.5), price) + surcharge
+        return cents.astype(np.int64).tolist(), width.tolist(), height.tolist(), np.flatnonzero(~valid).tolist()
+
+    def quote_rows(self, columns):
+        glazing = settings.QUOTE_GLAZING_PRICE_PER_AREA
+        cents, widths, heights, invalid = [], [], [], []
+        for index, frame_id in enumerate(columns['frame']):
+            frame = self.frames.get(frame_id)
+            if frame is None:
+                invalid.append(index)
+                frame = (0,) + (0.0,) * 5
+            price, rate, fixed, width, height, moulding = frame
+            surcharge = 0
+            for field, rows in self.variants.items():
+                variant_id = columns[field][index]
+                if not variant_id:
+                    continue
+                variant = rows.get(variant_id)
+                if variant is None or variant[0] != frame_id:
+                    invalid.append(index)
+                    break
+                surcharge += variant[1]
+                if field == 'size_variant':
+                    width, height = variant[2], variant[3]
+            if not math.isnan(columns['width'][index]):
+                width, height = columns['width'][index], columns['height'][index]
+                sized = fixed + rate * (2 * (width + height) + 8 * moulding) + glazing * width * height
+                price = math.floor(sized * 100 + 0.5)
+            cents.append(price + surcharge)
+            widths.append(width)
+            heights.append(height)
+        return cents, widths, heights, sorted(set(invalid))
+
+
+def lookup(sorted_ids, wanted):
+    # Positions of wanted ids in a sorted id array, and which of them are actually there
+    position = np.minimum(np.searchsorted(sorted_ids, wanted), len(sorted_ids) - 1)
+    return position, sorted_ids[position] == wanted
+
+
+class PriceMatrixCache:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.state = (None, None)
+
+    def get(self):
+        version = catalog_version()
+        cached_version, matrix = self.state
+        if matrix is not None and cached_version == version:
+            return matrix
+        with self.lock:
+            cached_version, matrix = self.state
+            if matrix is None or cached_version != version:
+                matrix = PriceMatrix()
+                self.state = (version, matrix)
+        return matrix
+
+
+price_matrix = PriceMatrixCache()
+
+
+def parse_integer(value):
+    # JSON numbers only; int() would also take 1.7 (as 1), true (as 1) and "12"
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not float(value).is_integer():
+        raise ValueError(value)
+    return int(value)
+
+
+def parse_number(value):
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError(value)
+    return float(value)
+
+
+def parse_quote_row(item):
+    if not isinstance(item, dict) or 'frame' not in item:
+        raise ValueError("each item needs a frame")
+    dimensions = (item.get('width'), item.get('height'))
+    custom_size = dimensions != (None, None)
+    if custom_size and None in dimensions:
+        raise ValueError("width and height must be given together")
+    try:
+        frame_id = parse_integer(item['frame'])
+        variant_ids = [0 if item.get(field) is None else parse_integer(item[field]) for field, _ in VARIANT_MODELS]
+        quantity = parse_integer(item.get('quantity', 1))
+        width, height = map(parse_number, dimensions) if custom_size else (math.nan, math.nan)
+    except (OverflowError, ValueError):
+        raise ValueError("ids and quantity must be integers, width and height numbers")
+    if not 0 < frame_id <= MAX_ID or not all(0 <= pk <= MAX_ID for pk in variant_ids):
+        raise ValueError("ids must be positive")
+    if quantity < 1:
+        raise ValueError("quantity must be at least 1")
+    if custom_size and not (0 < width <= QUOTE_MAX_DIMENSION and 0 < height <= QUOTE_MAX_DIMENSION):
+        raise ValueError(f"width and height must be between 0 and {QUOTE_MAX_DIMENSION}")
+    if custom_size and variant_ids[SIZE_VARIANT_INDEX]:
+        raise ValueError("give either a size_variant or a width and height, not both")
+    return frame_id, variant_ids, quantity, width, height
+
+
+def parse_quote_rows(items):
+    """Columns for PriceMatrix.quote() from request rows, plus errors by row index."""
+    columns = {'frame': [], 'width': [], 'height': [], 'quantity': [], **{field: [] for field, _ in VARIANT_MODELS}}
+    errors = {}
+    for index, item in enumerate(items):
+        try:
+            frame_id, variant_ids, quantity, width, height = parse_quote_row(item)
+        except ValueError as exc:
+            errors[index] = str(exc)
+            continue
+        columns['frame'].append(frame_id)
+        columns['width'].append(width)
+        columns['height'].append(height)
+        columns['quantity'].append(quantity)
+        for (field, _), variant_id in zip(VARIANT_MODELS, variant_ids):
+            columns[field].append(variant_id)
+    return columns, errors
+
+
+def format_cents(cents):
+    return f"{cents // 100}.{cents % 100:02d}"
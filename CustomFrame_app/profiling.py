@@ -0,0 +1,253 @@
+"""On-demand profiling of single requests, for staff.
+
+Send ``X-Profile: 1`` (or add ``?_profile=1``) as a staff user, via the session
+or a JWT, and the request is run under cProfile with every SQL query recorded.
+The report is saved under ``PROFILE_ROOT`` and the response carries an
+``X-Profile-Id`` header. ``/profiles/<id>/`` returns the report and
+``/profiles/<id>/pstats/`` the raw profile, for snakeviz or ``pstats``.
+
+Requests without the flag only pay for one header and one query-string
+lookup. Flagged requests are checked for staff before anything is profiled:
+the session user, else the ``is_staff`` claim of a valid JWT (no user query).
+Everyone else's flag is ignored.
+
+Streaming responses are reported when the stream ends: the SQL trace and the
+duration cover the iteration, cProfile only the view that built the response.
+Under ASGI the SQL trace is complete, but cProfile only sees the event loop
+thread, so sync views run in a worker thread show up as a single await.
+"""
+import cProfile
+import io
+import json
+import os
+import pstats
+import time
+import uuid
+from collections import defaultdict
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.utils import timezone
+from rest_framework.exceptions import AuthenticationFailed
+
+from CustomFrame_app.authentication import ClaimsJWTAuthentication
+from CustomFrame_app.metrics import query_trace, start_query_trace
+
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+PROFILE_QUERY_PARAM = '_profile'
+PROFILE_FLAG_VALUES = {'1', 'true', 'yes', 'on'}
+# Functions listed in the report, by cumulative time
+PROFILE_TOP_FUNCTIONS = 40
+# Reports kept on disk; older ones are deleted as new ones are written
+PROFILE_KEEP = 100
+
+
+def profile_requested(request):
+    if request.META.get(PROFILE_HEADER, '').strip().lower() in PROFILE_FLAG_VALUES:
+        return True
+    return (PROFILE_QUERY_PARAM in request.META.get('QUERY_STRING', '')
+            and request.GET.get(PROFILE_QUERY_PARAM, '').lower() in PROFILE_FLAG_VALUES)
+
+
+def staff_user(request):
+    # The session user (AuthenticationMiddleware), else the claims of a JWT; DRF hasn't run yet
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        try:
+            result = ClaimsJWTAuthentication().authenticate(request)
+        except AuthenticationFailed:
+            return None
+        user = result[0] if result else None
+    return user if user is not None and user.is_staff else None
+
+
+def profile_path(profile_id, suffix):
+    # Ids are generated here; anything else (e.g. path separators from a URL) is rejected
+    if not profile_id.replace('-', '').isalnum():
+        raise FileNotFoundError(profile_id)
+    return Path(settings.PROFILE_ROOT) / f"{profile_id}{suffix}"
+
+
+def load_report(profile_id):
+    return json.loads(profile_path(profile_id, '.json').read_bytes())
+
+
+def list_reports():
+    root = Path(settings.PROFILE_ROOT)
+    if not root.is_dir():
+        return []
+    reports = []
+    for path in sorted(root.glob('*.json'), reverse=True):
+        try:
+            report = json.loads(path.read_bytes())
+        except FileNotFoundError:
+            # Pruned by another worker since the glob
+            continue
+        reports.append({key: report[key] for key in ('id', 'method', 'path', 'status', 'user', 'started_at',
+                                                      'duration_ms', 'query_count', 'duplicate_query_count')})
+    return reports
+
+
+def summarize_queries(trace):
+    queries = []
+    exact = defaultdict(list)
+    similar = defaultdict(list)
+    for sql, params, many, seconds, origin in trace:
+        index = len(queries)
+        queries.append({'sql': sql, 'params': repr(params), 'many': many, 'ms': round(seconds * 1000, 3),
+                        'origin': origin})
+        exact[(sql, repr(params))].append(index)
+        similar[sql].append(index)
+    # Exact repeats are wasted work; the same statement with different params is usually an N+1
+    duplicates = [
+        {'sql': sql, 'params': params, 'count': len(indexes),
+         'ms': round(sum(queries[i]['ms'] for i in indexes), 3),
+         'origins': sorted({queries[i]['origin'] for i in indexes if queries[i]['origin']})}
+        for (sql, params), indexes in exact.items() if len(indexes) > 1
+    ]
+    repeated = [
+        {'sql': sql, 'count': len(indexes), 'ms': round(sum(queries[i]['ms'] for i in indexes), 3),
+         'origins': sorted({queries[i]['origin'] for i in indexes if queries[i]['origin']})}
+        for sql, indexes in similar.items() if len({queries[i]['params'] for i in indexes}) > 1
+    ]
+    duplicates.sort(key=lambda entry: -entry['count'])
+    repeated.sort(key=lambda entry: -entry['count'])
+    return queries, duplicates, repeated
+
+
+def top_functions(profiler):
+    stats = pstats.Stats(profiler, stream=io.StringIO())
+    rows = []
+    for (filename, line, name), (calls, primitive, tottime, cumtime, callers) in stats.stats.items():
+        rows.append({'function': name, 'location': f"{filename}:{line}", 'calls': calls,
+                     'primitive_calls': primitive, 'tottime_ms': round(tottime * 1000, 3),
+                     'cumtime_ms': round(cumtime * 1000, 3)})
+    rows.sort(key=lambda row: -row['cumtime_ms'])
+    return rows[:PROFILE_TOP_FUNCTIONS]
+
+
+def new_profile_id(started_at):
+    return f"{started_at:%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}"
+
+
+def save_report(profile_id, request, response, user, started_at, seconds, profiler, trace):
+    queries, duplicates, repeated = summarize_queries(trace or [])
+    report = {
+        'id': profile_id,
+        'method': request.method,
+        'path': request.get_full_path(),
+        'status': response.status_code,
+        'user': user.get_username(),
+        'started_at': started_at.isoformat(),
+        'duration_ms': round(seconds * 1000, 3),
+        'query_count': len(queries),
+        'query_ms': round(sum(query['ms'] for query in queries), 3),
+        'duplicate_query_count': sum(entry['count'] - 1 for entry in duplicates),
+        'duplicate_queries': duplicates,
+        'repeated_statements': repeated,
+        'queries': queries,
+        'functions': top_functions(profiler) if profiler is not None else [],
+    }
+    root = Path(settings.PROFILE_ROOT)
+    root.mkdir(parents=True, exist_ok=True)
+    if profiler is not None:
+        profiler.dump_stats(profile_path(profile_id, '.prof'))
+    # Written aside and renamed into place, so list_reports() never reads half a file
+    path = profile_path(profile_id, '.json')
+    partial = path.with_name(f"{path.name}.tmp")
+    partial.write_text(json.dumps(report, indent=1, default=str))
+    os.replace(partial, path)
+    for stale in sorted(root.glob('*.json'), reverse=True)[PROFILE_KEEP:]:
+        stale.unlink(missing_ok=True)
+        stale.with_suffix('.prof').unlink(missing_ok=True)
+
+
+def start_profiler():
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Another profiler (e.g. a debugger's) is already active in this thread
+        return None
+    return profiler
+
+
+class RequestProfilingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not profile_requested(request):
+            return self.get_response(request)
+        user = staff_user(request)
+        if user is None:
+            return self.get_response(request)
+        trace = start_query_trace()
+        started_at, started = timezone.now(), time.perf_counter()
+        profiler = start_profiler()
+        try:
+            response = self.get_response(request)
+        finally:
+            if profiler is not None:
+                profiler.disable()
+        return self.finish(request, response, user, started_at, started, profiler, trace)
+
+    async def __acall__(self, request):
+        if not profile_requested(request):
+            return await self.get_response(request)
+        # The session user is loaded lazily, which needs a thread
+        user = await sync_to_async(staff_user)(request)
+        if user is None:
+            return await self.get_response(request)
+        trace = start_query_trace()
+        started_at, started = timezone.now(), time.perf_counter()
+        profiler = start_profiler()
+        try:
+            response = await self.get_response(request)
+        finally:
+            if profiler is not None:
+                profiler.disable()
+        finish = sync_to_async(self.finish, thread_sensitive=False)
+        return await finish(request, response, user, started_at, started, profiler, trace)
+
+    def finish(self, request, response, user, started_at, started, profiler, trace):
+        profile_id = new_profile_id(started_at)
+        response['X-Profile-Id'] = profile_id
+
+        def save():
+            save_report(profile_id, request, response, user, started_at, time.perf_counter() - started,
+                        profiler, trace)
+
+        if not response.streaming:
+            save()
+        elif response.is_async:
+            response.streaming_content = self.astream(response.streaming_content, trace, save)
+        else:
+            response.streaming_content = self.stream(response.streaming_content, trace, save)
+        return response
+
+    @staticmethod
+    def stream(content, trace, save):
+        # The rows of a streamed export are usually queried only now, as the body is sent
+        try:
+            with query_trace(trace):
+                yield from content
+        finally:
+            save()
+
+    @staticmethod
+    async def astream(content, trace, save):
+        try:
+            with query_trace(trace):
+                async for chunk in content:
+                    yield chunk
+        finally:
+            await sync_to_async(save, thread_sensitive=False)()
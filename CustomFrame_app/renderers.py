@@ -0,0 +1,57 @@
+"""orjson-backed JSON renderer and parser.
+
+Both fall back to DRF's stdlib implementations when orjson is not installed,
+or when a client asks for indented output or a non-UTF-8 request charset.
+
+Decimals reaching the renderer are written as strings, the same way
+``serializers.DecimalField`` already presents prices, instead of DRF's encoder
+turning them into floats. Incoming JSON numbers are parsed as floats; a
+``DecimalField`` rebuilds them from their shortest repr, which is exact for the
+10-digit prices used here.
+"""
+from decimal import Decimal
+
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Datetimes go through DRF's encoder so their format matches the stdlib renderer
+ORJSON_OPTIONS = (orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_SERIALIZE_NUMPY) \
+    if orjson else 0
+
+_encoder = JSONEncoder()
+
+
+def _default(obj):
+    if isinstance(obj, Decimal):
+        return str(obj)
+    return _encoder.default(obj)
+
+
+class FastJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None or self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        ret = orjson.dumps(data, default=_default, option=ORJSON_OPTIONS)
+        # Same escaping as JSONRenderer, so the output is safe to embed in <script> blocks
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
+
+
+class FastJSONParser(JSONParser):
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', 'utf-8').lower()
+        if orjson is None or encoding.replace('-', '') != 'utf8':
+            return super().parse(stream, media_type, parser_context)
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError(f'JSON parse error - {exc}')
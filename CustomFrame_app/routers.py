@@ -0,0 +1,96 @@
+"""Primary/replica database routing with read-your-writes stickiness.
+
+Reads go to one of ``settings.DATABASE_REPLICAS`` unless the request is pinned
+to the primary. A request is pinned when it uses an unsafe method, once it has
+written anything, or when the same client wrote within the last
+``REPLICA_PIN_SECONDS`` (tracked with a cookie and a cache entry keyed by the
+client's credentials). Outside a request (management commands, shells), or
+when no replicas are configured, every query uses the primary and nothing is
+pinned.
+"""
+import contextvars
+import hashlib
+import random
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+
+PIN_COOKIE = 'db_pin'
+
+_state = contextvars.ContextVar('replica_routing', default=None)
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or state['pinned'] or not settings.DATABASE_REPLICAS:
+            return 'default'
+        return random.choice(settings.DATABASE_REPLICAS)
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state['pinned'] = True
+            state['wrote'] = True
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        return True
+
+
+def pin_key(request):
+    credential = request.META.get('HTTP_AUTHORIZATION') or request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    if not credential:
+        return None
+    return 'db_pin:' + hashlib.sha256(credential.encode()).hexdigest()[:32]
+
+
+class ReplicaPinningMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state, token = self.start(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self.finish(request, response, state)
+
+    async def __acall__(self, request):
+        state, token = self.start(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self.finish(request, response, state)
+
+    def start(self, request):
+        if not settings.DATABASE_REPLICAS:
+            # Every read uses the primary anyway, so skip the cache lookup and the cookie
+            return None, _state.set(None)
+        key = pin_key(request)
+        pinned = (
+            request.method not in ('GET', 'HEAD', 'OPTIONS')
+            or PIN_COOKIE in request.COOKIES
+            or (key is not None and cache.get(key) is not None)
+        )
+        state = {'pinned': pinned, 'wrote': False, 'key': key}
+        return state, _state.set(state)
+
+    def finish(self, request, response, state):
+        window = settings.REPLICA_PIN_SECONDS
+        if state is not None and state['wrote'] and window > 0:
+            if state['key'] is not None:
+                cache.set(state['key'], 1, window)
+            response.set_cookie(PIN_COOKIE, '1', max_age=window, httponly=True, samesite='Lax')
+        return response
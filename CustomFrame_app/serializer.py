@@ -1,5 +1,8 @@
 from rest_framework import serializers
-from CustomFrame_app.models import Login, ColorVariant, SizeVariant, FinishingVariant, Frame, FrameHangVariant, CartItem
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from CustomFrame_app.authentication import add_token_claims
+from CustomFrame_app.models import Login, ColorVariant, SizeVariant, FinishingVariant, Frame, FrameHangVariant, CartItem, \
+    Order, OrderItem, DailySalesRollup
 
 
 class UserDetails_Serializer(serializers.ModelSerializer):
@@ -7,6 +10,11 @@ class UserDetails_Serializer(serializers.ModelSerializer):
         model = Login
         fields = ['id', 'username', 'is_user', 'is_staff', 'is_employee', 'name', 'email', 'phone', 'is_blocked']
 
+class ClaimsTokenObtainPairSerializer(TokenObtainPairSerializer):
+    @classmethod
+    def get_token(cls, user):
+        return add_token_claims(super().get_token(user), user)
+
 class User_Serializer(serializers.ModelSerializer):
     class Meta:
         model = Login
@@ -100,13 +108,15 @@ class FrameSerializer(serializers.ModelSerializer):
     image = serializers.ImageField(allow_null=True, required=False)
     corner_image = serializers.ImageField(allow_null=True, required=False)
     created_by = UserDetails_Serializer(read_only=True)
+    sprite_sheet = serializers.ImageField(read_only=True)
+    sprite_map = serializers.JSONField(read_only=True)
 
     class Meta:
         model = Frame
         fields = [
-            'id', 'name', 'price', 'image', 'corner_image', 'inner_width', 'inner_height',
+            'id', 'name', 'price', 'image', 'corner_image', 'inner_width', 'inner_height', 'moulding_width',
             'color_variants', 'size_variants', 'finishing_variants',
-            'frameHanging_variant', 'created_by'
+            'frameHanging_variant', 'created_by', 'sprite_sheet', 'sprite_map'
         ]
 
     def to_representation(self, instance):
@@ -116,6 +126,8 @@ class FrameSerializer(serializers.ModelSerializer):
             representation['image'] = request.build_absolute_uri(instance.image.url)
         if instance.corner_image and request:
             representation['corner_image'] = request.build_absolute_uri(instance.corner_image.url)
+        if instance.sprite_sheet and request:
+            representation['sprite_sheet'] = request.build_absolute_uri(instance.sprite_sheet.url)
         return representation
 
 class CartItemCreateSerializer(serializers.ModelSerializer):
@@ -215,3 +227,76 @@ class CartItemSerializer(serializers.ModelSerializer):
             return self.context['request'].build_absolute_uri(obj.adjusted_image.url)
         return None
 
+
+class CartSummarySerializer(serializers.Serializer):
+    lines = serializers.IntegerField()
+    quantity = serializers.IntegerField()
+    total_price = serializers.DecimalField(max_digits=12, decimal_places=2)
+
+class CartBatchCreateSerializer(serializers.Serializer):
+    # Foreign keys stay plain ids here; the batch view resolves them set-wise.
+    frame = serializers.IntegerField()
+    color_variant = serializers.IntegerField(required=False, allow_null=True)
+    size_variant = serializers.IntegerField(required=False, allow_null=True)
+    finish_variant = serializers.IntegerField(required=False, allow_null=True)
+    hanging_variant = serializers.IntegerField(required=False, allow_null=True)
+    original_image = serializers.ImageField()
+    cropped_image = serializers.ImageField(required=False, allow_null=True)
+    adjusted_image = serializers.ImageField()
+    quantity = serializers.IntegerField(min_value=1, default=1)
+    transform_x = serializers.FloatField(default=0)
+    transform_y = serializers.FloatField(default=0)
+    scale = serializers.FloatField(default=1)
+    rotation = serializers.FloatField(default=0)
+    frame_rotation = serializers.FloatField(default=0)
+
+class CartBatchUpdateSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    frame = serializers.IntegerField(required=False)
+    color_variant = serializers.IntegerField(required=False, allow_null=True)
+    size_variant = serializers.IntegerField(required=False, allow_null=True)
+    finish_variant = serializers.IntegerField(required=False, allow_null=True)
+    hanging_variant = serializers.IntegerField(required=False, allow_null=True)
+    quantity = serializers.IntegerField(min_value=1, required=False)
+    transform_x = serializers.FloatField(required=False)
+    transform_y = serializers.FloatField(required=False)
+    scale = serializers.FloatField(required=False)
+    rotation = serializers.FloatField(required=False)
+    frame_rotation = serializers.FloatField(required=False)
+
+class OrderItemSerializer(serializers.ModelSerializer):
+    image = serializers.SerializerMethodField()
+
+    class Meta:
+        model = OrderItem
+        fields = ['id', 'frame', 'image', 'color_variant', 'size_variant', 'finish_variant', 'hanging_variant', 'quantity',
+                  'total_price', 'snapshot']
+
+    def get_image(self, obj):
+        request = self.context.get('request')
+        if obj.image and request:
+            return request.build_absolute_uri(obj.image.url)
+        return obj.image.name or None
+
+class OrderSerializer(serializers.ModelSerializer):
+    items = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Order
+        fields = ['id', 'user', 'created_at', 'total_amount', 'status', 'items']
+        read_only_fields = ['user', 'created_at', 'total_amount']
+
+    def get_items(self, order):
+        # Views that already hold the lines set order.line_items (e.g. via Prefetch(to_attr='line_items'))
+        items = getattr(order, 'line_items', None)
+        if items is None:
+            items = order.items.all()
+        return OrderItemSerializer(items, many=True, context=self.context).data
+
+class DailySalesRollupSerializer(serializers.ModelSerializer):
+    frame_name = serializers.CharField(source='frame.name', read_only=True)
+
+    class Meta:
+        model = DailySalesRollup
+        fields = ['day', 'frame', 'frame_name', 'color_variant', 'size_variant', 'finish_variant', 'hanging_variant',
+                  'line_count', 'quantity', 'revenue']
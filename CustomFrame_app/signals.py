@@ -0,0 +1,38 @@
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from CustomFrame_app.models import Frame, FrameTombstone, ColorVariant, SizeVariant, FinishingVariant, \
+    FrameHangVariant
+from CustomFrame_app.sprites import schedule_sprite_rebuild
+from CustomFrame_app.typeahead import schedule_typeahead_refresh
+
+VARIANT_MODELS = (ColorVariant, SizeVariant, FinishingVariant, FrameHangVariant)
+
+
+def touch_frame(sender, instance, **kwargs):
+    Frame.touch(instance.frame_id, sprites_stale=True)
+    schedule_sprite_rebuild()
+    schedule_typeahead_refresh()
+
+
+for variant_model in VARIANT_MODELS:
+    post_save.connect(touch_frame, sender=variant_model, dispatch_uid=f'touch_frame_{variant_model.__name__}_save')
+    post_delete.connect(touch_frame, sender=variant_model, dispatch_uid=f'touch_frame_{variant_model.__name__}_delete')
+
+
+@receiver(post_save, sender=Frame, dispatch_uid='frame_typeahead')
+def refresh_typeahead(sender, instance, **kwargs):
+    schedule_typeahead_refresh()
+
+
+@receiver(post_delete, sender=Frame, dispatch_uid='frame_tombstone')
+def record_frame_deletion(sender, instance, **kwargs):
+    # post_delete also fires for cascades, e.g. when the creating user is deleted
+    FrameTombstone.objects.create(frame_id=instance.pk)
+    schedule_typeahead_refresh()
+    if instance.sprite_sheet:
+        # Only once the delete commits; a rolled-back delete keeps its sheet
+        name = instance.sprite_sheet.name
+        transaction.on_commit(lambda: default_storage.delete(name))
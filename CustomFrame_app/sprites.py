@@ -0,0 +1,187 @@
+"""Per-frame sprite sheets of variant swatches.
+
+Every variant image of a frame is scaled down to fit a ``SPRITE_SWATCH_SIZE``
+box and shelf-packed into one WebP, so the configurator downloads a single
+image instead of one per option. ``Frame.sprite_map`` records where each swatch
+landed, keyed the same way as the nested variant lists in ``FrameSerializer``::
+
+    {"width": 392, "height": 196, "swatch": 96,
+     "color_variants": {"12": {"image": [0, 0, 96, 96], "corner_image": [98, 0, 96, 96]}}, ...}
+
+The file name carries a hash of the inputs, so an unchanged frame is not
+rebuilt and a changed one gets a new, cache-busting URL.
+
+Variant edits only set ``Frame.sprites_stale``; after commit they wake a
+per-process ``SpriteWorker`` thread that renders the stale sheets, so no
+request waits on PIL. ``manage.py build_sprites --stale`` does the same from
+cron and picks up anything a worker missed (e.g. a process that exited first).
+"""
+import hashlib
+import io
+import logging
+import math
+import threading
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from PIL import Image
+
+from CustomFrame_app.models import Frame
+
+logger = logging.getLogger(__name__)
+
+SPRITE_SWATCH_SIZE = 96
+SPRITE_PADDING = 2
+SPRITE_QUALITY = 85
+
+# (serializer key, related name, image fields) for every variant type with swatches
+SPRITE_SOURCES = (
+    ('color_variants', 'color_variants', ('image', 'corner_image')),
+    ('size_variants', 'size_variants', ('image', 'corner_image')),
+    ('finishing_variants', 'finishing_variants', ('image', 'corner_image')),
+    ('frameHanging_variant', 'frameHanging_variant', ('image',)),
+)
+
+
+def sprite_entries(frame):
+    entries = []
+    for key, related_name, fields in SPRITE_SOURCES:
+        for variant in sorted(getattr(frame, related_name).all(), key=lambda v: v.pk):
+            for field in fields:
+                image = getattr(variant, field)
+                if image:
+                    entries.append((key, str(variant.pk), field, image))
+    return entries
+
+
+def pack_shelves(sizes, padding=SPRITE_PADDING):
+    # Tallest first into rows no wider than a roughly square sheet; returns positions and sheet size.
+    if not sizes:
+        return [], (0, 0)
+    area = sum((w + padding) * (h + padding) for w, h in sizes)
+    sheet_width = max(max(w for w, h in sizes), math.ceil(math.sqrt(area)))
+    order = sorted(range(len(sizes)), key=lambda i: (-sizes[i][1], i))
+    positions = [None] * len(sizes)
+    x = y = shelf_height = used_width = 0
+    for i in order:
+        w, h = sizes[i]
+        if x and x + w > sheet_width:
+            y += shelf_height + padding
+            x = shelf_height = 0
+        positions[i] = (x, y)
+        used_width = max(used_width, x + w)
+        shelf_height = max(shelf_height, h)
+        x += w + padding
+    return positions, (used_width, y + shelf_height)
+
+
+def build_sprite_sheet(frame, force=False):
+    """Render and store the frame's sprite sheet; returns False when it was already current."""
+    entries = sprite_entries(frame)
+    digest = hashlib.sha1(
+        repr([(key, pk, field, image.name) for key, pk, field, image in entries]).encode()
+    ).hexdigest()[:12]
+    name = f"frame_sprites/frame_{frame.pk}_{digest}.webp" if entries else ''
+    if not force and (frame.sprite_sheet.name or '') == name:
+        return False
+
+    swatches = []
+    for key, pk, field, image in entries:
+        try:
+            with image.open('rb') as source, Image.open(source) as picture:
+                picture.thumbnail((SPRITE_SWATCH_SIZE, SPRITE_SWATCH_SIZE))
+                swatches.append((key, pk, field, picture.convert('RGBA')))
+        except (OSError, ValueError) as exc:
+            logger.warning("Skipping %s for frame %s sprite: %s", image.name, frame.pk, exc)
+
+    previous = frame.sprite_sheet.name
+    sprite_map = {}
+    if swatches:
+        positions, (width, height) = pack_shelves([picture.size for *_, picture in swatches])
+        sheet = Image.new('RGBA', (width, height), (0, 0, 0, 0))
+        sprite_map = {'width': width, 'height': height, 'swatch': SPRITE_SWATCH_SIZE}
+        for (key, pk, field, picture), (x, y) in zip(swatches, positions):
+            sheet.paste(picture, (x, y))
+            sprite_map.setdefault(key, {}).setdefault(pk, {})[field] = [x, y, *picture.size]
+        buffer = io.BytesIO()
+        sheet.save(buffer, 'WEBP', quality=SPRITE_QUALITY, method=4)
+        if default_storage.exists(name):
+            default_storage.delete(name)
+        name = default_storage.save(name, ContentFile(buffer.getvalue()))
+    else:
+        name = ''
+
+    Frame.objects.filter(pk=frame.pk).update(sprite_sheet=name, sprite_map=sprite_map, updated_at=timezone.now())
+    frame.sprite_sheet.name, frame.sprite_map = name, sprite_map
+    if previous and previous != name:
+        default_storage.delete(previous)
+    return True
+
+
+def rebuild_sprite_sheet(frame_id):
+    frame = Frame.objects.prefetch_related(*(related for _, related, _ in SPRITE_SOURCES)).filter(pk=frame_id).first()
+    return frame is not None and build_sprite_sheet(frame)
+
+
+def rebuild_stale_sprites():
+    """Render every frame marked stale; returns how many sheets were written."""
+    built = 0
+    for frame_id in list(Frame.objects.filter(sprites_stale=True).order_by('id').values_list('id', flat=True)):
+        # Claimed by clearing the flag first, so another worker skips it and an edit made
+        # while this one renders marks the frame stale again
+        if not Frame.objects.filter(pk=frame_id, sprites_stale=True).update(sprites_stale=False):
+            continue
+        try:
+            built += rebuild_sprite_sheet(frame_id)
+        except Exception:
+            logger.exception("Sprite sheet of frame %s failed; leaving it stale", frame_id)
+            Frame.objects.filter(pk=frame_id).update(sprites_stale=True)
+    return built
+
+
+class SpriteWorker:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.thread = None
+
+    def wake(self):
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.start()
+        self.wakeup.set()
+
+    def start(self):
+        # Started on first use, so each forked worker gets its own thread
+        self.thread = threading.Thread(target=self.run, name='sprite-rebuild', daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while True:
+            self.wakeup.wait()
+            self.wakeup.clear()
+            try:
+                rebuild_stale_sprites()
+            except Exception:
+                logger.exception("Sprite rebuild failed")
+            finally:
+                close_old_connections()
+
+
+worker = SpriteWorker()
+
+
+def schedule_sprite_rebuild():
+    # Wakes the worker once per transaction, after commit, for frames the caller marked stale.
+    # Callbacks queued on the connection are dropped on rollback, along with the stale flags.
+    connection = transaction.get_connection()
+    if any(getattr(callback, 'sprite_rebuild', False) for _, callback, _ in connection.run_on_commit):
+        return
+
+    def run():
+        worker.wake()
+
+    run.sprite_rebuild = True
+    transaction.on_commit(run)
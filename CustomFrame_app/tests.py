@@ -1,3 +1,993 @@
-from django.test import TestCase
+import asyncio
+import csv
+import io
+import json
+import itertools
+import math
+import os
+import random
+import tempfile
+import threading
+import time
+from base64 import b64encode
+from datetime import timedelta
+from decimal import Decimal
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import DatabaseError, connection, transaction
+from django.utils import timezone
+from django.test.utils import CaptureQueriesContext
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from rest_framework.exceptions import AuthenticationFailed
+from PIL import Image
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from CustomFrame_app import concurrency, sprites, typeahead
+from CustomFrame_app.authentication import ClaimsJWTAuthentication, add_token_claims
+from CustomFrame_app.concurrency import ConcurrencyLimiter
+from CustomFrame_app.cutlist import EPSILON, plan_group
+from CustomFrame_app.metrics import query_trace
+from CustomFrame_app.models import Login, LoginThrottle, Frame, PopularityCounter, Cart, CartItem, Order, ColorVariant, SizeVariant, \
+    FinishingVariant, FrameHangVariant, DailySalesRollup
+from CustomFrame_app.popularity import POPULARITY_FLUSH_MAX_KEYS, PopularityBuffer, rank_frames
+from CustomFrame_app.pricing import QUOTE_MAX_DIMENSION, PriceMatrix, parse_quote_rows
+from CustomFrame_app.profiling import list_reports, load_report, profile_path, profile_requested
+from CustomFrame_app.serializer import User_Serializer
+from CustomFrame_app.throttling import PRUNED_KEY, prune_buckets, take_token
+
+
+# Run with: python manage.py test --settings=CustomPhotoframe.test_settings
+class ShopTestCase(TestCase):
+    # A staff user, a customer and a frame, plus helpers for carts and JWT clients
+    def setUp(self):
+        cache.clear()
+        self.admin = Login.objects.create_user('admin', password='pw', is_staff=True)
+        self.customer = Login.objects.create_user('bob', password='pw', is_user=True, name='Bob Smith',
+                                                  email='bob@example.com')
+        self.frame = self.create_frame('Oak', Decimal('10.00'))
+
+    def create_frame(self, name, price):
+        return Frame.objects.create(
+            name=name, price=price, image=f'frames/{name}.png', corner_image=f'frames/corner/{name}.png',
+            inner_width=20, inner_height=30, moulding_width=2, created_by=self.admin,
+        )
+
+    def client_for(self, user=None):
+        client = APIClient(HTTP_ACCEPT_ENCODING='identity')
+        if user is not None:
+            token = add_token_claims(RefreshToken.for_user(user), user).access_token
+            client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        return client
+
+    def add_to_cart(self, user, frame=None, quantity=1, **variants):
+        cart, _ = Cart.objects.get_or_create(user=user)
+        return CartItem.objects.create(cart=cart, frame=frame or self.frame, quantity=quantity,
+                                       original_image='cart/original/photo.png', **variants)
+
+    def checkout(self, user, key='checkout-1'):
+        return self.client_for(user).post('/checkout/', {}, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRoutingTests(TestCase):
+    # The replica is a separate, unreplicated database, so rows created on the
+    # primary are only visible to reads that were routed there.
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        cache.clear()
+        self.admin = Login.objects.create_user('admin', password='pw', is_staff=True)
+        self.frame = Frame.objects.create(
+            name='Oak', price=10, image='frames/oak.png', corner_image='frames/corner/oak.png',
+            inner_width=20, inner_height=30, created_by=self.admin,
+        )
+
+    def admin_client(self, **credentials):
+        client = APIClient(**credentials)
+        client.force_authenticate(self.admin)
+        return client
+
+    def test_queries_outside_requests_use_primary(self):
+        self.assertEqual(Frame.objects.count(), 1)
+
+    def test_catalog_reads_go_to_replica(self):
+        response = APIClient().get('/frames/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), [])
+
+    def test_write_pins_client_to_primary(self):
+        client = self.admin_client()
+        self.assertEqual(client.get(f'/frames/{self.frame.id}/').status_code, 404)
+
+        response = client.put(f'/frames/{self.frame.id}/', {'name': 'Walnut'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('db_pin', response.cookies)
+
+        response = client.get(f'/frames/{self.frame.id}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['name'], 'Walnut')
+
+    def test_pin_follows_credentials_without_cookies(self):
+        self.admin_client(HTTP_AUTHORIZATION='Bearer token-a').put(
+            f'/frames/{self.frame.id}/', {'name': 'Walnut'}, format='json'
+        )
+        self.assertEqual(self.admin_client(HTTP_AUTHORIZATION='Bearer token-a').get(
+            f'/frames/{self.frame.id}/').status_code, 200)
+        self.assertEqual(self.admin_client(HTTP_AUTHORIZATION='Bearer token-b').get(
+            f'/frames/{self.frame.id}/').status_code, 404)
+
+    @override_settings(REPLICA_PIN_SECONDS=0)
+    def test_pin_expires(self):
+        client = self.admin_client(HTTP_AUTHORIZATION='Bearer token-a')
+        client.put(f'/frames/{self.frame.id}/', {'name': 'Walnut'}, format='json')
+        self.assertEqual(client.get(f'/frames/{self.frame.id}/').status_code, 404)
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_nothing_is_pinned_without_replicas(self):
+        with mock.patch('CustomFrame_app.routers.cache') as pin_cache:
+            response = self.admin_client(HTTP_AUTHORIZATION='Bearer token-a').put(
+                f'/frames/{self.frame.id}/', {'name': 'Walnut'}, format='json'
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('db_pin', response.cookies)
+        self.assertEqual(pin_cache.mock_calls, [])
+
+
+class ClaimsJWTAuthenticationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_user_is_built_from_claims(self):
+        user = Login.objects.create_user('bob', password='pw', is_user=True)
+        token = add_token_claims(RefreshToken.for_user(user), user).access_token
+        authenticated = ClaimsJWTAuthentication().get_user(token)
+        self.assertEqual(authenticated.pk, user.pk)
+        self.assertEqual(authenticated.username, 'bob')
+        self.assertTrue(authenticated.is_active)
+        self.assertTrue(authenticated.is_user)
+        self.assertFalse(authenticated.is_staff)
+        self.assertFalse(authenticated.is_superuser)
+
+    def test_blocking_revokes_tokens_once_committed(self):
+        user = Login.objects.create_user('bob', password='pw', is_user=True)
+        token = add_token_claims(RefreshToken.for_user(user), user).access_token
+        ClaimsJWTAuthentication().get_user(token)
+
+        with self.assertRaises(DatabaseError), transaction.atomic():
+            user.is_blocked = True
+            user.save()
+            raise DatabaseError
+        self.assertEqual(ClaimsJWTAuthentication().get_user(token).pk, user.pk)
+
+        user = Login.objects.get(pk=user.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            user.is_blocked = True
+            user.save()
+        with self.assertRaises(AuthenticationFailed):
+            ClaimsJWTAuthentication().get_user(token)
+
+    def test_metrics_accept_basic_auth(self):
+        Login.objects.create_user('prometheus', password='scrape', is_staff=True)
+        Login.objects.create_user('bob', password='pw', is_user=True)
+        for username, password, expected in (('prometheus', 'scrape', 200), ('prometheus', 'nope', 401),
+                                             ('bob', 'pw', 403)):
+            client = APIClient(HTTP_ACCEPT_ENCODING='identity')
+            client.credentials(HTTP_AUTHORIZATION='Basic ' + b64encode(f'{username}:{password}'.encode()).decode())
+            self.assertEqual(client.get('/metrics').status_code, expected, username)
+
+
+def brute_force_bars(lengths, stock_length, kerf):
+    # Fewest bars over every assignment of pieces to bars
+    best = len(lengths)
+    for assignment in itertools.product(range(len(lengths)), repeat=len(lengths)):
+        used = [0.0] * len(lengths)
+        for length, bar in zip(lengths, assignment):
+            used[bar] += length + kerf
+        if all(total <= stock_length + kerf + EPSILON for total in used):
+            best = min(best, len(set(assignment)))
+    return best
+
+
+class CutListPackingTests(SimpleTestCase):
+    def assertValidPlan(self, plan, lengths, stock_length, kerf):
+        cuts = sorted(cut['length'] for bar in plan['bars'] for cut in bar['cuts'])
+        self.assertEqual(cuts, sorted(round(length, 3) for length in lengths))
+        for bar in plan['bars']:
+            self.assertGreaterEqual(bar['offcut'], -EPSILON)
+
+    def test_exact_packing_matches_brute_force(self):
+        rng = random.Random(31)
+        for _ in range(60):
+            stock_length = rng.choice([100.0, 120.0, 300.0])
+            kerf = rng.choice([0.0, 0.3, 2.0])
+            lengths = [round(rng.uniform(10, stock_length), 1) for _ in range(rng.randint(1, 6))]
+            pieces = [(length, index) for index, length in enumerate(lengths)]
+            expected = brute_force_bars(lengths, stock_length, kerf)
+
+            plan = plan_group(pieces, stock_length, kerf, exact=True)
+            self.assertTrue(plan['optimal'])
+            self.assertEqual(plan['bars_used'], expected)
+            self.assertValidPlan(plan, lengths, stock_length, kerf)
+
+            heuristic = plan_group(pieces, stock_length, kerf)
+            self.assertGreaterEqual(heuristic['bars_used'], expected)
+            self.assertValidPlan(heuristic, lengths, stock_length, kerf)
+            if heuristic['optimal']:
+                self.assertEqual(heuristic['bars_used'], expected)
+
+    def test_oversized_pieces_are_set_aside(self):
+        plan = plan_group([(50.0, 1), (301.0, 2)], 300.0, 0.3)
+        self.assertEqual(plan['bars_used'], 1)
+        self.assertEqual(plan['oversized'], [{'length': 301.0, 'order_item': 2}])
+
+    def test_non_finite_lengths_are_rejected(self):
+        for stock_length, kerf in ((math.nan, 0.3), (math.inf, 0.3), (300.0, math.nan), (300.0, math.inf)):
+            with self.assertRaises(ValueError):
+                plan_group([(50.0, 1)], stock_length, kerf)
+        with self.assertRaises(ValueError):
+            plan_group([(math.nan, 1)], 300.0, 0.3)
+
+
+class PopularityTests(TestCase):
+    def setUp(self):
+        self.admin = Login.objects.create_user('admin', password='pw', is_staff=True)
+        self.frames = [
+            Frame.objects.create(name=name, price=10, image='frames/f.png', corner_image='frames/corner/f.png',
+                                 inner_width=20, inner_height=30, created_by=self.admin)
+            for name in ('Oak', 'Ash', 'Elm')
+        ]
+
+    def test_buffer_merges_rows_until_flushed(self):
+        buffer = PopularityBuffer()
+        with mock.patch.object(buffer, 'start') as start:
+            buffer.add([([('frame', 1), ('size', 7)], 1, 0, 2.0)])
+            buffer.add([([('frame', 1)], 0, 3, 6.0)])
+        start.assert_called()
+        self.assertEqual(buffer.pending, {('frame', 1): [1, 3, 8.0], ('size', 7): [1, 0, 2.0]})
+        self.assertFalse(buffer.wakeup.is_set())
+
+        with mock.patch.object(PopularityCounter, 'apply') as apply, \
+                mock.patch('CustomFrame_app.popularity.rank_frames'):
+            buffer.flush()
+        apply.assert_called_once_with({('frame', 1): [1, 3, 8.0], ('size', 7): [1, 0, 2.0]})
+        self.assertEqual(buffer.pending, {})
+
+    def test_full_buffer_wakes_the_flusher(self):
+        buffer = PopularityBuffer()
+        rows = [([('frame', pk)], 1, 0, 1.0) for pk in range(POPULARITY_FLUSH_MAX_KEYS)]
+        with mock.patch.object(buffer, 'start'):
+            buffer.add(rows)
+        self.assertTrue(buffer.wakeup.is_set())
+
+    def test_failed_flush_keeps_the_counts(self):
+        buffer = PopularityBuffer()
+        buffer.pending = {('frame', 1): [1, 0, 1.0]}
+        with mock.patch.object(PopularityCounter, 'apply', side_effect=DatabaseError), \
+                self.assertLogs('CustomFrame_app.popularity', 'ERROR'):
+            buffer.flush()
+        self.assertEqual(buffer.pending, {('frame', 1): [1, 0, 1.0]})
+
+    def test_apply_adds_to_existing_counters(self):
+        PopularityCounter.apply({('frame', 1): (1, 0, 1.5), ('color', 2): (0, 2, 4.0)})
+        PopularityCounter.apply({('frame', 1): (2, 1, 0.5)})
+        counters = {(c.kind, c.object_id): (c.cart_adds, c.units_ordered, c.score)
+                    for c in PopularityCounter.objects.all()}
+        self.assertEqual(counters, {('frame', 1): (3, 1, 2.0), ('color', 2): (0, 2, 4.0)})
+
+    def test_rank_frames_orders_by_score(self):
+        oak, ash, elm = self.frames
+        PopularityCounter.apply({('frame', oak.pk): (1, 0, 1.0), ('frame', ash.pk): (1, 0, 5.0),
+                                 ('frame', 999): (1, 0, 9.0)})
+        rank_frames()
+        ranks = dict(Frame.objects.values_list('pk', 'popularity_rank'))
+        self.assertEqual(ranks, {ash.pk: 1, oak.pk: 2, elm.pk: None})
+
+        PopularityCounter.apply({('frame', elm.pk): (1, 0, 3.0)})
+        PopularityCounter.objects.filter(kind='frame', object_id=ash.pk).delete()
+        rank_frames()
+        ranks = dict(Frame.objects.values_list('pk', 'popularity_rank'))
+        self.assertEqual(ranks, {elm.pk: 1, oak.pk: 2, ash.pk: None})
+
+
+class ConcurrencyLimiterTests(SimpleTestCase):
+    def wait_for_queue(self, limiter, length):
+        deadline = time.monotonic() + 5
+        while len(limiter.waiters) < length:
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.001)
+
+    def test_slots_are_handed_over_in_arrival_order(self):
+        limiter = ConcurrencyLimiter('uploads', limit=1, queue=2, timeout=5, retry_after=1)
+        self.assertTrue(limiter.acquire())
+        admitted = []
+
+        def request(name):
+            if limiter.acquire():
+                admitted.append(name)
+                limiter.release()
+
+        threads = []
+        for name in ('first', 'second'):
+            thread = threading.Thread(target=request, args=(name,))
+            thread.start()
+            threads.append(thread)
+            self.wait_for_queue(limiter, len(threads))
+        self.assertFalse(limiter.acquire())  # the queue is full
+
+        limiter.release()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(admitted, ['first', 'second'])
+        self.assertEqual((limiter.active, len(limiter.waiters)), (0, 0))
+
+    def test_waiter_gives_up_after_the_timeout(self):
+        limiter = ConcurrencyLimiter('uploads', limit=1, queue=1, timeout=0.01, retry_after=1)
+        self.assertTrue(limiter.acquire())
+        self.assertFalse(limiter.acquire())
+        self.assertEqual((limiter.active, len(limiter.waiters)), (1, 0))
+        limiter.release()
+        self.assertTrue(limiter.acquire())
+
+    def test_cancelled_waiter_leaves_the_queue(self):
+        limiter = ConcurrencyLimiter('uploads', limit=1, queue=1, timeout=5, retry_after=1)
+
+        async def scenario():
+            self.assertTrue(await limiter.aacquire())
+            waiting = asyncio.create_task(limiter.aacquire())
+            await asyncio.sleep(0)
+            self.assertEqual(len(limiter.waiters), 1)
+            waiting.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await waiting
+            self.assertEqual((limiter.active, len(limiter.waiters)), (1, 0))
+
+            # Cancelled after the slot was handed over: the slot is released, not leaked
+            waiting = asyncio.create_task(limiter.aacquire())
+            await asyncio.sleep(0)
+            limiter.release()
+            waiting.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await waiting
+            self.assertEqual((limiter.active, len(limiter.waiters)), (0, 0))
+
+        asyncio.run(scenario())
+
+    def test_metric_lines_carry_the_worker(self):
+        with mock.patch.dict(concurrency.limiters, clear=True):
+            concurrency.limiters['uploads'] = ConcurrencyLimiter('uploads', limit=4, retry_after=1)
+            lines = concurrency.metric_lines()
+        self.assertIn(f'http_concurrency_limit{{pool="uploads",worker="{os.getpid()}"}} 4', lines)
+
+
+class RequestProfilingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        self.root = Path(root.name)
+        overrides = override_settings(PROFILE_ROOT=self.root)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.admin = Login.objects.create_user('admin', password='pw', is_staff=True)
+        self.customer = Login.objects.create_user('bob', password='pw', is_user=True)
+
+    def client_for(self, user):
+        client = APIClient(HTTP_ACCEPT_ENCODING='identity')
+        token = add_token_claims(RefreshToken.for_user(user), user).access_token
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        return client
+
+    def test_flag_must_be_an_explicit_true_value(self):
+        factory = RequestFactory()
+        for value, expected in (('1', True), ('true', True), ('On', True), ('0', False), ('false', False), ('', False)):
+            self.assertEqual(profile_requested(factory.get('/', HTTP_X_PROFILE=value)), expected, value)
+            self.assertEqual(profile_requested(factory.get('/', {'_profile': value})), expected, value)
+
+    def test_only_staff_requests_are_reported(self):
+        with mock.patch('CustomFrame_app.profiling.start_profiler') as start:
+            for client in (APIClient(), self.client_for(self.customer)):
+                response = client.get('/frames/', HTTP_X_PROFILE='1')
+                self.assertNotIn('X-Profile-Id', response)
+        start.assert_not_called()
+        self.assertEqual(list_reports(), [])
+
+        response = self.client_for(self.admin).get('/frames/', HTTP_X_PROFILE='1')
+        report = load_report(response['X-Profile-Id'])
+        self.assertEqual(report['user'], 'admin')
+        self.assertEqual(report['status'], 200)
+        self.assertEqual([entry['id'] for entry in list_reports()], [report['id']])
+
+    def test_streamed_response_is_reported_once_sent(self):
+        response = self.client_for(self.admin).get('/users/export/', HTTP_X_PROFILE='1')
+        profile_id = response['X-Profile-Id']
+        self.assertFalse(profile_path(profile_id, '.json').exists())
+
+        body = b''.join(response.streaming_content)
+        response.close()
+        self.assertIn(b'bob', body)
+        report = load_report(profile_id)
+        self.assertTrue(any('is_user' in query['sql'] for query in report['queries']))
+
+    def test_serializers_run_inside_a_query_trace(self):
+        trace = []
+        with query_trace(trace):
+            data = User_Serializer(self.customer).data
+        self.assertEqual(data['username'], 'bob')
+
+    def test_partial_reports_are_not_listed(self):
+        self.root.mkdir(exist_ok=True)
+        (self.root / 'late.json.tmp').write_text('{"id": ')
+        self.client_for(self.admin).get('/frames/', HTTP_X_PROFILE='1')
+        self.assertEqual(len(list_reports()), 1)
+        self.assertEqual(sorted(path.name for path in self.root.glob('*.tmp')), ['late.json.tmp'])
+
+
+class QuotePricingTests(TestCase):
+    def setUp(self):
+        admin = Login.objects.create_user('admin', password='pw', is_staff=True)
+        self.frame = Frame.objects.create(
+            name='Oak', price=Decimal('49.99'), image='frames/oak.png', corner_image='frames/corner/oak.png',
+            inner_width=20, inner_height=30, moulding_width=2.5, created_by=admin,
+        )
+        self.other = Frame.objects.create(
+            name='Ash', price=20, image='frames/ash.png', corner_image='frames/corner/ash.png',
+            inner_width=40, inner_height=50, created_by=admin,
+        )
+        self.variants = {
+            'color_variant': ColorVariant.objects.create(frame=self.frame, color_name='Black', image='c.png',
+                                                         corner_image='cc.png', price=Decimal('10.10')),
+            'size_variant': SizeVariant.objects.create(frame=self.frame, size_name='A3', inner_width=29.7,
+                                                       inner_height=42, price=Decimal('12.35')),
+            'finish_variant': FinishingVariant.objects.create(frame=self.frame, finish_name='Matte', image='f.png',
+                                                              corner_image='fc.png', price=Decimal('0.35')),
+            'hanging_variant': FrameHangVariant.objects.create(frame=self.frame, hanging_name='Wire', image='h.png',
+                                                               price=Decimal('3.33')),
+        }
+
+    def quote(self, matrix, items):
+        columns, errors = parse_quote_rows(items)
+        self.assertEqual(errors, {})
+        vectorized = matrix.quote(columns)
+        scalar = matrix.quote_rows(columns)
+        # The NumPy path and the fallback agree, except on prices of rows that are rejected anyway
+        self.assertEqual(scalar[3], vectorized[3])
+        if not vectorized[3]:
+            self.assertEqual(scalar, vectorized)
+        return vectorized
+
+    def test_quote_matches_cart_unit_price_for_every_variant_combination(self):
+        matrix = PriceMatrix()
+        items, expected = [], []
+        for chosen in itertools.product(*[(None, variant) for variant in self.variants.values()]):
+            combination = dict(zip(self.variants, chosen))
+            items.append({'frame': self.frame.pk,
+                          **{field: variant.pk for field, variant in combination.items() if variant}})
+            expected.append(int(CartItem(frame=self.frame, **combination).unit_price() * 100))
+        cents, _, _, invalid = self.quote(matrix, items)
+        self.assertEqual(len(items), 16)
+        self.assertEqual(cents, expected)
+        self.assertEqual(invalid, [])
+
+    def test_custom_size_scales_the_list_price(self):
+        matrix = PriceMatrix()
+        cents, widths, heights, _ = self.quote(matrix, [
+            {'frame': self.frame.pk, 'width': 20, 'height': 30},
+            {'frame': self.frame.pk, 'width': 40, 'height': 60},
+            {'frame': self.frame.pk, 'width': 40, 'height': 60, 'color_variant': self.variants['color_variant'].pk},
+        ])
+        self.assertEqual(cents[0], 4999)
+        self.assertGreater(cents[1], cents[0])
+        self.assertEqual(cents[2], cents[1] + 1010)
+        self.assertEqual((widths, heights), ([20, 40, 40], [30, 60, 60]))
+
+    def test_variants_of_another_frame_are_invalid(self):
+        matrix = PriceMatrix()
+        _, _, _, invalid = self.quote(matrix, [
+            {'frame': self.other.pk},
+            {'frame': self.other.pk, 'finish_variant': self.variants['finish_variant'].pk},
+            {'frame': 10 ** 9},
+        ])
+        self.assertEqual(invalid, [1, 2])
+
+    def test_rows_are_parsed_strictly(self):
+        rows = [
+            {'frame': 1.7}, {'frame': True}, {'frame': '3'}, {'frame': 1, 'quantity': 2.5},
+            {'frame': 1, 'color_variant': False}, {'frame': 1, 'width': True, 'height': 10},
+            {'frame': 1, 'width': 10, 'height': None}, {'frame': 1, 'height': 10},
+            {'frame': 1, 'width': 10, 'height': 10, 'size_variant': 2},
+            {'frame': 1, 'width': float('nan'), 'height': 10}, {'frame': 0},
+            {'frame': 2.0, 'quantity': 3, 'color_variant': None},
+        ]
+        columns, errors = parse_quote_rows(rows)
+        numbers = "ids and quantity must be integers, width and height numbers"
+        together = "width and height must be given together"
+        self.assertEqual(errors, {
+            0: numbers, 1: numbers, 2: numbers, 3: numbers, 4: numbers, 5: numbers, 6: together, 7: together,
+            8: "give either a size_variant or a width and height, not both",
+            9: f"width and height must be between 0 and {QUOTE_MAX_DIMENSION}", 10: "ids must be positive",
+        })
+        self.assertEqual((columns['frame'], columns['quantity'], columns['color_variant']), ([2], [3], [0]))
+
+    def test_quote_endpoint(self):
+        client = APIClient(HTTP_ACCEPT_ENCODING='identity')
+        response = client.post('/quotes/', {'items': [
+            {'frame': self.frame.pk, 'size_variant': self.variants['size_variant'].pk, 'quantity': 2},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['items'][0]['unit_price'], '62.34')
+        self.assertEqual(response.json()['total'], '124.68')
+
+        response = client.post('/quotes/', {'items': [{'frame': self.frame.pk, 'width': 10, 'height': None}]},
+                               format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class CheckoutTests(ShopTestCase):
+    def test_replayed_key_returns_the_same_order(self):
+        self.add_to_cart(self.customer, quantity=2)
+        first = self.checkout(self.customer)
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(len(first.json()['items']), 1)
+
+        self.add_to_cart(self.customer)
+        replay = self.checkout(self.customer)
+        self.assertEqual(replay.status_code, 200)
+        self.assertEqual(replay.json()['id'], first.json()['id'])
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(CartItem.objects.count(), 1)
+
+    def test_empty_cart_is_rejected(self):
+        response = self.checkout(self.customer)
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.exists())
+
+    def test_totals_use_current_prices(self):
+        color = ColorVariant.objects.create(frame=self.frame, color_name='Black', image='c.png', corner_image='cc.png',
+                                            price=Decimal('2.50'))
+        self.add_to_cart(self.customer, quantity=3, color_variant=color)
+        Frame.objects.filter(pk=self.frame.pk).update(price=Decimal('12.00'))
+
+        response = self.checkout(self.customer)
+        self.assertEqual(response.status_code, 201)
+        order = Order.objects.get()
+        self.assertEqual(order.total_amount, Decimal('43.50'))
+        self.assertEqual(order.items.get().total_price, Decimal('43.50'))
+
+    def test_malformed_keys_are_rejected(self):
+        self.add_to_cart(self.customer)
+        client = self.client_for(self.customer)
+        for body in ({'idempotency_key': 5}, {'idempotency_key': {'a': 1}}, {'idempotency_key': 'k' * 65}, [1, 2]):
+            self.assertEqual(client.post('/checkout/', body, format='json').status_code, 400, body)
+        self.assertFalse(Order.objects.exists())
+
+
+@override_settings(LOGIN_THROTTLE_RATES={'ip': (3, 60), 'username': (2, 30)})
+class LoginThrottleTests(ShopTestCase):
+    def test_bucket_rejects_when_empty_and_refills(self):
+        now = timezone.now()
+        with mock.patch('CustomFrame_app.throttling.timezone.now', return_value=now):
+            self.assertIsNone(take_token('user:bob', 2, 30))
+            self.assertIsNone(take_token('user:bob', 2, 30))
+            self.assertAlmostEqual(take_token('user:bob', 2, 30), 2.0)
+            self.assertAlmostEqual(take_token('user:bob', 2, 30), 2.0)
+        self.assertEqual(LoginThrottle.objects.get(key='user:bob').rejected_count, 2)
+
+        with mock.patch('CustomFrame_app.throttling.timezone.now', return_value=now + timedelta(seconds=2)):
+            self.assertIsNone(take_token('user:bob', 2, 30))
+            self.assertIsNotNone(take_token('user:bob', 2, 30))
+        self.assertEqual(LoginThrottle.objects.get(key='user:bob').rejected_count, 3)
+
+    def test_login_endpoint_is_throttled_per_username(self):
+        client = self.client_for()
+        statuses = [client.post('/login/', {'username': 'bob', 'password': 'wrong'}, format='json').status_code
+                    for _ in range(3)]
+        self.assertEqual(statuses, [401, 401, 429])
+        stats = self.client_for(self.admin).get('/login/throttle/').json()
+        self.assertEqual(stats['rejected'], 1)
+        self.assertEqual(stats['top_rejected'], [{'key': 'user:bob', 'rejected': 1}])
+
+    def test_non_object_body_is_a_bad_request(self):
+        response = self.client_for().post('/login/', [1, 2], format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_refilled_buckets_are_pruned_and_keep_their_rejections(self):
+        now = timezone.now()
+        LoginThrottle.objects.create(key='ip:1.2.3.4', tokens=0, updated_at=now - timedelta(seconds=30),
+                                     rejected_count=4)
+        LoginThrottle.objects.create(key='user:old', tokens=0, updated_at=now - timedelta(minutes=5),
+                                     rejected_count=2)
+        LoginThrottle.objects.create(key='user:recent', tokens=0, updated_at=now - timedelta(seconds=2))
+        self.assertEqual(prune_buckets(now), 2)
+        remaining = dict(LoginThrottle.objects.values_list('key', 'rejected_count'))
+        self.assertEqual(remaining, {'user:recent': 0, PRUNED_KEY: 6})
+
+        stats = self.client_for(self.admin).get('/login/throttle/').json()
+        self.assertEqual((stats['buckets'], stats['rejected']), (1, 6))
+
+
+def png_upload(name):
+    buffer = io.BytesIO()
+    Image.new('RGB', (8, 8), (200, 180, 160)).save(buffer, 'PNG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+
+class CartBatchTests(ShopTestCase):
+    def setUp(self):
+        super().setUp()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        overrides = override_settings(MEDIA_ROOT=media.name)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.color = ColorVariant.objects.create(frame=self.frame, color_name='Black', image='c.png',
+                                                 corner_image='cc.png', price=Decimal('2.00'))
+
+    def batch(self, creates=(), updates=(), deletes=()):
+        data = {'create': json.dumps([{'frame': self.frame.pk, 'color_variant': self.color.pk, 'image_key': f'img{i}'}
+                                      for i in range(creates)] if isinstance(creates, int) else list(creates)),
+                'update': json.dumps(list(updates)), 'delete': json.dumps(list(deletes))}
+        for i in range(creates if isinstance(creates, int) else 0):
+            data[f'img{i}_original_image'] = png_upload(f'o{i}.png')
+            data[f'img{i}_adjusted_image'] = png_upload(f'a{i}.png')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client_for(self.customer).post('/cart/batch/', data, format='multipart')
+        return response, len(queries)
+
+    def test_query_count_does_not_grow_with_the_batch(self):
+        Login.cached_token_version(self.customer.pk)  # the first request would otherwise also load it
+        counts = []
+        for size in (1, 6):
+            items = [self.add_to_cart(self.customer) for _ in range(2 * size)]
+            updates = [{'id': item.pk, 'quantity': 3, 'color_variant': self.color.pk} for item in items[:size]]
+            response, queries = self.batch(size, updates, [item.pk for item in items[size:]])
+            self.assertEqual(response.status_code, 200, response.content)
+            self.assertEqual(len(response.json()['created']), size)
+            counts.append(queries)
+        self.assertEqual(counts[0], counts[1])
+        self.assertEqual(CartItem.objects.filter(quantity=3).count(), 7)
+
+    def test_one_invalid_line_rolls_back_the_batch(self):
+        keep, drop = self.add_to_cart(self.customer), self.add_to_cart(self.customer)
+        other = self.create_frame('Ash', Decimal('5.00'))
+        response, _ = self.batch(
+            [{'frame': other.pk, 'color_variant': self.color.pk, 'image_key': 'img0'}],
+            [{'id': keep.pk, 'quantity': 4}], [drop.pk],
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['errors']['create'][0]['index'], 0)
+        self.assertEqual(sorted(CartItem.objects.values_list('pk', 'quantity')), [(keep.pk, 1), (drop.pk, 1)])
+
+    def test_non_object_body_is_a_bad_request(self):
+        response = self.client_for(self.customer).post('/cart/batch/', [1, 2], format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class SpriteSheetTests(ShopTestCase):
+    def setUp(self):
+        super().setUp()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        overrides = override_settings(MEDIA_ROOT=media.name)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+    def add_variant(self, color='Black'):
+        return ColorVariant.objects.create(frame=self.frame, color_name=color, image=png_upload('c.png'),
+                                           corner_image=png_upload('cc.png'), price=Decimal('2.00'))
+
+    def test_variant_edit_marks_the_sheet_stale_without_rendering(self):
+        with mock.patch.object(sprites, 'worker') as worker, \
+                self.captureOnCommitCallbacks(execute=True), transaction.atomic():
+            self.add_variant('Black')
+            self.add_variant('White')
+        worker.wake.assert_called_once_with()
+        self.frame.refresh_from_db()
+        self.assertTrue(self.frame.sprites_stale)
+        self.assertFalse(self.frame.sprite_sheet)
+
+        self.assertEqual(sprites.rebuild_stale_sprites(), 1)
+        self.frame.refresh_from_db()
+        self.assertFalse(self.frame.sprites_stale)
+        self.assertTrue(default_storage.exists(self.frame.sprite_sheet.name))
+        self.assertEqual(len(self.frame.sprite_map['color_variants']), 2)
+        self.assertEqual(sprites.rebuild_stale_sprites(), 0)
+
+    def test_failed_build_leaves_the_frame_stale(self):
+        self.add_variant()
+        with mock.patch.object(sprites, 'build_sprite_sheet', side_effect=OSError('disk full')), \
+                self.assertLogs('CustomFrame_app.sprites', 'ERROR'):
+            self.assertEqual(sprites.rebuild_stale_sprites(), 0)
+        self.assertTrue(Frame.objects.get(pk=self.frame.pk).sprites_stale)
+
+    def test_sheet_is_deleted_only_when_the_frame_delete_commits(self):
+        self.add_variant()
+        sprites.rebuild_stale_sprites()
+        name = Frame.objects.get(pk=self.frame.pk).sprite_sheet.name
+        with self.captureOnCommitCallbacks() as callbacks:
+            with self.assertRaises(DatabaseError), transaction.atomic():
+                Frame.objects.get(pk=self.frame.pk).delete()
+                raise DatabaseError
+        self.assertEqual(callbacks, [])
+        self.assertTrue(default_storage.exists(name))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Frame.objects.get(pk=self.frame.pk).delete()
+        self.assertFalse(default_storage.exists(name))
+
+
+class TypeaheadTests(ShopTestCase):
+    def setUp(self):
+        super().setUp()
+        self.index = typeahead.TypeaheadIndex()
+        patcher = mock.patch('CustomFrame_app.views.typeahead_index', self.index)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.dark = self.create_frame('Dark Oak', Decimal('12.00'))
+        ColorVariant.objects.create(frame=self.frame, color_name='Oak Brown', image='c.png', price=Decimal('1.00'))
+
+    def names(self, query):
+        response = self.client_for().get('/frames/autocomplete/', {'q': query})
+        self.assertEqual(response.status_code, 200)
+        return [(result['type'], result['name']) for result in response.json()['results']]
+
+    def test_search_reads_only_the_in_memory_index(self):
+        self.index.refresh()
+        with self.assertNumQueries(0):
+            names = self.names('OAK')
+        # Exact name first, then names starting with the query, then later words
+        self.assertEqual(names, [('frame', 'Oak'), ('color', 'Oak Brown'), ('frame', 'Dark Oak')])
+        self.assertEqual(self.names('brown'), [('color', 'Oak Brown')])
+        self.assertEqual(self.names('  '), [])
+
+    def test_refresh_picks_up_renames_and_deletions(self):
+        self.index.refresh()
+        Frame.objects.filter(pk=self.dark.pk).update(name='Dark Ash', updated_at=timezone.now())
+        self.frame.delete()
+        self.assertEqual(self.names('oak'), [('frame', 'Oak'), ('color', 'Oak Brown'), ('frame', 'Dark Oak')])
+        self.index.refresh()
+        self.assertEqual(self.names('oak'), [])
+        self.assertEqual(self.names('ash'), [('frame', 'Dark Ash')])
+
+    def test_changes_wake_the_refresher_after_commit(self):
+        with mock.patch.object(typeahead.index, 'wakeup') as wakeup:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.create_frame('Walnut', Decimal('9.00'))
+        wakeup.set.assert_called_once_with()
+
+    def test_first_request_starts_one_refresher_thread(self):
+        with mock.patch('CustomFrame_app.typeahead.threading.Thread') as thread, \
+                mock.patch.object(typeahead.index, 'thread', None), \
+                override_settings(TYPEAHEAD_BACKGROUND_REFRESH=True):
+            thread.return_value.is_alive.return_value = True
+            self.client_for().get('/frames/autocomplete/', {'q': 'oak'})
+            self.client_for().get('/frames/autocomplete/', {'q': 'oak'})
+        thread.assert_called_once_with(target=typeahead.index.run, name='typeahead-refresh', daemon=True)
+        thread.return_value.start.assert_called_once_with()
+
+
+class CartSummaryTests(ShopTestCase):
+    def test_unchanged_cart_is_not_modified(self):
+        client = self.client_for(self.customer)
+        response = client.get('/cart/summary/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['lines'], 0)
+        etag = response['ETag']
+        self.assertEqual(client.get('/cart/summary/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.add_to_cart(self.customer, quantity=2)
+        response = client.get('/cart/summary/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual((response.json()['lines'], response.json()['quantity']), (1, 2))
+
+
+class SalesRollupTests(ShopTestCase):
+    def setUp(self):
+        super().setUp()
+        self.color = ColorVariant.objects.create(frame=self.frame, color_name='Black', image='c.png',
+                                                 corner_image='cc.png', price=Decimal('2.00'))
+
+    def place_order(self, key):
+        self.add_to_cart(self.customer, quantity=2, color_variant=self.color)
+        self.add_to_cart(self.customer, quantity=1)
+        response = self.checkout(self.customer, key)
+        self.assertEqual(response.status_code, 201)
+        return response.json()['id']
+
+    def rollups(self):
+        return sorted(DailySalesRollup.objects.values_list('variant_key', 'line_count', 'quantity', 'revenue'))
+
+    def test_checkout_adds_and_cancelling_subtracts(self):
+        first = self.place_order('k1')
+        self.place_order('k2')
+        self.assertEqual(self.rollups(), [
+            ('0-0-0-0', 2, 2, Decimal('20.00')),
+            (f'{self.color.pk}-0-0-0', 2, 4, Decimal('48.00')),
+        ])
+        response = self.client_for(self.admin).get('/orders/rollups/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), 2)
+
+        response = self.client_for(self.admin).put(f'/orders/admin/{first}/', {'status': 'cancelled'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.rollups(), [
+            ('0-0-0-0', 1, 1, Decimal('10.00')),
+            (f'{self.color.pk}-0-0-0', 1, 2, Decimal('24.00')),
+        ])
+
+    def test_disallowed_transitions_are_rejected(self):
+        shipped, pending = self.place_order('k1'), self.place_order('k2')
+        Order.objects.filter(pk=shipped).update(status='shipped')
+        client = self.client_for(self.admin)
+
+        response = client.put(f'/orders/admin/{shipped}/', {'status': 'cancelled'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        response = client.post('/orders/admin/transition/', {'ids': [shipped, pending, 999], 'status': 'cancelled'},
+                               format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['succeeded'], [pending])
+        self.assertEqual([item['id'] for item in response.json()['rejected']], [shipped, 999])
+        self.assertEqual(dict(Order.objects.values_list('id', 'status')), {shipped: 'shipped', pending: 'cancelled'})
+
+        # Only the pending order's lines come out, and cancelling it again changes nothing
+        remaining = [('0-0-0-0', 1, 1, Decimal('10.00')), (f'{self.color.pk}-0-0-0', 1, 2, Decimal('24.00'))]
+        self.assertEqual(self.rollups(), remaining)
+        response = client.post('/orders/admin/transition/', {'ids': [pending], 'status': 'cancelled'}, format='json')
+        self.assertEqual(response.json()['rejected'][0]['id'], pending)
+        response = client.put(f'/orders/admin/{pending}/', {'status': 'pending'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.rollups(), remaining)
+
+
+class UserSearchExportTests(ShopTestCase):
+    def setUp(self):
+        super().setUp()
+        Login.objects.create_user('carol', password='pw', is_user=True, name='Carol Smithers', email='carol@shop.test')
+        Login.objects.create_user('dave', password='pw', is_user=True, name='=HYPERLINK("http://x")',
+                                  address='@SUM(A1)', phone='+44 20 7946 0000')
+
+    def test_search_matches_customers_only(self):
+        client = self.client_for(self.admin)
+        usernames = lambda **params: sorted(user['username'] for user in client.get('/users/', params).json())
+        self.assertEqual(usernames(search='smith'), ['bob', 'carol'])
+        self.assertEqual(usernames(search='SMITH', match='prefix'), [])
+        self.assertEqual(usernames(search='car', match='prefix'), ['carol'])
+        self.assertEqual(usernames(search='admin'), [])
+        self.assertEqual(usernames(), ['bob', 'carol', 'dave'])
+
+    def export(self, **params):
+        response = self.client_for(self.admin).get('/users/export/', params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        return list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode())))
+
+    def test_export_streams_csv_with_formulas_escaped(self):
+        rows = self.export()
+        self.assertEqual(rows[0], ['id', 'username', 'name', 'email', 'phone', 'address', 'is_blocked', 'date_joined'])
+        self.assertEqual([row[1] for row in rows[1:]], ['bob', 'carol', 'dave'])
+        self.assertEqual(rows[1][2], 'Bob Smith')
+        self.assertEqual(rows[3][2], '\'=HYPERLINK("http://x")')
+        self.assertEqual(rows[3][4:6], ["'+44 20 7946 0000", "'@SUM(A1)"])
+        self.assertEqual([row[1] for row in self.export(search='smithers')[1:]], ['carol'])
+
+    def test_customers_cannot_search_or_export(self):
+        client = self.client_for(self.customer)
+        self.assertEqual(client.get('/users/').status_code, 403)
+        self.assertEqual(client.get('/users/export/').status_code, 403)
+
+
+class MetricsTests(ShopTestCase):
+    def test_metrics_are_staff_only(self):
+        self.assertEqual(self.client_for().get('/metrics').status_code, 401)
+        self.assertEqual(self.client_for(self.customer).get('/metrics').status_code, 403)
+        response = self.client_for(self.admin).get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('login_throttle_rejected_total 0', response.content.decode())
+
+    def test_malformed_upload_length_is_counted_as_zero(self):
+        response = self.client_for(self.customer).post(
+            '/upload-cropped-image/', {'cropped_image': png_upload('crop.png')}, format='multipart',
+            CONTENT_LENGTH='not-a-number',
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+class FrameListCachingTests(ShopTestCase):
+    def setUp(self):
+        super().setUp()
+        self.color = ColorVariant.objects.create(frame=self.frame, color_name='Black', image='c.png',
+                                                 corner_image='cc.png', price=Decimal('2.00'))
+        self.client = self.client_for(self.customer)
+
+    def etag(self):
+        response = self.client.get('/frames/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get('/frames/', HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        return response['ETag']
+
+    def test_etag_changes_with_variant_edits(self):
+        etag = self.etag()
+        self.color.price = Decimal('3.00')
+        self.color.save()
+        response = self.client.get('/frames/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()[0]['color_variants'][0]['price'], '3.00')
+        self.assertNotEqual(self.etag(), etag)
+
+    def test_etag_changes_when_a_frame_is_deleted(self):
+        self.create_frame('Ash', Decimal('5.00'))
+        etag = self.etag()
+        Frame.objects.get(name='Ash').delete()
+        response = self.client.get('/frames/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([frame['name'] for frame in response.json()], ['Oak'])
+
+
+class BatchTests(ShopTestCase):
+    def batch(self, *paths, user=None):
+        response = self.client_for(user or self.customer).post('/batch/', {'requests': list(paths)}, format='json')
+        self.assertEqual(response.status_code, 200)
+        return response.json()['responses']
+
+    def test_only_whitelisted_routes_are_dispatched(self):
+        responses = self.batch('/users/', '/checkout/', '/orders/rollups/', '/no/such/path/', f'/frames/{self.frame.pk}/',
+                               user=self.admin)
+        self.assertEqual([item['status'] for item in responses], [404, 404, 404, 404, 200])
+        self.assertEqual(responses[0]['body'], {'error': 'Route not available in batch'})
+        self.assertEqual(responses[4]['body']['name'], 'Oak')
+
+    def test_repeated_lookups_are_served_once(self):
+        Login.cached_token_version(self.customer.pk)
+        path = f'/frames/{self.frame.pk}/'
+        with CaptureQueriesContext(connection) as single:
+            self.batch(path)
+        with CaptureQueriesContext(connection) as repeated:
+            responses = self.batch(path, path, path)
+        self.assertEqual(len(repeated), len(single))
+        self.assertEqual(responses[0], responses[2])
+
+        # The list primes the per-batch cache, so the detail lookup only checks the timestamp
+        with CaptureQueriesContext(connection) as listed:
+            responses = self.batch('/frames/', path)
+        with CaptureQueriesContext(connection) as listed_only:
+            self.batch('/frames/')
+        self.assertEqual(responses[1]['status'], 200)
+        self.assertEqual(len(listed) - len(listed_only), 1)
+
+    def test_sub_requests_keep_their_own_permissions(self):
+        responses = self.client_for().post('/batch/', {'requests': ['/cart/summary/', '/frames/']},
+                                           format='json').json()['responses']
+        self.assertEqual([item['status'] for item in responses], [403, 200])
+
+
+class OrderHistoryTests(ShopTestCase):
+    def history(self):
+        response = self.client_for(self.customer).get('/orders/')
+        self.assertEqual(response.status_code, 200)
+        return response.json()['results']
+
+    def test_history_survives_catalog_deletions(self):
+        color = ColorVariant.objects.create(frame=self.frame, color_name='Black', image='c.png', corner_image='cc.png',
+                                            price=Decimal('2.00'))
+        self.add_to_cart(self.customer, quantity=2, color_variant=color)
+        self.assertEqual(self.checkout(self.customer).status_code, 201)
+        before = self.history()
+        self.assertEqual(before[0]['items'][0]['snapshot']['frame']['name'], 'Oak')
+
+        color.delete()
+        self.frame.delete()
+        after = self.history()
+        item = after[0]['items'][0]
+        self.assertEqual((item['frame'], item['color_variant']), (None, None))
+        for page in (before, after):
+            for line in page[0]['items']:
+                del line['frame'], line['color_variant']
+        self.assertEqual(after, before)
+        self.assertEqual(after[0]['total_amount'], '24.00')
+        self.assertEqual(item['snapshot']['color_variant']['name'], 'Black')
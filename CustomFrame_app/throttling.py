@@ -0,0 +1,74 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from rest_framework.throttling import BaseThrottle
+
+from CustomFrame_app.models import LoginThrottle
+
+# Rejections of pruned buckets are carried over to this row, so the totals never go down
+PRUNED_KEY = 'pruned'
+PRUNE_BATCH_SIZE = 1000
+
+
+def take_token(key, capacity, per_minute):
+    """Take one token from the bucket; returns None if allowed, else seconds until a token is available."""
+    now = timezone.now()
+    with transaction.atomic():
+        bucket, created = LoginThrottle.objects.select_for_update().get_or_create(
+            key=key, defaults={'tokens': capacity, 'updated_at': now}
+        )
+        elapsed = max((now - bucket.updated_at).total_seconds(), 0)
+        tokens = min(capacity, bucket.tokens + elapsed * per_minute / 60)
+        if tokens >= 1:
+            LoginThrottle.objects.filter(pk=bucket.pk).update(tokens=tokens - 1, updated_at=now)
+            return None
+        LoginThrottle.objects.filter(pk=bucket.pk).update(
+            tokens=tokens, updated_at=now, rejected_count=bucket.rejected_count + 1
+        )
+        return (1 - tokens) * 60 / per_minute
+
+
+def check_login_attempt(ip_address, username):
+    """Charge a login attempt to the client IP and username buckets before any password hashing."""
+    rates = settings.LOGIN_THROTTLE_RATES
+    wait = take_token(f"ip:{str(ip_address)[:200]}", *rates['ip'])
+    if wait is None and username:
+        wait = take_token(f"user:{str(username).lower()[:200]}", *rates['username'])
+    return wait
+
+
+def prune_buckets(now=None):
+    """Delete buckets that have refilled completely, which behave exactly like missing ones."""
+    now = now or timezone.now()
+    rates = settings.LOGIN_THROTTLE_RATES
+    pruned = 0
+    for prefix, (capacity, per_minute) in (('ip:', rates['ip']), ('user:', rates['username'])):
+        idle = LoginThrottle.objects.filter(key__startswith=prefix,
+                                            updated_at__lt=now - timedelta(minutes=capacity / per_minute))
+        while True:
+            with transaction.atomic():
+                rows = list(idle.select_for_update(skip_locked=True).values_list('pk', 'rejected_count')
+                            [:PRUNE_BATCH_SIZE])
+                if not rows:
+                    break
+                LoginThrottle.objects.filter(pk__in=[pk for pk, _ in rows]).delete()
+                rejected = sum(count for _, count in rows)
+                if rejected:
+                    total, _ = LoginThrottle.objects.get_or_create(
+                        key=PRUNED_KEY, defaults={'tokens': 0, 'updated_at': now})
+                    LoginThrottle.objects.filter(pk=total.pk).update(rejected_count=F('rejected_count') + rejected)
+            pruned += len(rows)
+    return pruned
+
+
+class LoginRateThrottle(BaseThrottle):
+    def allow_request(self, request, view):
+        username = request.data.get('username') if isinstance(request.data, dict) else None
+        self.retry_after = check_login_attempt(self.get_ident(request), username)
+        return self.retry_after is None
+
+    def wait(self):
+        return self.retry_after
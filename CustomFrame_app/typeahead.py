@@ -0,0 +1,173 @@
+"""Per-process prefix index over frame and variant names for search-as-you-type.
+
+Names are normalized (case-folded, accents and punctuation stripped) and
+indexed once per word start, so "oak" finds "Dark Oak". Lookups bisect a
+sorted array of (term, kind, id) keys; the array is swapped wholesale on
+refresh, so readers never take a lock.
+
+A background thread per process builds the index when the process serves its
+first request and then catches up incrementally: every
+``TYPEAHEAD_REFRESH_SECONDS`` (immediately after a change made in this process)
+it re-reads only the frames whose ``updated_at`` moved since the last refresh,
+plus new tombstones. ``search`` only reads the in-memory arrays, so an
+autocomplete request never queries the database.
+"""
+import heapq
+import logging
+import re
+import threading
+import unicodedata
+from bisect import bisect_left
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+from CustomFrame_app.models import Frame, FrameTombstone
+
+logger = logging.getLogger(__name__)
+
+TYPEAHEAD_REFRESH_SECONDS = 5
+# Re-read changes this far behind the high-water mark, in case app servers' clocks disagree
+TYPEAHEAD_CLOCK_SKEW = timedelta(seconds=60)
+# Upper bound on keys ranked for very short prefixes
+TYPEAHEAD_SCAN_LIMIT = 2000
+
+# (kind, related name on Frame, name field)
+VARIANT_SOURCES = (
+    ('color', 'color_variants', 'color_name'),
+    ('size', 'size_variants', 'size_name'),
+    ('finish', 'finishing_variants', 'finish_name'),
+    ('hanging', 'frameHanging_variant', 'hanging_name'),
+)
+KIND_ORDER = {'frame': 0, 'color': 1, 'size': 2, 'finish': 3, 'hanging': 4}
+
+_non_word = re.compile(r'[\W_]+')
+
+
+def normalize(text):
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return _non_word.sub(' ', text.casefold()).strip()
+
+
+def entry_terms(name):
+    # The whole name plus every suffix starting at a word boundary
+    words = normalize(name).split()
+    return [' '.join(words[i:]) for i in range(len(words))]
+
+
+class TypeaheadIndex:
+    def __init__(self):
+        self.lock = threading.Lock()
+        # (sorted keys, entries by (kind, id)), replaced as one tuple so readers see a consistent pair
+        self.state = ([], {})
+        self.frame_keys = {}
+        self.mark = None
+        self.built = False
+        self.wakeup = threading.Event()
+        self.thread = None
+        self.thread_lock = threading.Lock()
+
+    def invalidate(self):
+        self.wakeup.set()
+
+    def warm(self, **kwargs):
+        # request_started receiver: the first request of each (forked) worker starts its refresher
+        if not settings.TYPEAHEAD_BACKGROUND_REFRESH:
+            return
+        if self.thread is None or not self.thread.is_alive():
+            with self.thread_lock:
+                if self.thread is None or not self.thread.is_alive():
+                    self.thread = threading.Thread(target=self.run, name='typeahead-refresh', daemon=True)
+                    self.thread.start()
+
+    def run(self):
+        while True:
+            try:
+                self.refresh()
+            except Exception:
+                logger.exception("Typeahead refresh failed")
+            finally:
+                close_old_connections()
+            self.wakeup.wait(TYPEAHEAD_REFRESH_SECONDS)
+            self.wakeup.clear()
+
+    def search(self, query, limit=10):
+        query = normalize(query)
+        if not query:
+            return []
+        keys, entries = self.state
+        start = bisect_left(keys, (query,))
+        stop = min(bisect_left(keys, (query + '\uffff',), lo=start), start + TYPEAHEAD_SCAN_LIMIT)
+        best = {}
+        for term, kind, pk in keys[start:stop]:
+            uid = (kind, pk)
+            entry = entries[uid]
+            # Exact name, then names starting with the query, then a later word matching
+            if term != entry['normalized']:
+                rank = entry['ranks'][2]
+            else:
+                rank = entry['ranks'][0 if term == query else 1]
+            if uid not in best or best[uid] > rank:
+                best[uid] = rank
+        ranked = heapq.nsmallest(limit, best.items(), key=lambda item: item[1])
+        return [entries[uid]['public'] for uid, rank in ranked]
+
+    def refresh(self):
+        with self.lock:
+            frames = Frame.objects.prefetch_related(*(related for _, related, _ in VARIANT_SOURCES))
+            deleted = []
+            if self.built:
+                since = self.mark - TYPEAHEAD_CLOCK_SKEW if self.mark else None
+                if since is not None:
+                    frames = frames.filter(updated_at__gte=since)
+                    deleted = FrameTombstone.objects.filter(deleted_at__gte=since).values_list('frame_id', flat=True)
+            self.apply(list(frames), set(deleted), replace_all=not self.built)
+            self.built = True
+
+    def apply(self, frames, deleted_ids, replace_all=False):
+        entries = {} if replace_all else dict(self.state[1])
+        frame_keys = {} if replace_all else dict(self.frame_keys)
+        stale = set()
+        for frame_id in deleted_ids | {frame.pk for frame in frames}:
+            for uid in frame_keys.pop(frame_id, ()):
+                entries.pop(uid, None)
+                stale.add(uid)
+
+        added = []
+        for frame in frames:
+            uids = []
+            for kind, pk, name in [('frame', frame.pk, frame.name)] + [
+                (kind, variant.pk, getattr(variant, field))
+                for kind, related, field in VARIANT_SOURCES for variant in getattr(frame, related).all()
+            ]:
+                terms = entry_terms(name)
+                if not terms:
+                    continue
+                tail = (len(name), KIND_ORDER[kind], terms[0], pk)
+                entries[(kind, pk)] = {
+                    'normalized': terms[0],
+                    'ranks': [(match, *tail) for match in range(3)],
+                    'public': {'type': kind, 'id': pk, 'frame_id': frame.pk, 'name': name, 'frame_name': frame.name},
+                }
+                added.extend((term, kind, pk) for term in terms)
+                uids.append((kind, pk))
+            frame_keys[frame.pk] = uids
+            if frame.updated_at and (self.mark is None or frame.updated_at > self.mark):
+                self.mark = frame.updated_at
+
+        if replace_all:
+            keys = sorted(added)
+        else:
+            kept = (key for key in self.state[0] if (key[1], key[2]) not in stale)
+            keys = list(heapq.merge(kept, sorted(added)))
+        self.state = (keys, entries)
+        self.frame_keys = frame_keys
+
+
+index = TypeaheadIndex()
+
+
+def schedule_typeahead_refresh():
+    transaction.on_commit(index.invalidate)
@@ -1,17 +1,22 @@
 from django.urls import path
-from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
-from CustomFrame_app import views
+from rest_framework_simplejwt.views import TokenRefreshView
+from CustomFrame_app import views, async_views
 from CustomFrame_app.views import FrameListCreateView, UserDetailView, UserListView, \
     ColorVariantDetailView, SizeVariantDetailView, FinishingVariantDetailView, HangingVariantDetailView, UserManageView, \
     FrameDetailView, BulkVariantCreateView, UploadCroppedImageView, AddToCartView, CartDetailView, CartItemDetailView, \
-    upload_image
+    CartSummaryView, CartBatchView, CheckoutView, AdminOrderListView, AdminOrderDetailView, SalesRollupListView, \
+    BulkOrderTransitionView, ProductionCutListView, ThrottledTokenObtainPairView, LoginThrottleStatsView, \
+    UserExportView, MetricsView, BatchView, AutocompleteView, OrderHistoryView, ProfileListView, ProfileDetailView, \
+    ProfileStatsView, QuoteView, upload_image
 
 urlpatterns = [
     path('api/user_registration/', views.user_registration, name='user_registration'),
     path('api/user_login/', views.user_login, name='user_login'),
-    path('login/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
+    path('login/', ThrottledTokenObtainPairView.as_view(), name='token_obtain_pair'),
+    path('login/throttle/', LoginThrottleStatsView.as_view(), name='login-throttle-stats'),
     path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     path('frames/', FrameListCreateView.as_view(), name='frame-list-create'),
+    path('frames/autocomplete/', AutocompleteView.as_view(), name='frame-autocomplete'),
     path('frames/<int:frame_id>/', FrameDetailView.as_view(), name='frame-detail'),
     path('frames/<int:frame_id>/variants/', BulkVariantCreateView.as_view(), name='variant-create'),
     path('variants/color/<int:variant_id>/', ColorVariantDetailView.as_view(), name='color-variant-detail'),
@@ -20,10 +25,32 @@ urlpatterns = [
     path('variants/hanging/<int:variant_id>/', HangingVariantDetailView.as_view(), name='hanging-variant-detail'),
     path('user/', UserDetailView.as_view(), name='user-detail'),
     path('users/', UserListView.as_view(), name='user-list'),
+    path('users/export/', UserExportView.as_view(), name='user-export'),
     path('users/<int:user_id>/', UserManageView.as_view(), name='user-manage'),
+    path('metrics', MetricsView.as_view(), name='metrics'),
+    path('profiles/', ProfileListView.as_view(), name='profile-list'),
+    path('profiles/<str:profile_id>/', ProfileDetailView.as_view(), name='profile-detail'),
+    path('profiles/<str:profile_id>/pstats/', ProfileStatsView.as_view(), name='profile-pstats'),
     path('upload-image/', upload_image, name='upload_image'),
     path('upload-cropped-image/', UploadCroppedImageView.as_view(), name='upload-cropped-image'),
     path('add-to-cart/', AddToCartView.as_view(), name='add_to_cart'),
     path('cart/', CartDetailView.as_view(), name='cart_detail'),
+    path('cart/batch/', CartBatchView.as_view(), name='cart_batch'),
+    path('cart/summary/', CartSummaryView.as_view(), name='cart_summary'),
     path('cart/items/<int:item_id>/', CartItemDetailView.as_view(), name='cart_item_detail'),
+    path('async/frames/', async_views.frame_list, name='async-frame-list'),
+    path('async/frames/<int:frame_id>/', async_views.frame_detail, name='async-frame-detail'),
+    path('async/cart/', async_views.cart_detail, name='async-cart-detail'),
+    path('async/cart/summary/', async_views.cart_summary, name='async-cart-summary'),
+    path('async/upload-image/', async_views.upload_image, name='async-upload-image'),
+    path('async/add-to-cart/', async_views.add_to_cart, name='async-add-to-cart'),
+    path('batch/', BatchView.as_view(), name='batch'),
+    path('checkout/', CheckoutView.as_view(), name='checkout'),
+    path('quotes/', QuoteView.as_view(), name='quotes'),
+    path('orders/', OrderHistoryView.as_view(), name='order-history'),
+    path('orders/admin/', AdminOrderListView.as_view(), name='admin-order-list'),
+    path('orders/admin/transition/', BulkOrderTransitionView.as_view(), name='admin-order-transition'),
+    path('orders/admin/<int:order_id>/', AdminOrderDetailView.as_view(), name='admin-order-detail'),
+    path('orders/rollups/', SalesRollupListView.as_view(), name='sales-rollups'),
+    path('production/cut-list/', ProductionCutListView.as_view(), name='production-cut-list'),
 ]
@@ -1,26 +1,136 @@
+import copy
+import csv
+import itertools
+import logging
+import math
 import os
+from datetime import datetime, time
 
 from django.conf import settings
 from django.core.files.storage import default_storage, FileSystemStorage
-from django.http import JsonResponse, HttpResponse
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Max, Q, Subquery, Sum
+from django.http import FileResponse, JsonResponse, HttpResponse, QueryDict, StreamingHttpResponse
+from django.urls import Resolver404, resolve
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.http import http_date, quote_etag
 from django.views.decorators.csrf import csrf_exempt
 from django.contrib.auth import authenticate, login
 from rest_framework import status, generics, views, serializers, viewsets
+from rest_framework.authentication import BasicAuthentication
 from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import CursorPagination
 from rest_framework.parsers import MultiPartParser
 from rest_framework.response import Response
+from rest_framework.throttling import BaseThrottle
+from rest_framework.utils.urls import replace_query_param
 from rest_framework.views import APIView
+from rest_framework_simplejwt.views import TokenObtainPairView
 from rest_framework.permissions import AllowAny, IsAuthenticated, IsAdminUser
+from CustomFrame_app.authentication import ClaimsJWTAuthentication
+from CustomFrame_app.batching import batch_scope, prime_request_cache, request_cached
+from CustomFrame_app.concurrency import metric_lines as concurrency_metric_lines
+from CustomFrame_app.cutlist import frame_pieces, plan_group
 from CustomFrame_app.forms import UserRegister
+from CustomFrame_app.metrics import registry
+from CustomFrame_app.popularity import record_cart_adds, record_order_items
+from CustomFrame_app.pricing import format_cents, parse_quote_rows, price_matrix
+from CustomFrame_app.profiling import list_reports, load_report, profile_path
+from CustomFrame_app.renderers import FastJSONParser
+from CustomFrame_app.throttling import PRUNED_KEY, LoginRateThrottle, check_login_attempt
+from CustomFrame_app.typeahead import index as typeahead_index
 from CustomFrame_app.models import Frame, Login, ColorVariant, SizeVariant, FinishingVariant, FrameHangVariant, Cart, \
-    CartItem
+    CartItem, Order, OrderItem, DailySalesRollup, LoginThrottle, FrameTombstone, PopularityCounter
 from CustomFrame_app.serializer import (
     FrameSerializer, ColorVariantSerializer, SizeVariantSerializer,
     FinishingVariantSerializer, HangingsVariantSerializer, UserDetails_Serializer, CartItemCreateSerializer,
-    CartItemSerializer, CartItemUpdateSerializer
+    CartItemSerializer, CartItemUpdateSerializer, CartSummarySerializer, CartBatchCreateSerializer,
+    CartBatchUpdateSerializer, OrderSerializer, DailySalesRollupSerializer
 )
 import json
 
+def conditional_response(request, etag, last_modified):
+    # Returns a 304 when the client's validators are still fresh, otherwise None.
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is not None:
+        set_validators(response, etag, last_modified)
+    return response
+
+def set_validators(response, etag, last_modified):
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+logger = logging.getLogger(__name__)
+
+CART_BATCH_MAX_ITEMS = 100
+CART_VARIANT_MODELS = {
+    'color_variant': ColorVariant,
+    'size_variant': SizeVariant,
+    'finish_variant': FinishingVariant,
+    'hanging_variant': FrameHangVariant,
+}
+CART_BATCH_UPDATE_FIELDS = [
+    'frame', 'color_variant', 'size_variant', 'finish_variant', 'hanging_variant', 'quantity',
+    'transform_x', 'transform_y', 'scale', 'rotation', 'frame_rotation', 'total_price',
+]
+
+CART_SUMMARY_AGGREGATES = {'lines': Count('id'), 'quantity': Sum('quantity'), 'total_price': Sum('total_price')}
+
+def cart_validators(cart):
+    return quote_etag(f"{cart.id}-{cart.updated_at.timestamp():.6f}"), int(cart.updated_at.timestamp())
+
+def cart_summary_data(summary):
+    return {
+        'lines': summary['lines'],
+        'quantity': summary['quantity'] or 0,
+        'total_price': summary['total_price'] or 0,
+    }
+
+FRAME_LIST_AGGREGATES = {'count': Count('id'), 'updated_at': Max('updated_at')}
+
+def frame_validators(frame_id, updated_at):
+    return quote_etag(f"frame-{frame_id}-{updated_at.timestamp():.6f}"), int(updated_at.timestamp())
+
+FRAME_LIST_ORDERINGS = ('popular',)
+
+def frame_list_validators(state, deleted_at, ranked_at=None):
+    # Count plus newest change covers edits, additions and (through tombstones) deletions.
+    # Re-rankings don't touch updated_at, so the popular ordering also carries the last flush.
+    changed = max(filter(None, (state['updated_at'], deleted_at)), default=None)
+    stamp = changed.timestamp() if changed else 0
+    etag = f"frames-{state['count']}-{stamp:.6f}"
+    if ranked_at is not None:
+        etag += f"-popular-{ranked_at.timestamp():.6f}"
+    return quote_etag(etag), int(max(stamp, ranked_at.timestamp() if ranked_at else 0))
+
+def ordered_frames(queryset, ordering):
+    if ordering == 'popular':
+        return queryset.order_by(F('popularity_rank').asc(nulls_last=True), 'id')
+    return queryset
+
+def frame_queryset():
+    # Everything FrameSerializer touches, loaded in a fixed number of queries.
+    return Frame.objects.select_related('created_by').prefetch_related(
+        'color_variants', 'size_variants', 'finishing_variants', 'frameHanging_variant'
+    )
+
+def cart_items_queryset():
+    # Everything CartItemSerializer touches, loaded in a fixed number of queries.
+    return CartItem.objects.select_related(
+        'frame__created_by', 'color_variant', 'size_variant', 'finish_variant', 'hanging_variant'
+    ).prefetch_related(
+        'frame__color_variants', 'frame__size_variants', 'frame__finishing_variants', 'frame__frameHanging_variant'
+    )
+
+def _indexed_errors(serializer_errors):
+    # ListSerializer reports errors as a list or an index-keyed dict depending on the DRF version
+    rows = serializer_errors.items() if isinstance(serializer_errors, dict) else enumerate(serializer_errors)
+    return [{"index": index, "error": error} for index, error in rows if error]
+
 def index(request):
     return HttpResponse("Welcome to the Custom Photo Frame App!")
 
@@ -53,15 +163,20 @@ def user_login(request):
                 data = json.loads(request.body)
                 username = data.get('username')
                 password = data.get('password')
-            except json.JSONDecodeError:
+            except (json.JSONDecodeError, AttributeError):
                 return JsonResponse({'status': False, 'result': 'Invalid JSON'}, status=400)
         else:
             username = request.POST.get('username')
             password = request.POST.get('password')
 
-        print(f"Username: {username}, Password: {password}")  # Debugging
+        retry_after = check_login_attempt(BaseThrottle().get_ident(request), username)
+        if retry_after is not None:
+            response = JsonResponse({'status': False, 'result': 'Too many login attempts'}, status=429)
+            response['Retry-After'] = str(math.ceil(retry_after))
+            return response
+
         user = authenticate(request, username=username, password=password)
-        print(f"User: {user}")  # Debugging
+        logger.debug("Login attempt for %s: %s", username, 'ok' if user else 'failed')
 
         if user is not None:
             if user.is_blocked:
@@ -85,6 +200,63 @@ def user_login(request):
             return JsonResponse({'status': False, 'result': 'Invalid username or password'}, status=400)
     return JsonResponse({'status': False, 'result': 'Invalid request method'}, status=405)
 
+class ThrottledTokenObtainPairView(TokenObtainPairView):
+    throttle_classes = [LoginRateThrottle]
+
+class LoginThrottleStatsView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        totals = LoginThrottle.objects.aggregate(buckets=Count('id', filter=~Q(key=PRUNED_KEY)),
+                                                 rejected=Sum('rejected_count'))
+        top = LoginThrottle.objects.filter(rejected_count__gt=0).exclude(key=PRUNED_KEY).order_by('-rejected_count')[:20]
+        return Response({
+            "buckets": totals['buckets'],
+            "rejected": totals['rejected'] or 0,
+            "top_rejected": [{"key": bucket.key, "rejected": bucket.rejected_count} for bucket in top],
+        })
+
+class MetricsView(APIView):
+    # Prometheus scrapes with static basic_auth credentials; one hash per scrape is affordable
+    authentication_classes = [ClaimsJWTAuthentication, BasicAuthentication]
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        rejected = LoginThrottle.objects.aggregate(total=Sum('rejected_count'))['total'] or 0
+        extra = [
+            "# HELP login_throttle_rejected_total Login attempts rejected by the token buckets",
+            "# TYPE login_throttle_rejected_total counter",
+            f"login_throttle_rejected_total {rejected}",
+            *concurrency_metric_lines(),
+        ]
+        return HttpResponse(registry.render(extra), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+class ProfileListView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(list_reports())
+
+class ProfileDetailView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, profile_id):
+        try:
+            return Response(load_report(profile_id))
+        except FileNotFoundError:
+            return Response({"error": "Profile not found"}, status=status.HTTP_404_NOT_FOUND)
+
+class ProfileStatsView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, profile_id):
+        try:
+            stats = profile_path(profile_id, '.prof').open('rb')
+        except FileNotFoundError:
+            return Response({"error": "Profile not found"}, status=status.HTTP_404_NOT_FOUND)
+        return FileResponse(stats, as_attachment=True, filename=f"{profile_id}.prof",
+                            content_type='application/octet-stream')
+
 class FrameListCreateView(APIView):
     def get_permissions(self):
         if self.request.method == 'GET':
@@ -92,9 +264,26 @@ class FrameListCreateView(APIView):
         return [IsAuthenticated()]
 
     def get(self, request):
-        frames = Frame.objects.all()
+        ordering = request.query_params.get('ordering')
+        if ordering is not None and ordering not in FRAME_LIST_ORDERINGS:
+            return Response({"error": f"ordering must be one of: {', '.join(FRAME_LIST_ORDERINGS)}"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        ranked_at = None
+        if ordering == 'popular':
+            ranked_at = PopularityCounter.objects.filter(kind='frame').aggregate(
+                ranked_at=Max('updated_at'))['ranked_at']
+        etag, last_modified = frame_list_validators(
+            Frame.objects.aggregate(**FRAME_LIST_AGGREGATES),
+            FrameTombstone.objects.aggregate(deleted_at=Max('deleted_at'))['deleted_at'],
+            ranked_at,
+        )
+        not_modified = conditional_response(request, etag, last_modified)
+        if not_modified is not None:
+            return not_modified
+        frames = ordered_frames(frame_queryset(), ordering)
         serializer = FrameSerializer(frames, many=True, context={'request': request})
-        return Response(serializer.data)
+        prime_request_cache((('frame', item['id']), item) for item in serializer.data)
+        return set_validators(Response(serializer.data), etag, last_modified)
 
     def post(self, request):
         if not request.user.is_staff:
@@ -110,9 +299,16 @@ class FrameDetailView(APIView):
 
     def get(self, request, frame_id):
         try:
-            frame = Frame.objects.get(id=frame_id)
-            serializer = FrameSerializer(frame, context={'request': request})
-            return Response(serializer.data)
+            # Only the timestamp is read until we know the client actually needs the body
+            updated_at = Frame.objects.values_list('updated_at', flat=True).get(id=frame_id)
+            etag, last_modified = frame_validators(frame_id, updated_at)
+            not_modified = conditional_response(request, etag, last_modified)
+            if not_modified is not None:
+                return not_modified
+            data = request_cached(('frame', frame_id), lambda: FrameSerializer(
+                frame_queryset().get(id=frame_id), context={'request': request}
+            ).data)
+            return set_validators(Response(data), etag, last_modified)
         except Frame.DoesNotExist:
             return Response({"error": "Frame not found"}, status=status.HTTP_404_NOT_FOUND)
 
@@ -121,12 +317,11 @@ class FrameDetailView(APIView):
             return Response({"error": "Only admins can update frames"}, status=status.HTTP_403_FORBIDDEN)
         try:
             frame = Frame.objects.get(id=frame_id)
-            print("Received data:", request.data)  # For debugging
             serializer = FrameSerializer(frame, data=request.data, partial=True, context={'request': request})
             if serializer.is_valid():
                 serializer.save()
                 return Response(serializer.data)
-            print("Serializer errors:", serializer.errors)  # For debugging
+            logger.debug("Frame %s update rejected: %s", frame_id, serializer.errors)
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         except Frame.DoesNotExist:
             return Response({"error": "Frame not found"}, status=status.HTTP_404_NOT_FOUND)
@@ -165,39 +360,41 @@ class BulkVariantCreateView(APIView):
         created_variants = []
         errors = []
 
-        for variant_data in variants_data:
-            variant_type = variant_data.get('variant_type')
-            variant_form_data = request.FILES.get(variant_data.get('image_key')) if variant_data.get('image_key') else None
-            variant_corner_form_data = request.FILES.get(f"{variant_data.get('image_key')}_corner") if variant_data.get('image_key') else None
-            if variant_form_data:
-                variant_data['image'] = variant_form_data
-            if variant_corner_form_data and variant_type != 'hanging':
-                variant_data['corner_image'] = variant_corner_form_data
-
-            if not variant_type:
-                errors.append({"error": "variant_type is required"})
-                continue
+        # One transaction, so the sprite worker is woken once for the whole batch
+        with transaction.atomic():
+            for variant_data in variants_data:
+                variant_type = variant_data.get('variant_type')
+                variant_form_data = request.FILES.get(variant_data.get('image_key')) if variant_data.get('image_key') else None
+                variant_corner_form_data = request.FILES.get(f"{variant_data.get('image_key')}_corner") if variant_data.get('image_key') else None
+                if variant_form_data:
+                    variant_data['image'] = variant_form_data
+                if variant_corner_form_data and variant_type != 'hanging':
+                    variant_data['corner_image'] = variant_corner_form_data
 
-            if variant_type == 'color':
-                serializer = ColorVariantSerializer(data=variant_data, context={'request': request})
-            elif variant_type == 'size':
-                serializer = SizeVariantSerializer(data=variant_data, context={'request': request})
-            elif variant_type == 'finish':
-                serializer = FinishingVariantSerializer(data=variant_data, context={'request': request})
-            elif variant_type == 'hanging':
-                serializer = HangingsVariantSerializer(data=variant_data, context={'request': request})
-            else:
-                errors.append({"error": f"Invalid variant type: {variant_type}"})
-                continue
+                if not variant_type:
+                    errors.append({"error": "variant_type is required"})
+                    continue
 
-            if serializer.is_valid():
-                try:
-                    instance = serializer.save(frame=frame)
-                    created_variants.append(serializer.data)
-                except ValidationError as e:
-                    errors.append({"error": str(e)})
-            else:
-                errors.append(serializer.errors)
+                if variant_type == 'color':
+                    serializer = ColorVariantSerializer(data=variant_data, context={'request': request})
+                elif variant_type == 'size':
+                    serializer = SizeVariantSerializer(data=variant_data, context={'request': request})
+                elif variant_type == 'finish':
+                    serializer = FinishingVariantSerializer(data=variant_data, context={'request': request})
+                elif variant_type == 'hanging':
+                    serializer = HangingsVariantSerializer(data=variant_data, context={'request': request})
+                else:
+                    errors.append({"error": f"Invalid variant type: {variant_type}"})
+                    continue
+
+                if serializer.is_valid():
+                    try:
+                        instance = serializer.save(frame=frame)
+                        created_variants.append(serializer.data)
+                    except ValidationError as e:
+                        errors.append({"error": str(e)})
+                else:
+                    errors.append(serializer.errors)
 
         if errors:
             return Response({"created": created_variants, "errors": errors}, status=status.HTTP_400_BAD_REQUEST)
@@ -310,18 +507,59 @@ class HangingVariantDetailView(APIView):
 class UserDetailView(APIView):
     permission_classes = [IsAuthenticated]
     def get(self, request):
-        user = request.user
+        # request.user only carries token claims, so load the full profile in one query
+        user = request_cached(('user', request.user.pk), lambda: Login.objects.get(pk=request.user.pk))
         serializer = UserDetails_Serializer(user)
         return Response(serializer.data)
 
+USER_SEARCH_FIELDS = ('username', 'name', 'email', 'phone')
+USER_EXPORT_FIELDS = ('id', 'username', 'name', 'email', 'phone', 'address', 'is_blocked', 'date_joined')
+USER_EXPORT_CHUNK_SIZE = 2000
+# Spreadsheets evaluate cells starting with these as formulas
+CSV_FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+def _search_users(users, request):
+    # Backed by the trigram indexes from migration 0007 on PostgreSQL
+    term = request.query_params.get('search', '').strip()
+    if not term:
+        return users
+    lookup = 'istartswith' if request.query_params.get('match') == 'prefix' else 'icontains'
+    condition = Q()
+    for field in USER_SEARCH_FIELDS:
+        condition |= Q(**{f"{field}__{lookup}": term})
+    return users.filter(condition)
+
 class UserListView(APIView):
     permission_classes = [IsAdminUser]
 
     def get(self, request):
-        users = Login.objects.filter(is_user=True)
+        users = _search_users(Login.objects.filter(is_user=True), request)
         serializer = UserDetails_Serializer(users, many=True)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
+def csv_safe(value):
+    # A leading quote makes spreadsheets show user-entered text as-is instead of running it
+    if isinstance(value, str) and value.startswith(CSV_FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+class Echo:
+    # File-like object whose write() hands the line back, so csv.writer output can be streamed
+    def write(self, value):
+        return value
+
+class UserExportView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        users = _search_users(Login.objects.filter(is_user=True), request).order_by('id')
+        rows = users.values_list(*USER_EXPORT_FIELDS).iterator(chunk_size=USER_EXPORT_CHUNK_SIZE)
+        writer = csv.writer(Echo())
+        lines = itertools.chain([writer.writerow(USER_EXPORT_FIELDS)], (writer.writerow([csv_safe(value) for value in row]) for row in rows))
+        response = StreamingHttpResponse(lines, content_type='text/csv')
+        response['Content-Disposition'] = 'attachment; filename="customers.csv"'
+        return response
+
 class UserManageView(APIView):
     permission_classes = [IsAdminUser]
 
@@ -396,6 +634,7 @@ class AddToCartView(APIView):
                     return Response({"error": f"{variant_type} does not belong to the selected frame"},
                                     status=status.HTTP_400_BAD_REQUEST)
             cart_item = serializer.save(cart=cart)
+            record_cart_adds([cart_item])
             return Response(CartItemSerializer(cart_item, context={'request': request}).data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -403,11 +642,162 @@ class CartDetailView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        cart, created = Cart.objects.get_or_create(user=request.user)
-        items = cart.items.all()
+        # Read-only, so it can be served by a replica; a missing cart is simply empty
+        items = cart_items_queryset().filter(cart__user=request.user)
         serializer = CartItemSerializer(items, many=True, context={'request': request})
         return Response(serializer.data)
 
+class CartBatchView(APIView):
+    permission_classes = [IsAuthenticated]
+    parser_classes = [FastJSONParser, MultiPartParser]
+
+    def post(self, request):
+        if not isinstance(request.data, dict):
+            return Response({"error": "The request body must be an object"}, status=status.HTTP_400_BAD_REQUEST)
+        operations = {}
+        for key in ('create', 'update', 'delete'):
+            value = request.data.get(key, [])
+            if isinstance(value, str):
+                try:
+                    value = json.loads(value)
+                except json.JSONDecodeError:
+                    return Response({"error": f"{key} must be a valid JSON list"}, status=status.HTTP_400_BAD_REQUEST)
+            if not isinstance(value, list):
+                return Response({"error": f"{key} must be provided as a list"}, status=status.HTTP_400_BAD_REQUEST)
+            operations[key] = value
+        if sum(len(value) for value in operations.values()) > CART_BATCH_MAX_ITEMS:
+            return Response({"error": f"A batch may contain at most {CART_BATCH_MAX_ITEMS} operations"},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        # Uploaded files are referenced by image_key, as in BulkVariantCreateView
+        create_data = []
+        for row in operations['create']:
+            row = dict(row) if isinstance(row, dict) else {}
+            image_key = row.pop('image_key', None)
+            if image_key:
+                for field in ('original_image', 'cropped_image', 'adjusted_image'):
+                    upload = request.FILES.get(f"{image_key}_{field}")
+                    if upload:
+                        row[field] = upload
+            create_data.append(row)
+
+        errors = {'create': [], 'update': [], 'delete': []}
+        create_serializer = CartBatchCreateSerializer(data=create_data, many=True)
+        update_serializer = CartBatchUpdateSerializer(data=operations['update'], many=True)
+        if not create_serializer.is_valid():
+            errors['create'] = _indexed_errors(create_serializer.errors)
+        if not update_serializer.is_valid():
+            errors['update'] = _indexed_errors(update_serializer.errors)
+        try:
+            delete_ids = {int(item_id) for item_id in operations['delete']}
+        except (TypeError, ValueError):
+            errors['delete'].append({"error": "delete must be a list of cart item ids"})
+            delete_ids = set()
+        if any(errors.values()):
+            return Response({"errors": errors}, status=status.HTTP_400_BAD_REQUEST)
+
+        creates = create_serializer.validated_data
+        updates = update_serializer.validated_data
+        update_ids = [row['id'] for row in updates]
+
+        cart, created = Cart.objects.get_or_create(user=request.user)
+        existing = CartItem.objects.filter(cart=cart).in_bulk(set(update_ids) | delete_ids)
+
+        # Resolve every referenced frame and variant with one query per model
+        frame_ids = {row['frame'] for row in creates}
+        variant_ids = {field: set() for field in CART_VARIANT_MODELS}
+        for row, base in [(row, None) for row in creates] + [(row, existing.get(row['id'])) for row in updates]:
+            frame_ids.add(row.get('frame', base.frame_id if base else None))
+            for field in CART_VARIANT_MODELS:
+                variant_ids[field].add(row[field] if field in row else getattr(base, f"{field}_id", None))
+        frame_ids.discard(None)
+        frames = Frame.objects.in_bulk(frame_ids) if frame_ids else {}
+        variants = {}
+        for field, model in CART_VARIANT_MODELS.items():
+            variant_ids[field].discard(None)
+            variants[field] = model.objects.in_bulk(variant_ids[field]) if variant_ids[field] else {}
+
+        def resolve(row, base):
+            frame = frames.get(row.get('frame', base.frame_id if base else None))
+            if frame is None:
+                return None, "Frame not found"
+            resolved = {'frame': frame}
+            for field in CART_VARIANT_MODELS:
+                variant_id = row[field] if field in row else getattr(base, f"{field}_id", None)
+                variant = variants[field].get(variant_id) if variant_id is not None else None
+                if variant_id is not None and variant is None:
+                    return None, f"{field} not found"
+                if variant and variant.frame_id != frame.id:
+                    return None, f"{field} does not belong to the selected frame"
+                resolved[field] = variant
+            return resolved, None
+
+        new_items = []
+        for index, row in enumerate(creates):
+            resolved, error = resolve(row, None)
+            if error:
+                errors['create'].append({"index": index, "error": error})
+                continue
+            item = CartItem(cart=cart, **{**row, **resolved})
+            item.total_price = item.calculate_total_price()
+            new_items.append(item)
+
+        updated_items = []
+        seen_ids = set()
+        for index, row in enumerate(updates):
+            item = existing.get(row['id'])
+            if item is None or row['id'] in delete_ids or row['id'] in seen_ids:
+                errors['update'].append({"index": index, "error": "Cart item not found"})
+                continue
+            seen_ids.add(row['id'])
+            resolved, error = resolve(row, item)
+            if error:
+                errors['update'].append({"index": index, "error": error})
+                continue
+            for attr, value in {**row, **resolved}.items():
+                setattr(item, attr, value)
+            item.total_price = item.calculate_total_price()
+            updated_items.append(item)
+
+        missing = sorted(delete_ids - set(existing))
+        if missing:
+            errors['delete'].append({"error": f"Cart items not found: {missing}"})
+        if any(errors.values()):
+            return Response({"errors": errors}, status=status.HTTP_400_BAD_REQUEST)
+
+        with transaction.atomic():
+            if new_items:
+                CartItem.objects.bulk_create(new_items)
+                record_cart_adds(new_items)
+            if updated_items:
+                CartItem.objects.bulk_update(updated_items, CART_BATCH_UPDATE_FIELDS)
+            if delete_ids:
+                CartItem.objects.filter(cart=cart, id__in=delete_ids).delete()
+            Cart.touch(cart.id)
+
+        created_ids = [item.id for item in new_items]
+        items = cart_items_queryset().in_bulk(created_ids + [item.id for item in updated_items])
+        context = {'request': request}
+        return Response({
+            "created": CartItemSerializer([items[i] for i in created_ids], many=True, context=context).data,
+            "updated": CartItemSerializer([items[item.id] for item in updated_items], many=True, context=context).data,
+            "deleted": sorted(delete_ids),
+        }, status=status.HTTP_200_OK)
+
+class CartSummaryView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        cart, created = Cart.objects.get_or_create(user=request.user)
+        etag, last_modified = cart_validators(cart)
+        not_modified = conditional_response(request, etag, last_modified)
+        if not_modified is not None:
+            return not_modified
+
+        summary = CartItem.objects.filter(cart=cart).aggregate(**CART_SUMMARY_AGGREGATES)
+        serializer = CartSummarySerializer(cart_summary_data(summary))
+        return set_validators(Response(serializer.data), etag, last_modified)
+
 class CartItemDetailView(APIView):
     permission_classes = [IsAuthenticated]
 
@@ -431,4 +821,433 @@ class CartItemDetailView(APIView):
         except CartItem.DoesNotExist:
             return Response({"error": "Cart item not found"}, status=status.HTTP_404_NOT_FOUND)
 
+class CheckoutView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        idempotency_key = request.headers.get('Idempotency-Key')
+        if not idempotency_key and isinstance(request.data, dict):
+            idempotency_key = request.data.get('idempotency_key')
+        if not isinstance(idempotency_key, str) or not idempotency_key or len(idempotency_key) > 64:
+            return Response({"error": "An Idempotency-Key of at most 64 characters is required"},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        existing = self.get_existing_order(request, idempotency_key)
+        if existing is not None:
+            return Response(OrderSerializer(existing, context={'request': request}).data, status=status.HTTP_200_OK)
+
+        try:
+            with transaction.atomic():
+                # Locking the cart serialises concurrent checkouts (and retries) of the same cart
+                cart = Cart.objects.select_for_update().filter(user=request.user).order_by('id').first()
+                existing = self.get_existing_order(request, idempotency_key)
+                if existing is not None:
+                    return Response(OrderSerializer(existing, context={'request': request}).data,
+                                    status=status.HTTP_200_OK)
+                items = list(CartItem.objects.filter(cart=cart).select_related(
+                    'frame', 'color_variant', 'size_variant', 'finish_variant', 'hanging_variant'
+                ).order_by('id')) if cart else []
+                if not items:
+                    return Response({"error": "Cart is empty"}, status=status.HTTP_400_BAD_REQUEST)
+
+                # Prices come from the rows loaded above, not from the stored cart totals
+                for item in items:
+                    item.total_price = item.calculate_total_price()
+                order = Order.objects.create(
+                    user=request.user,
+                    total_amount=sum(item.total_price for item in items),
+                    idempotency_key=idempotency_key,
+                )
+                order_items = OrderItem.objects.bulk_create([
+                    OrderItem(
+                        order=order,
+                        # Point at the file already in storage instead of copying its bytes
+                        image=(item.adjusted_image or item.cropped_image or item.original_image).name or '',
+                        frame=item.frame,
+                        color_variant=item.color_variant,
+                        size_variant=item.size_variant,
+                        finish_variant=item.finish_variant,
+                        hanging_variant=item.hanging_variant,
+                        quantity=item.quantity,
+                        total_price=item.total_price,
+                        snapshot=item.snapshot(),
+                    )
+                    for item in items
+                ])
+                DailySalesRollup.apply_items(order_items)
+                record_order_items(order_items)
+                CartItem.objects.filter(cart=cart).delete()
+                Cart.touch(cart.id)
+        except IntegrityError:
+            # A concurrent request with the same key won the race
+            existing = self.get_existing_order(request, idempotency_key)
+            if existing is None:
+                raise
+            return Response(OrderSerializer(existing, context={'request': request}).data, status=status.HTTP_200_OK)
+
+        order.line_items = order_items
+        return Response(OrderSerializer(order, context={'request': request}).data, status=status.HTTP_201_CREATED)
+
+    def get_existing_order(self, request, idempotency_key):
+        return Order.objects.filter(user=request.user, idempotency_key=idempotency_key).prefetch_related('items').first()
+
+class OrderCursorPagination(CursorPagination):
+    # Keyset pagination over the (created_at, id) indexes, so deep pages cost the same as the first
+    ordering = ('-created_at', '-id')
+    page_size = 50
+    page_size_query_param = 'limit'
+    max_page_size = 200
+
+ORDER_HISTORY_DEFAULT_LIMIT = 20
+ORDER_HISTORY_MAX_LIMIT = 100
+
+class OrderHistoryView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        try:
+            limit = int(request.query_params.get('limit', ORDER_HISTORY_DEFAULT_LIMIT))
+            before = request.query_params.get('before')
+            before = int(before) if before is not None else None
+        except ValueError:
+            return Response({"error": "limit and before must be integers"}, status=status.HTTP_400_BAD_REQUEST)
+        limit = max(1, min(limit, ORDER_HISTORY_MAX_LIMIT))
+
+        # Keyset page of the user's orders (order_user_created_idx), inlined as a subquery so the
+        # whole page, lines included, is a single statement; lines render from their snapshots.
+        orders = Order.objects.filter(user=request.user)
+        if before is not None:
+            anchor = Order.objects.filter(pk=before, user=request.user).values('created_at')
+            orders = orders.filter(
+                Q(created_at__lt=Subquery(anchor)) | Q(created_at=Subquery(anchor), id__lt=before)
+            )
+        page_ids = orders.order_by('-created_at', '-id').values('id')[:limit + 1]
+        items = OrderItem.objects.filter(order__in=page_ids).select_related('order').order_by(
+            '-order__created_at', '-order_id', 'id'
+        )
+
+        page = {}
+        for item in items:
+            order = page.get(item.order_id)
+            if order is None:
+                order = page[item.order_id] = item.order
+                order.line_items = []
+            order.line_items.append(item)
+        page = list(page.values())
+
+        next_url = None
+        if len(page) > limit:
+            page = page[:limit]
+            next_url = replace_query_param(request.build_absolute_uri(), 'before', page[-1].id)
+        return Response({
+            "next": next_url,
+            "results": OrderSerializer(page, many=True, context={'request': request}).data,
+        })
+
+def _parse_datetime_param(value):
+    if value is None:
+        return None
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(value)
+        parsed = datetime.combine(day, time.min)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+def _parse_date_param(value):
+    if value is None:
+        return None
+    day = parse_date(value)
+    if day is None:
+        raise ValueError(value)
+    return day
+
+class AdminOrderListView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        orders = Order.objects.prefetch_related('items')
+        order_status = request.query_params.get('status')
+        if order_status:
+            orders = orders.filter(status=order_status)
+        try:
+            created_after = _parse_datetime_param(request.query_params.get('created_after'))
+            created_before = _parse_datetime_param(request.query_params.get('created_before'))
+        except ValueError:
+            return Response({"error": "Invalid date filter"}, status=status.HTTP_400_BAD_REQUEST)
+        if created_after:
+            orders = orders.filter(created_at__gte=created_after)
+        if created_before:
+            orders = orders.filter(created_at__lt=created_before)
+
+        paginator = OrderCursorPagination()
+        page = paginator.paginate_queryset(orders, request, view=self)
+        serializer = OrderSerializer(page, many=True, context={'request': request})
+        return paginator.get_paginated_response(serializer.data)
+
+class AdminOrderDetailView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, order_id):
+        try:
+            order = Order.objects.prefetch_related('items').get(id=order_id)
+            return Response(OrderSerializer(order, context={'request': request}).data)
+        except Order.DoesNotExist:
+            return Response({"error": "Order not found"}, status=status.HTTP_404_NOT_FOUND)
+
+    def put(self, request, order_id):
+        with transaction.atomic():
+            try:
+                order = Order.objects.select_for_update().get(id=order_id)
+            except Order.DoesNotExist:
+                return Response({"error": "Order not found"}, status=status.HTTP_404_NOT_FOUND)
+            previous_status = order.status
+            serializer = OrderSerializer(order, data=request.data, partial=True, context={'request': request})
+            if not serializer.is_valid():
+                return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+            new_status = serializer.validated_data.get('status', previous_status)
+            if new_status != previous_status and not order.can_transition_to(new_status):
+                return Response({"error": f"Cannot move order from {previous_status} to {new_status}"},
+                                status=status.HTTP_400_BAD_REQUEST)
+            order = serializer.save()
+            # Cancelled orders are excluded from the sales rollups
+            if new_status == 'cancelled' and previous_status != 'cancelled':
+                DailySalesRollup.apply_items(order.items.all(), sign=-1)
+        return Response(serializer.data)
+
+ORDER_TRANSITION_MAX_IDS = 1000
+
+class BulkOrderTransitionView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def post(self, request):
+        new_status = request.data.get('status')
+        order_ids = request.data.get('ids', [])
+        if new_status not in dict(Order._meta.get_field('status').choices):
+            return Response({"error": f"Invalid status: {new_status}"}, status=status.HTTP_400_BAD_REQUEST)
+        if not isinstance(order_ids, list):
+            return Response({"error": "ids must be provided as a list"}, status=status.HTTP_400_BAD_REQUEST)
+        if len(order_ids) > ORDER_TRANSITION_MAX_IDS:
+            return Response({"error": f"At most {ORDER_TRANSITION_MAX_IDS} orders can be moved at once"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        try:
+            order_ids = list(dict.fromkeys(int(order_id) for order_id in order_ids))
+        except (TypeError, ValueError):
+            return Response({"error": "ids must be a list of order ids"}, status=status.HTTP_400_BAD_REQUEST)
+
+        allowed_from = [current for current, targets in Order.STATUS_TRANSITIONS.items() if new_status in targets]
+        with transaction.atomic():
+            current = dict(Order.objects.select_for_update().filter(id__in=order_ids).values_list('id', 'status'))
+            succeeded = [order_id for order_id in order_ids if current.get(order_id) in allowed_from]
+            rejected = []
+            for order_id in order_ids:
+                if order_id not in current:
+                    rejected.append({"id": order_id, "error": "Order not found"})
+                elif current[order_id] not in allowed_from:
+                    rejected.append({"id": order_id, "error": f"Cannot move order from {current[order_id]} to {new_status}"})
+            if succeeded:
+                Order.objects.filter(id__in=succeeded).update(status=new_status)
+                if new_status == 'cancelled':
+                    DailySalesRollup.apply_items(
+                        OrderItem.objects.filter(order_id__in=succeeded).select_related('order'), sign=-1
+                    )
+        return Response({"status": new_status, "succeeded": succeeded, "rejected": rejected}, status=status.HTTP_200_OK)
+
+class RollupCursorPagination(CursorPagination):
+    ordering = ('day', 'id')
+    page_size = 200
+    page_size_query_param = 'limit'
+    max_page_size = 1000
+
+class SalesRollupListView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        rollups = DailySalesRollup.objects.select_related('frame')
+        try:
+            start = _parse_date_param(request.query_params.get('start'))
+            end = _parse_date_param(request.query_params.get('end'))
+        except ValueError:
+            return Response({"error": "Invalid date filter"}, status=status.HTTP_400_BAD_REQUEST)
+        if start:
+            rollups = rollups.filter(day__gte=start)
+        if end:
+            rollups = rollups.filter(day__lte=end)
+        frame_id = request.query_params.get('frame')
+        if frame_id:
+            try:
+                rollups = rollups.filter(frame_id=int(frame_id))
+            except ValueError:
+                return Response({"error": "frame must be an integer"}, status=status.HTTP_400_BAD_REQUEST)
+        paginator = RollupCursorPagination()
+        page = paginator.paginate_queryset(rollups, request, view=self)
+        serializer = DailySalesRollupSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+class ProductionCutListView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        try:
+            stock_length = float(request.query_params.get('stock_length', settings.MOULDING_STOCK_LENGTH))
+            kerf = float(request.query_params.get('kerf', settings.MOULDING_SAW_KERF))
+        except ValueError:
+            return Response({"error": "stock_length and kerf must be numbers"}, status=status.HTTP_400_BAD_REQUEST)
+        if not (math.isfinite(stock_length) and math.isfinite(kerf)) or stock_length <= 0 or kerf < 0:
+            return Response({"error": "stock_length must be positive and kerf non-negative"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        exact = request.query_params.get('mode') == 'exact'
+
+        # Dimensions come from the checkout snapshots, so later catalog edits don't change what gets cut
+        items = OrderItem.objects.filter(order__status='confirmed').only('id', 'quantity', 'snapshot').order_by('id')
+        groups = {}
+        for item in items:
+            frame = item.snapshot.get('frame')
+            if frame is None:
+                # Lines whose frame was deleted before snapshots existed have nothing left to cut from
+                continue
+            finish = item.snapshot.get('finish_variant')
+            key = (frame['id'], finish['id'] if finish else 0)
+            if key not in groups:
+                groups[key] = {
+                    'frame': frame['id'],
+                    'frame_name': frame['name'],
+                    'finish_variant': finish['id'] if finish else None,
+                    'finish_name': finish['name'] if finish else None,
+                    'pieces': [],
+                }
+            dimensions = item.snapshot.get('size_variant') or frame
+            for _ in range(item.quantity):
+                for length in frame_pieces(dimensions['inner_width'], dimensions['inner_height'], frame['moulding_width']):
+                    groups[key]['pieces'].append((length, item.id))
+
+        plans = []
+        for key, group in sorted(groups.items()):
+            pieces = group.pop('pieces')
+            plans.append({**group, **plan_group(pieces, stock_length, kerf, exact=exact)})
+        stock_used = sum(plan['stock_length_used'] for plan in plans)
+        waste = sum(plan['stock_length_used'] * plan['waste_percent'] / 100 for plan in plans)
+        return Response({
+            "stock_length": stock_length,
+            "kerf": kerf,
+            "mode": 'exact' if exact else 'heuristic',
+            "bars_used": sum(plan['bars_used'] for plan in plans),
+            "waste_percent": round(waste / stock_used * 100, 2) if stock_used else 0.0,
+            "groups": plans,
+        })
+
+AUTOCOMPLETE_DEFAULT_LIMIT = 10
+AUTOCOMPLETE_MAX_LIMIT = 25
+
+class AutocompleteView(APIView):
+    permission_classes = [AllowAny]
+
+    def get(self, request):
+        query = request.query_params.get('q', '')
+        try:
+            limit = int(request.query_params.get('limit', AUTOCOMPLETE_DEFAULT_LIMIT))
+        except ValueError:
+            return Response({"error": "limit must be an integer"}, status=status.HTTP_400_BAD_REQUEST)
+        limit = max(1, min(limit, AUTOCOMPLETE_MAX_LIMIT))
+        return Response({"query": query, "results": typeahead_index.search(query, limit)})
+
+QUOTE_MAX_ITEMS = 5000
+
+class QuoteView(APIView):
+    permission_classes = [AllowAny]
+    parser_classes = [FastJSONParser]
+
+    def post(self, request):
+        items = request.data.get('items') if isinstance(request.data, dict) else None
+        if not isinstance(items, list) or not items:
+            return Response({"error": "items must be a non-empty list"}, status=status.HTTP_400_BAD_REQUEST)
+        if len(items) > QUOTE_MAX_ITEMS:
+            return Response({"error": f"A quote may contain at most {QUOTE_MAX_ITEMS} items"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        columns, errors = parse_quote_rows(items)
+        if errors:
+            return Response({"errors": errors}, status=status.HTTP_400_BAD_REQUEST)
+        cents, widths, heights, invalid = price_matrix.get().quote(columns)
+        if invalid:
+            return Response({"errors": {index: "Unknown frame, or a variant that does not belong to it"
+                                        for index in invalid}}, status=status.HTTP_400_BAD_REQUEST)
+        quotes = [
+            {'width': width, 'height': height, 'quantity': quantity,
+             'unit_price': format_cents(unit), 'total_price': format_cents(unit * quantity)}
+            for unit, width, height, quantity in zip(cents, widths, heights, columns['quantity'])
+        ]
+        total = sum(unit * quantity for unit, quantity in zip(cents, columns['quantity']))
+        return Response({"items": quotes, "total": format_cents(total)})
+
+BATCH_MAX_REQUESTS = 20
+# URL names a batch may call; all are read-only GETs
+BATCH_ROUTES = {'user-detail', 'frame-list-create', 'frame-detail', 'cart_detail', 'cart_summary'}
+BATCH_FORWARDED_HEADERS = {'If-None-Match': 'HTTP_IF_NONE_MATCH', 'If-Modified-Since': 'HTTP_IF_MODIFIED_SINCE'}
+BATCH_RESPONSE_HEADERS = ('ETag', 'Last-Modified')
+
+class BatchView(APIView):
+    # Sub-requests enforce their own permissions against the batch's user
+    permission_classes = [AllowAny]
+
+    def post(self, request):
+        entries = request.data.get('requests') if isinstance(request.data, dict) else None
+        if not isinstance(entries, list) or not entries:
+            return Response({"error": "requests must be a non-empty list"}, status=status.HTTP_400_BAD_REQUEST)
+        if len(entries) > BATCH_MAX_REQUESTS:
+            return Response({"error": f"At most {BATCH_MAX_REQUESTS} requests can be batched"},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        results = []
+        seen = {}
+        with batch_scope():
+            for entry in entries:
+                if isinstance(entry, str):
+                    entry = {'path': entry}
+                if not isinstance(entry, dict) or not isinstance(entry.get('path'), str):
+                    results.append({"path": None, "status": status.HTTP_400_BAD_REQUEST,
+                                    "body": {"error": "Each request needs a path"}})
+                    continue
+                headers = entry.get('headers') or {}
+                if not isinstance(headers, dict) or not all(isinstance(v, str) for v in headers.values()):
+                    results.append({"path": entry['path'], "status": status.HTTP_400_BAD_REQUEST,
+                                    "body": {"error": "headers must be an object of strings"}})
+                    continue
+                key = (entry['path'], tuple(sorted((k, v) for k, v in headers.items() if k in BATCH_FORWARDED_HEADERS)))
+                if key not in seen:
+                    seen[key] = self.dispatch_subrequest(request, entry['path'], headers)
+                results.append({"path": entry['path'], **seen[key]})
+        return Response({"responses": results})
+
+    def dispatch_subrequest(self, request, full_path, headers):
+        path, _, query = full_path.partition('?')
+        try:
+            match = resolve(path)
+        except Resolver404:
+            match = None
+        if match is None or match.url_name not in BATCH_ROUTES:
+            return {"status": status.HTTP_404_NOT_FOUND, "body": {"error": "Route not available in batch"}}
+
+        # A copy of the outer request keeps scheme, host and session; authentication is not repeated
+        sub = copy.copy(request._request)
+        sub.method = 'GET'
+        sub.path = sub.path_info = path
+        sub.META = {k: v for k, v in request._request.META.items() if k not in BATCH_FORWARDED_HEADERS.values()}
+        sub.META.update({'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': query})
+        sub.__dict__.pop('headers', None)
+        for name, meta_key in BATCH_FORWARDED_HEADERS.items():
+            if isinstance(headers.get(name), str):
+                sub.META[meta_key] = headers[name]
+        sub.GET = QueryDict(query)
+        sub.resolver_match = match
+        sub._force_auth_user = request.user
+        sub._force_auth_token = request.auth
 
+        response = match.func(sub, *match.args, **match.kwargs)
+        return {
+            "status": response.status_code,
+            "headers": {name: response[name] for name in BATCH_RESPONSE_HEADERS if response.has_header(name)},
+            "body": getattr(response, 'data', None),
+        }
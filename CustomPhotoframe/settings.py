@@ -9,6 +9,7 @@ https://docs.djangoproject.com/en/5.2/topics/settings/
 For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
+import os
 from datetime import timedelta
 from pathlib import Path
 
@@ -45,11 +46,16 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'CustomFrame_app.metrics.RequestMetricsMiddleware',
+    'CustomFrame_app.concurrency.ConcurrencyLimitMiddleware',
+    'CustomFrame_app.compression.CompressionMiddleware',
+    'CustomFrame_app.routers.ReplicaPinningMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'CustomFrame_app.profiling.RequestProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -91,6 +97,34 @@ DATABASES = {
     }
 }
 
+# Read replicas: aliases in DATABASES that serve reads, e.g. ['replica']. After a
+# write, the client's reads stay on the primary for REPLICA_PIN_SECONDS.
+DATABASE_REPLICAS = []
+DATABASE_ROUTERS = ['CustomFrame_app.routers.PrimaryReplicaRouter']
+REPLICA_PIN_SECONDS = 5
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Token versions and replica pins must be seen by every worker, or a revoked token
+# keeps working on workers that cached the old version. Deployments with more than
+# one worker set REDIS_URL (e.g. redis://localhost:6379/1; needs the redis package);
+# without it each process keeps its own in-memory cache.
+
+REDIS_URL = os.environ.get('REDIS_URL')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+            'KEY_PREFIX': 'customframe',
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
 
 
 # Password validation
@@ -111,16 +145,46 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# BasicAuthentication hashes the password on every request, so views that need it
+# opt in through their own authentication_classes.
 REST_FRAMEWORK = {
 'DEFAULT_AUTHENTICATION_CLASSES': [
-    'rest_framework.authentication.BasicAuthentication',
-    'rest_framework_simplejwt.authentication.JWTAuthentication',
+    'CustomFrame_app.authentication.ClaimsJWTAuthentication',
 ],
 'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+'DEFAULT_RENDERER_CLASSES': [
+    'CustomFrame_app.renderers.FastJSONRenderer',
+    'rest_framework.renderers.BrowsableAPIRenderer',
+],
+'DEFAULT_PARSER_CLASSES': [
+    'CustomFrame_app.renderers.FastJSONParser',
+    'rest_framework.parsers.FormParser',
+    'rest_framework.parsers.MultiPartParser',
+],
+# Throttles key on REMOTE_ADDR; raise to the number of trusted proxies that append to X-Forwarded-For
+'NUM_PROXIES': 0,
 }
 
+# JSON responses at least this large are gzip/brotli compressed when the client accepts it
+RESPONSE_COMPRESSION_MIN_BYTES = 1024
+
+# Per-process caps on concurrent heavy requests, by pool of URL names (see CustomFrame_app/concurrency.py).
+# Past `limit`, requests wait up to `timeout` seconds in a queue of `queue`; the rest get 503 + Retry-After.
+REQUEST_CONCURRENCY_LIMITS = {
+    'uploads': {
+        'routes': ('upload_image', 'upload-cropped-image', 'async-upload-image'),
+        'limit': 4, 'queue': 8, 'timeout': 2.0,
+    },
+    'add_to_cart': {
+        'routes': ('add_to_cart', 'async-add-to-cart'),
+        'limit': 4, 'queue': 8, 'timeout': 2.0,
+    },
+}
+# Seconds, unless a pool sets its own `retry_after`
+REQUEST_CONCURRENCY_RETRY_AFTER = 2
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/5.2/topics/i18n/
@@ -152,6 +216,16 @@ CORS_ORIGIN_WHITELIST = (
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
+    'TOKEN_OBTAIN_SERIALIZER': 'CustomFrame_app.serializer.ClaimsTokenObtainPairSerializer',
+}
+# How long a Login.token_version stays in the shared cache; saves that bump it overwrite the entry
+TOKEN_VERSION_CACHE_TIMEOUT = 300
+
+# Login attempt token buckets: (burst capacity, tokens refilled per minute). Buckets that
+# have refilled are deleted by `manage.py prune_login_throttles`; run it from cron.
+LOGIN_THROTTLE_RATES = {
+    'ip': (20, 10),
+    'username': (5, 2),
 }
 
 CORS_ALLOW_CREDENTIALS = True
@@ -166,5 +240,21 @@ CSRF_TRUSTED_ORIGINS = [
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Written by `manage.py publish_catalog`; point nginx or the CDN origin at this directory
+CATALOG_PUBLISH_ROOT = BASE_DIR / 'catalog_bundle'
+
+# Reports from staff-requested request profiling (X-Profile: 1); keep this out of MEDIA_ROOT, it holds SQL params
+PROFILE_ROOT = BASE_DIR / 'profiles'
+
+# Production cut lists (same unit as Frame.inner_width)
+MOULDING_STOCK_LENGTH = 300.0
+MOULDING_SAW_KERF = 0.3
+
+# Keep the /autocomplete/ index warm from a per-process thread (see CustomFrame_app/typeahead.py)
+TYPEAHEAD_BACKGROUND_REFRESH = True
+
+# Glass and backing for /quotes/, per square unit of opening; frame list prices are taken to include it
+QUOTE_GLAZING_PRICE_PER_AREA = 0.0015
+
 
 
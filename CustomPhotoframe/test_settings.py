@@ -0,0 +1,33 @@
+"""Settings for running the test suite against two local SQLite databases.
+
+``replica`` is a separate database rather than a mirror, so tests can tell
+which alias served a read:
+
+    python manage.py test --settings=CustomPhotoframe.test_settings
+"""
+from CustomPhotoframe.settings import *  # noqa: F401,F403
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'test_primary.sqlite3',
+    },
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'test_replica.sqlite3',
+    },
+}
+# Off by default so request tests only touch 'default'; ReplicaRoutingTests turn it on
+DATABASE_REPLICAS = []
+
+# Users are created in most tests; the default hasher is deliberately slow
+PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+# Tests refresh the autocomplete index explicitly rather than racing a background thread
+TYPEAHEAD_BACKGROUND_REFRESH = False